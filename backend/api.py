@@ -1,19 +1,68 @@
-from typing import Optional
-from fastapi import FastAPI
-from pydantic import BaseModel
+import os
+from contextlib import asynccontextmanager
+from typing import Literal, Optional, Union
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, model_validator
 from asteroid.asteroid_orbit import (
     propagate,
     propagate_impulse,
+    propagate_chunks,
     get_orbit_earth_asteroid,
+    close_approach,
+    deflection_model,
+    preview_deflection,
+    optimize_deflection,
+    level_of_detail,
+    get_elements,
+    elements_states,
+    propagate_batch,
+)
+from asteroid.asteroid_earth import earth_ephemeris
+from asteroid.asteroid_load import AsteroidNotFound, catalog, prepare_db
+from asteroid.asteroid_search import RANGES, SORTS, search as search_catalog
+from asteroid.asteroid_lod import LOD_TOLERANCES
+from asteroid.asteroid_trajectory import baseline_cache, orbit_cache
+from asteroid.asteroid_screen import (
+    ORDERS,
+    ScreeningJob,
+    hazards as screened_hazards,
+    init_db as init_screening,
+)
+from impact.impact import EFFECT_FIELDS, MMI_SCALE, distance_axis, r_effects_rows
+from impact.impact_rings import RING_EFFECTS, rings as impact_rings
+from impact.impact_batch import parameter_grid, scenario_batch
+from impact.impact_uncertainty import SEED_BITS, monte_carlo
+from impact.impact_cache import CACHE_DB_PATH, ImpactCache, normalize
+from scheduler import LANES, Saturated, Scheduler, parse_lanes
+from encoding import (
+    LAYOUT_HEADER,
+    encode_columns,
+    encode_preamble,
+    layout_header,
+    negotiate,
+    negotiate_stream,
+    quantization,
+    stream_records,
 )
-from impact.impact import main as impact_main
 import numpy as np
 from astropy import units as u
 from astropy.time import Time
-from poliastro.twobody import Orbit
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI(title="Deja", description="Deja API", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app):
+    # catalog indexes for /asteroids and the screening table for /hazards,
+    # before read-only connections open
+    prepare_db(schemas=(init_screening,))
+    # keep Earth's ephemeris table ahead of the clock
+    if os.getenv("DEJA_EARTH_PREFETCH", "1") == "1":
+        earth_ephemeris.start()
+    yield
+
+
+app = FastAPI(title="Deja", description="Deja API", version="1.0.0", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,6 +70,84 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[LAYOUT_HEADER],
+)
+
+
+scheduler = Scheduler(
+    workers=int(os.getenv("DEJA_WORKERS", 8)),
+    lanes={**LANES, **parse_lanes(os.getenv("DEJA_LANES", ""))},
+)
+
+
+@app.exception_handler(Saturated)
+async def saturated_handler(request, e):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(e)},
+        headers={"Retry-After": str(e.retry_after)},
+    )
+
+
+def request_key(data, accept=None):
+    # single-flight key of a request, None for streamed responses
+    if negotiate_stream(accept) is not None:
+        return None
+    return data.model_dump_json(), accept
+
+
+def impact_key(data, accept=None):
+    # single-flight key of an impact request, inputs normalized as in the cache
+    inputs = tuple(normalize(x) for x in (data.L0, data.Ui, data.v0, data.T, data.Uj))
+    rest = data.model_dump_json(exclude={"L0", "Ui", "v0", "T", "Uj"})
+    return inputs, rest, accept
+
+
+@app.exception_handler(AsteroidNotFound)
+async def not_found_handler(request, e):
+    return JSONResponse(status_code=404, content={"detail": str(e)})
+
+
+impact_cache = ImpactCache(
+    maxsize=int(os.getenv("DEJA_IMPACT_CACHE_SIZE", 256)),
+    max_bytes=int(os.getenv("DEJA_IMPACT_CACHE_MB", 256)) * 2**20,
+    ttl=float(os.getenv("DEJA_IMPACT_CACHE_TTL", 3600)),
+    db_path=CACHE_DB_PATH if os.getenv("DEJA_IMPACT_CACHE_DISK") == "1" else None,
+)
+
+screening_job = ScreeningJob(
+    workers=int(os.getenv("DEJA_SCREEN_WORKERS", os.cpu_count() or 1))
+)
+# screen new and changed asteroids after every catalog refresh that changed rows
+catalog.on_change = screening_job.rescreen
+
+MAX_DISTANCES = 200000  # most distances a single /impact request may ask for
+
+
+class RadialSampling(BaseModel):
+    min: float = Field(ge=0)  # first distance from ground zero in km
+    max: float = Field(ge=0)  # last distance from ground zero in km
+    n: int = Field(ge=1, le=MAX_DISTANCES)  # number of distances
+    spacing: Literal["linear", "log"] = "linear"
+
+    @model_validator(mode="after")
+    def check_range(self):
+        if self.max < self.min:
+            raise ValueError("max must not be smaller than min")
+        if self.spacing == "log" and self.min <= 0:
+            raise ValueError("log spacing needs min > 0")
+        return self
+
+
+SCALAR_FIELDS = (
+    "E0",
+    "E_ground",
+    "E_air",
+    "v_ground",
+    "crater_diamater",
+    "crater_depth",
+    "z_breakup",
+    "zb",
 )
 
 
@@ -30,24 +157,56 @@ class ImpactRequest(BaseModel):
     v0: float  # speed of asteroid in m/s
     T: float  # angle of impact in degrees
     Uj: float  # density of target in kg/m^3
+    layout: Literal["rows", "columns"] = "rows"  # see ImpactResponse
+    distances: Optional[list[float]] = Field(
+        None, max_length=MAX_DISTANCES
+    )  # distances from ground zero in km to evaluate r_effects at
+    sampling: Optional[RadialSampling] = None  # or a generated set of distances,
+    # if neither is given r_effects covers 0 to 19999 km in 1 km steps
+    # ImpactResponse values and r_effects effects to return, default all
+    fields: Optional[list[Literal[SCALAR_FIELDS + EFFECT_FIELDS]]] = None
+
+    @model_validator(mode="after")
+    def check_distances(self):
+        if self.distances is not None and self.sampling is not None:
+            raise ValueError("give either distances or sampling, not both")
+        if self.distances is not None and any(r < 0 for r in self.distances):
+            raise ValueError("distances must not be negative")
+        return self
+
+    def distance_axis(self):
+        if self.distances is not None:
+            return np.array(self.distances, dtype=np.float64)
+        if self.sampling is not None:
+            s = self.sampling
+            return distance_axis(s.min, s.max, s.n, s.spacing)
+        return None
+
+    def effect_fields(self):
+        if self.fields is None:
+            return None
+        return tuple(f for f in EFFECT_FIELDS if f in self.fields)
 
 
 class ImpactResponse(BaseModel):
-    E0: float  # initial energy of asteroid in J
-    E_ground: Optional[
-        float
-    ]  # energy of asteroid transferred to ground in J, can be None
-    E_air: Optional[float]  # energy of asteroid dissipated in the air in J, can be None
-    v_ground: Optional[float]  # final speed of asteroid on ground in m/s, can be None
-    crater_diamater: Optional[float]  # diameter of crater created in m, can be None
-    crater_depth: Optional[float]  # depth of crater created in m, can be None
-    z_breakup: Optional[
-        float
-    ]  # height at which asteroid begins breaks up in m, can be None
-    zb: Optional[
-        float
-    ]  # height at which the asteroid completely breaks apart in m, can be None
-    r_effects: dict  # dictionary of effects at different distances from ground zero
+    # with ImpactRequest.fields only the requested values are present
+    E0: Optional[float] = None  # initial energy of asteroid in J
+    # energy of asteroid transferred to ground in J, can be None
+    E_ground: Optional[float] = None
+    # energy of asteroid dissipated in the air in J, can be None
+    E_air: Optional[float] = None
+    # final speed of asteroid on ground in m/s, can be None
+    v_ground: Optional[float] = None
+    # diameter of crater created in m, can be None
+    crater_diamater: Optional[float] = None
+    # depth of crater created in m, can be None
+    crater_depth: Optional[float] = None
+    # height at which asteroid begins breaks up in m, can be None
+    z_breakup: Optional[float] = None
+    # height at which the asteroid completely breaks apart in m, can be None
+    zb: Optional[float] = None
+    # dictionary of effects at different distances from ground zero
+    r_effects: Optional[dict] = None
 
     """
     r_effects includes:
@@ -59,10 +218,232 @@ class ImpactResponse(BaseModel):
     mean_ejecta_size: float, Mean ejecta size in m, can be None
     surface_blast: float, Peak blast overpressure in Pa
     peak_vel: float, Peak wind velocity in m/s
+
+    With layout "columns", r_effects is instead one list per effect:
+    distance (km) plus the effects above, where effective_mmi is an index
+    into mmi_scale (sent along with that column only). Effects that do
+    not apply are None. Rows for the default 20000 distances cost tens of
+    ms to build; clients that can should ask for columns or for the
+    distances they need.
+
+    Sending "Accept: application/octet-stream" or "application/x-npy"
+    returns the columns as binary instead, see encoding.py.
+    """
+
+
+class RingThreshold(BaseModel):
+    effect: Literal[tuple(RING_EFFECTS)]  # effect the ring is drawn for
+    threshold: float  # Pa, J/m^2, magnitude or m/s depending on the effect
+    label: Optional[str] = None
+
+    @model_validator(mode="after")
+    def check_threshold(self):
+        if self.effect != "effective_magnitude" and self.threshold <= 0:
+            raise ValueError(f"{self.effect} threshold must be positive")
+        return self
+
+
+class RingsRequest(BaseModel):
+    L0: float  # initial size of asteroid in m
+    Ui: float  # density of asteroid in kg/m^3
+    v0: float  # speed of asteroid in m/s
+    T: float  # angle of impact in degrees
+    Uj: float  # density of target in kg/m^3
+    thresholds: Optional[list[RingThreshold]] = None  # rings to solve for,
+    # defaults to 1/5/20 psi, 2nd/3rd degree burns and MMI VII-VIII
+    r_max: float = Field(20000.0, ge=1)  # largest radius searched in km
+
+
+class Ring(BaseModel):
+    effect: str
+    threshold: float
+    label: Optional[str]
+    radius: Optional[float]  # outermost distance in km where the effect reaches
+    # the threshold, r_max if it reaches further, None if it is never reached
+
+
+class RingsResponse(BaseModel):
+    E0: float  # initial energy of asteroid in J
+    E_ground: Optional[float]  # energy of asteroid transferred to ground in J
+    E_air: Optional[float]  # energy of asteroid dissipated in the air in J
+    crater_diamater: Optional[float]  # diameter of crater created in m
+    z_breakup: Optional[float]  # height at which asteroid begins breaks up in m
+    zb: Optional[float]  # height at which the asteroid completely breaks apart in m
+    rings: list[Ring]
+
+
+MAX_BATCH = 100000  # most scenarios a single /impact/batch request may ask for
+
+
+class ImpactGrid(BaseModel):
+    L0: list[float] = Field(min_length=1)  # initial sizes of asteroid in m
+    Ui: list[float] = Field(min_length=1)  # densities of asteroid in kg/m^3
+    v0: list[float] = Field(min_length=1)  # speeds of asteroid in m/s
+    T: list[float] = Field(min_length=1)  # angles of impact in degrees
+    Uj: list[float] = Field(min_length=1)  # densities of target in kg/m^3
+
+    def size(self):
+        return len(self.L0) * len(self.Ui) * len(self.v0) * len(self.T) * len(self.Uj)
+
+
+class BatchImpactRequest(BaseModel):
+    rows: Optional[list[ImpactRequest]] = Field(
+        None, max_length=MAX_BATCH
+    )  # scenarios to evaluate, only L0, Ui, v0, T and Uj are used
+    grid: Optional[ImpactGrid] = None  # or every combination of these values,
+    # L0 varying slowest and Uj fastest
+
+    @model_validator(mode="after")
+    def check_input(self):
+        if (self.rows is None) == (self.grid is None):
+            raise ValueError("give exactly one of rows or grid")
+        if self.grid is not None and self.grid.size() > MAX_BATCH:
+            raise ValueError(f"grid has more than {MAX_BATCH} combinations")
+        return self
+
+
+class BatchImpactResponse(BaseModel):
+    n: int  # number of scenarios
+    results: dict  # one list per value, element k belongs to scenario k
+
+    """
+    results includes the inputs L0, Ui, v0, T, Uj and the ImpactResponse
+    values E0, E_ground, E_air, v_ground, crater_diamater, crater_depth,
+    z_breakup and zb, plus fball_radius (m) and M (seismic magnitude).
+    Values that do not apply (no crater for an airburst, ...) are None.
+
+    Sending "Accept: application/octet-stream" or "application/x-npy"
+    returns the same columns as binary instead, see encoding.py.
     """
 
 
-class OrbitRequest(BaseModel):
+MAX_SAMPLES = 1000000  # most samples a single /impact/uncertainty request may draw
+MC_WORKERS = int(os.getenv("DEJA_MC_WORKERS", os.cpu_count() or 1))
+
+
+class Prior(BaseModel):
+    dist: Literal["fixed", "uniform", "normal", "lognormal"]
+    value: Optional[float] = None  # fixed
+    low: Optional[float] = None  # uniform, optional bound for normal/lognormal
+    high: Optional[float] = None  # uniform, optional bound for normal/lognormal
+    mean: Optional[float] = None  # normal
+    std: Optional[float] = Field(None, ge=0)  # normal
+    median: Optional[float] = Field(None, gt=0)  # lognormal
+    sigma: Optional[float] = Field(None, ge=0)  # lognormal, std of ln(x)
+
+    @model_validator(mode="after")
+    def check_params(self):
+        required = {
+            "fixed": ("value",),
+            "uniform": ("low", "high"),
+            "normal": ("mean", "std"),
+            "lognormal": ("median", "sigma"),
+        }[self.dist]
+        missing = [name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"{self.dist} prior needs {', '.join(missing)}")
+        if self.low is not None and self.high is not None and self.high < self.low:
+            raise ValueError("high must not be smaller than low")
+        return self
+
+
+class UncertaintyRequest(BaseModel):
+    L0: Union[float, Prior]  # initial size of asteroid in m
+    Ui: Union[float, Prior]  # density of asteroid in kg/m^3
+    v0: Union[float, Prior]  # speed of asteroid in m/s
+    T: Union[float, Prior]  # angle of impact in degrees
+    Uj: Union[float, Prior]  # density of target in kg/m^3
+    n: int = Field(100000, ge=1, le=MAX_SAMPLES)  # number of samples
+    seed: Optional[int] = Field(None, ge=0, lt=2**SEED_BITS)  # same seed, same samples
+    percentiles: list[float] = Field([5, 50, 95], min_length=1)
+    thresholds: Optional[list[RingThreshold]] = None  # rings to report radii for,
+    # defaults to those of /impact/rings
+
+    @model_validator(mode="after")
+    def check_percentiles(self):
+        if any(not 0 <= q <= 100 for q in self.percentiles):
+            raise ValueError("percentiles must be between 0 and 100")
+        return self
+
+    def priors(self):
+        return {
+            name: (
+                {"dist": "fixed", "value": p}
+                if isinstance(p, float)
+                else p.model_dump(exclude_none=True)
+            )
+            for name, p in (
+                ("L0", self.L0),
+                ("Ui", self.Ui),
+                ("v0", self.v0),
+                ("T", self.T),
+                ("Uj", self.Uj),
+            )
+        }
+
+
+class UncertaintyResponse(BaseModel):
+    n: int  # number of samples
+    seed: int  # seed the samples were drawn with
+    airburst_fraction: float  # share of samples that burst in the air
+    bands: dict  # percentile band per value
+
+    """
+    bands maps E0, E, E_ground, E_air, crater_diamater, crater_depth,
+    z_breakup, zb and "radius:<ring label>" (km) to
+
+    fraction: float, share of samples the value applies to
+                     (e.g. no crater for airbursts, ring never reached)
+    mean: float, mean over those samples
+    p<q>: float, q-th percentile over those samples, for every requested q
+    """
+
+
+MAX_STEPS = 1000000  # most steps a streamed trajectory may take
+MAX_LIST_STEPS = 20000  # most steps a trajectory may take in a single body
+
+
+class TrajectoryGrid(BaseModel):
+    days: float = Field(365, gt=0, le=36500)  # length of the window in days
+    steps: int = Field(730, ge=2, le=MAX_STEPS)  # number of positions
+    start: Optional[str] = None  # ISO time the window starts at, default now
+
+    @model_validator(mode="after")
+    def check_start(self):
+        if self.start is not None:
+            try:
+                Time(self.start)
+            except ValueError:
+                raise ValueError("start must be an ISO time")
+        return self
+
+    def offset(self, epoch):
+        # seconds from epoch to the start of the window
+        if self.start is None:
+            return 0.0
+        return float((Time(self.start) - epoch).to_value(u.s))
+
+    def default_window(self):
+        return self.days == 365 and self.start is None
+
+
+class TrajectoryWindow(TrajectoryGrid):
+    # decimation, see OrbitResponse
+    tolerance: Optional[float] = Field(None, ge=0)  # largest chord error in km
+    max_points: Optional[int] = Field(None, ge=2)  # most positions returned
+    lod: Optional[int] = Field(
+        None, ge=0, lt=len(LOD_TOLERANCES)
+    )  # precomputed level of detail, 0 (every step) to 3 (coarsest)
+
+    def decimated(self):
+        return (
+            self.tolerance is not None
+            or self.max_points is not None
+            or self.lod is not None
+        )
+
+
+class OrbitRequest(TrajectoryWindow):
     id: int  # SPKID of an small body of interest
 
 
@@ -71,12 +452,75 @@ class OrbitResponse(BaseModel):
     # each element is in the form of [x, y, z] in km
     asteroid_pos: list  # List of positions of the asteroid,
     # each element is in the form of [x, y, z] in km
+    t: Optional[list] = None  # days after the start of every position,
+    # only when decimated
+
+    """
+    With tolerance, max_points or lod only the positions that shape the
+    tracks are returned (see asteroid_lod.py): every dropped position is
+    within tolerance km (or the lod's, see LOD_TOLERANCES) of the line
+    between its kept neighbours, and there are at most max_points of
+    them. Earth and the asteroid keep the same steps, listed in t.
+
+    Sending "Accept: application/octet-stream" or "application/x-npy"
+    returns the positions as binary columns earth_x, earth_y, earth_z,
+    asteroid_x, asteroid_y and asteroid_z (plus t when decimated)
+    instead, see encoding.py; dtype=int32 quantizes them, e.g.
+    "Accept: application/octet-stream; dtype=int32; scale=10; delta=1".
+
+    Sending "Accept: application/x-ndjson" or "text/event-stream" streams
+    the trajectory instead, see encoding.py: a first object with start
+    (ISO time), days and steps, then blocks of consecutive positions as
+    {first, earth_pos, asteroid_pos}, where first is the index of the
+    first step of the block. Windows of more than MAX_LIST_STEPS steps
+    must be streamed.
+    """
+
+
+MAX_ORBIT_BATCH = 500  # most asteroids a single /orbit/batch request may ask for
+MAX_BATCH_POSITIONS = 500000  # most asteroid positions (ids x steps) of a batch
+
+
+class BatchOrbitRequest(TrajectoryGrid):
+    ids: list[int] = Field(
+        min_length=1, max_length=MAX_ORBIT_BATCH
+    )  # SPKIDs of the small bodies of interest
+
+    @model_validator(mode="after")
+    def check_size(self):
+        if len(self.ids) * self.steps > MAX_BATCH_POSITIONS:
+            raise ValueError(
+                f"ids times steps must not exceed {MAX_BATCH_POSITIONS} positions"
+            )
+        return self
+
+
+class BatchOrbitResponse(BaseModel):
+    ids: list[int]  # SPKIDs found, in the order of the request
+    names: list[str]  # their full names
+    missing: list[int]  # requested SPKIDs that are not in the database
+    earth_pos: list  # List of positions of the Earth,
+    # each element is in the form of [x, y, z] in km
+    asteroid_pos: list  # One list of positions per asteroid in ids,
+    # each element is in the form of [x, y, z] in km
+
+    """
+    All positions share the times of the window, given by days, steps and
+    start as for /orbit.
+
+    Sending "Accept: application/octet-stream" or "application/x-npy"
+    returns the positions as binary x, y and z columns instead, see
+    encoding.py: the first steps rows are the Earth, followed by steps rows
+    per asteroid in the order of ids. ids, names and missing are sent in
+    the JSON preamble of the body, the layout header adds steps.
+    dtype=int32 quantizes them as for /orbit.
+    """
 
 
-class ImpulseRequest(BaseModel):
+class ImpulseRequest(TrajectoryWindow):
     id: int  # SPKID of an small body of interest
     v_delta: list  # a velocity vector in a form of [x, y, z] km/s
-    t: float  # time of the impulse maneuver in days
+    t: float  # time of the impulse maneuver in days after the start
 
 
 class ImpulseResponse(BaseModel):
@@ -84,33 +528,582 @@ class ImpulseResponse(BaseModel):
     # each element is in the form of [x, y, z] in km
     asteroid_pos: list  # List of positions of the asteroid,
     # each element is in the form of [x, y, z] in km
+    t: Optional[list] = None  # days after the start of every position,
+    # only when decimated
+
+    """
+    Can be decimated, encoded and streamed like OrbitResponse.
+    """
+
+
+MAX_SCAN_STEPS = 1000000  # most time steps a /close-approach scan may take
+
+
+class CloseApproachRequest(BaseModel):
+    id: int  # SPKID of an small body of interest
+    days: float = Field(365, gt=0, le=36500)  # length of the window in days
+    step: float = Field(0.5, gt=0, le=30)  # scan step in days
+
+    @model_validator(mode="after")
+    def check_steps(self):
+        if self.days / self.step > MAX_SCAN_STEPS:
+            raise ValueError(f"days / step must not exceed {MAX_SCAN_STEPS}")
+        return self
+
+
+class CloseApproach(BaseModel):
+    t: float  # days after the start of the window
+    date: str  # ISO time of the approach
+    distance: float  # Earth-asteroid distance in km
+    v_rel: float  # relative speed in km/s
+
+
+MAX_CANDIDATES = 100000  # most delta-v candidates a single preview may ask for
+MAX_EXACT = 1000  # most candidates a single preview may propagate exactly
+
+
+class DeflectionPreviewRequest(BaseModel):
+    id: int  # SPKID of an small body of interest
+    t: float = Field(ge=0)  # time of the impulse maneuver in days
+    v_deltas: list[list[float]] = Field(
+        min_length=1, max_length=MAX_CANDIDATES
+    )  # candidate velocity vectors, each [x, y, z] in km/s
+    exact: bool = False  # propagate every candidate instead of the linear model
+
+    @model_validator(mode="after")
+    def check_candidates(self):
+        if any(len(v) != 3 for v in self.v_deltas):
+            raise ValueError("every v_delta must have 3 components")
+        if self.exact and len(self.v_deltas) > MAX_EXACT:
+            raise ValueError(f"exact previews take at most {MAX_EXACT} candidates")
+        return self
+
+
+class DeflectionPreviewResponse(BaseModel):
+    t_maneuver: float  # time of the impulse maneuver in days
+    nominal_t: float  # time of the closest approach without impulse in days
+    nominal_distance: float  # its Earth-asteroid distance in km
+    exact: bool  # whether the candidates were propagated
+    t: list[float]  # time of the closest approach of every candidate in days
+    distance: list[float]  # its Earth-asteroid distance in km
+
+    """
+    Closest approaches are searched after the maneuver, within the 365
+    days of /impulse. Without exact they are predicted by the linearized
+    two-body model, which is accurate for impulses that are small compared
+    with the orbital velocity; exact propagates each candidate.
 
+    Sending "Accept: application/octet-stream" or "application/x-npy"
+    returns t and distance as binary instead, see encoding.py.
+    """
+
+
+OPT_WORKERS = int(os.getenv("DEJA_OPT_WORKERS", os.cpu_count() or 1))
+
+
+class DeflectionOptimizeRequest(BaseModel):
+    id: int  # SPKID of an small body of interest
+    budget: float = Field(gt=0, le=10)  # largest total delta-v in km/s
+    levels: int = Field(5, ge=1, le=20)  # budget levels, budget * (1..levels) / levels
+    epochs: int = Field(24, ge=1, le=200)  # maneuver times searched
+    max_burns: int = Field(1, ge=1, le=4)  # most burns a budget may be split over
+    directions: int = Field(256, ge=16, le=4096)  # directions screened per time
+
+
+class Burn(BaseModel):
+    t: float  # time of the burn in days
+    v_delta: list[float]  # velocity vector [x, y, z] in km/s
+
+
+class DeflectionPlan(BaseModel):
+    burns: list[Burn]
+    dv: float  # total delta-v in km/s
+    lead_time: float  # days from the first burn to the nominal closest approach
+    t: float  # time of the closest approach in days
+    miss: float  # Earth-asteroid distance at the closest approach in km
+
+
+class DeflectionOptimizeResponse(BaseModel):
+    nominal_t: float  # time of the closest approach without a burn in days
+    nominal_distance: float  # its Earth-asteroid distance in km
+    plans: list[DeflectionPlan]  # Pareto set of (dv, lead_time, miss), by dv
+
+    """
+    No plan in plans is beaten by another on all three of smaller dv,
+    shorter lead time and larger miss distance. Times are within the
+    365 days of /impulse.
+    """
+
+
+class CloseApproachResponse(BaseModel):
+    moid: float  # minimum orbit intersection distance in km
+    moid_au: float  # the same in AU
+    approaches: list[CloseApproach]  # local minima of the distance, by time
+
+
+class ScreeningRequest(BaseModel):
+    force: bool = False  # screen every asteroid, not only new or changed ones
+
+
+class HazardsRequest(BaseModel):
+    order: Literal[tuple(ORDERS)] = "moid"  # smallest MOID or closest approach first
+    limit: int = Field(50, ge=1, le=1000)  # most asteroids returned
+    max_moid: Optional[float] = Field(None, ge=0)  # largest MOID in km
+    max_distance: Optional[float] = Field(None, ge=0)  # largest approach distance in km
+    pha: Optional[bool] = None  # only (not) potentially hazardous asteroids
+    upcoming: bool = True  # skip approaches that have passed
+
+
+class Hazard(BaseModel):
+    spkid: int
+    fullname: Optional[str]
+    pha: Optional[bool]
+    moid: Optional[float]  # minimum orbit intersection distance with Earth in km
+    synodic_period: Optional[float]  # days, None for unbound orbits
+    approach_date: str  # ISO time of the closest approach in the screened year
+    approach_distance: float  # its Earth-asteroid distance in km
+    approach_v_rel: float  # its relative speed in km/s
+    screened: str  # ISO time the asteroid was screened
+
+
+class HazardsResponse(BaseModel):
+    hazards: list[Hazard]
+
+    """
+    Only asteroids screened by /screening are listed, see asteroid_screen.py.
+    """
+
+
+class AsteroidSearchRequest(BaseModel):
+    name: Optional[str] = Field(None, min_length=1)  # part of the full name
+    match: Literal["substring", "prefix"] = "substring"  # how name must match
+    pha: Optional[bool] = None  # only (not) potentially hazardous asteroids
+    a_min: Optional[float] = None  # semi-major axis range in AU
+    a_max: Optional[float] = None
+    e_min: Optional[float] = Field(None, ge=0)  # eccentricity range
+    e_max: Optional[float] = Field(None, ge=0)
+    i_min: Optional[float] = None  # inclination range in degrees
+    i_max: Optional[float] = None
+    sort: Literal[tuple(SORTS)] = "spkid"
+    descending: bool = False
+    limit: int = Field(50, ge=1, le=500)  # most asteroids per page
+    cursor: Optional[str] = None  # next of the previous page
+
+    def ranges(self):
+        return {
+            column: (getattr(self, f"{column}_min"), getattr(self, f"{column}_max"))
+            for column in RANGES
+        }
+
+
+class AsteroidSummary(BaseModel):
+    spkid: int
+    fullname: Optional[str]
+    pha: Optional[bool]
+    a: Optional[float]
+    e: Optional[float]
+    i: Optional[float]
+    om: Optional[float]
+    w: Optional[float]
+    ma: Optional[float]
 
-@app.post("/orbit", response_model=OrbitResponse)
-async def orbit(data: OrbitRequest):
+
+class AsteroidSearchResponse(BaseModel):
+    asteroids: list[AsteroidSummary]
+    next: Optional[str]  # cursor of the next page, None on the last one
+
+    """
+    Pages are keyset paginated: pass next as the cursor of the same search
+    for the following page, see asteroid_search.py.
+    """
+
+
+def trajectory_stream(media_type, data, earth_orbit, orbit, start, **impulse):
+    if data.decimated():
+        raise HTTPException(
+            status_code=422, detail="streamed trajectories cannot be decimated"
+        )
+    blocks = propagate_chunks(
+        earth_orbit, orbit, data.steps, data.days, start, **impulse
+    )
+
+    def records():
+        yield {
+            "start": (earth_orbit.epoch + start * u.s).isot,
+            "days": data.days,
+            "steps": data.steps,
+        }
+        for first, earth_pos, asteroid_pos in blocks:
+            yield {
+                "first": first,
+                "earth_pos": earth_pos.tolist(),
+                "asteroid_pos": asteroid_pos.tolist(),
+            }
+
+    # the body is computed as it is sent, in the orbit lane like the rest
+    return StreamingResponse(
+        scheduler.stream("orbit", stream_records(records(), media_type)),
+        media_type=media_type,
+    )
+
+
+POSITION_COLUMNS = tuple(
+    f"{body}_{axis}" for body in ("earth", "asteroid") for axis in "xyz"
+)
+
+
+def trajectory_response(
+    response_model, accept, earth_pos, asteroid_pos, t=None, **scalars
+):
+    # JSON, or binary columns (see OrbitResponse) if the client asked for them
+    binary = negotiate(accept)
+    if binary is None:
+        fields = {"t": t.tolist()} if t is not None else {}
+        return response_model(
+            earth_pos=earth_pos.tolist(), asteroid_pos=asteroid_pos.tolist(), **fields
+        )
+
+    media_type, dtype = binary
+    columns = dict(zip(POSITION_COLUMNS, [*earth_pos.T, *asteroid_pos.T]))
+    columns["t"] = t
+    quantized = quantization(accept)
+    body, layout = encode_columns(
+        columns,
+        media_type,
+        dtype,
+        quantized=None if quantized is None else (quantized, POSITION_COLUMNS),
+    )
+    return Response(
+        content=body,
+        media_type=media_type,
+        headers={
+            LAYOUT_HEADER: layout_header(layout, steps=len(earth_pos), **scalars)
+        },
+    )
+
+
+def decimate(data, earth_orbit, orbit, earth_pos, asteroid_pos, spkid=None):
+    # kept positions and their times in days, see OrbitResponse
+    kept = level_of_detail(
+        earth_orbit,
+        orbit,
+        earth_pos,
+        asteroid_pos,
+        tolerance=data.tolerance,
+        max_points=data.max_points,
+        lod=data.lod,
+        spkid=spkid,
+    )
+    t = np.linspace(0, data.days, data.steps)[kept]
+    return earth_pos[kept], asteroid_pos[kept], t
+
+
+def check_list_steps(data):
+    if data.steps > MAX_LIST_STEPS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"more than {MAX_LIST_STEPS} steps must be streamed, "
+            'send "Accept: application/x-ndjson" or "text/event-stream"',
+        )
+
+
+@app.post("/orbit", response_model=OrbitResponse, response_model_exclude_unset=True)
+@scheduler.scheduled("orbit", key=request_key)
+def orbit(data: OrbitRequest, accept: Optional[str] = Header(None)):
     orbit, earth_orbit = get_orbit_earth_asteroid(data.id)
-    earth_pos, asteroid_pos = propagate(earth_orbit, orbit, 730)
-    earth_pos = earth_pos.tolist()
-    asteroid_pos = asteroid_pos.tolist()
+    start = data.offset(earth_orbit.epoch)
+    stream = negotiate_stream(accept)
+    if stream is not None:
+        return trajectory_stream(stream, data, earth_orbit, orbit, start)
+
+    check_list_steps(data)
+    earth_pos, asteroid_pos = propagate(
+        earth_orbit, orbit, data.steps, spkid=data.id, days=data.days, start=start
+    )
+    t = None
+    if data.decimated():
+        spkid = data.id if data.default_window() else None
+        earth_pos, asteroid_pos, t = decimate(
+            data, earth_orbit, orbit, earth_pos, asteroid_pos, spkid
+        )
+
+    return trajectory_response(OrbitResponse, accept, earth_pos, asteroid_pos, t)
 
-    return OrbitResponse(earth_pos=earth_pos, asteroid_pos=asteroid_pos)
 
+@app.post("/orbit/batch", response_model=BatchOrbitResponse)
+@scheduler.scheduled("orbit", key=request_key)
+def orbit_batch(data: BatchOrbitRequest, accept: Optional[str] = Header(None)):
+    elements = get_elements(data.ids)
+    ids = [id for id in dict.fromkeys(data.ids) if id in elements]
+    missing = [id for id in dict.fromkeys(data.ids) if id not in elements]
+    names = [elements[id][0] for id in ids]
 
-@app.post("/impulse", response_model=ImpulseResponse)
-async def impulse(data: ImpulseRequest):
+    columns = np.array([elements[id][1:] for id in ids], dtype=np.float64)
+    earth_orbit = earth_ephemeris.orbit()
+    r0, v0 = elements_states(*columns.reshape(-1, 6).T, epoch=earth_orbit.epoch)
+    earth_pos, asteroid_pos = propagate_batch(
+        earth_orbit, r0, v0, data.steps, data.days, data.offset(earth_orbit.epoch)
+    )
+
+    binary = negotiate(accept)
+    if binary is not None:
+        media_type, dtype = binary
+        positions = np.concatenate([earth_pos, asteroid_pos.reshape(-1, 3)])
+        quantized = quantization(accept)
+        preamble = encode_preamble({"ids": ids, "names": names, "missing": missing})
+        body, layout = encode_columns(
+            {"x": positions[:, 0], "y": positions[:, 1], "z": positions[:, 2]},
+            media_type,
+            dtype,
+            quantized=None if quantized is None else (quantized, ("x", "y", "z")),
+            offset=len(preamble),
+        )
+        header = layout_header(layout, preamble=len(preamble), steps=len(earth_pos))
+        return Response(
+            content=preamble + body,
+            media_type=media_type,
+            headers={LAYOUT_HEADER: header},
+        )
+
+    return BatchOrbitResponse(
+        ids=ids,
+        names=names,
+        missing=missing,
+        earth_pos=earth_pos.tolist(),
+        asteroid_pos=asteroid_pos.tolist(),
+    )
+
+
+@app.post(
+    "/impulse", response_model=ImpulseResponse, response_model_exclude_unset=True
+)
+@scheduler.scheduled("orbit", key=request_key)
+def impulse(data: ImpulseRequest, accept: Optional[str] = Header(None)):
     orbit, earth_orbit = get_orbit_earth_asteroid(data.id)
     v_delta = np.array(data.v_delta) * u.km / u.s
     t = data.t * u.day
-    earth_pos, asteroid_pos = propagate_impulse(earth_orbit, orbit, v_delta, t, 730)
-    earth_pos = earth_pos.tolist()
-    asteroid_pos = asteroid_pos.tolist()
+    start = data.offset(earth_orbit.epoch)
+    stream = negotiate_stream(accept)
+    if stream is not None:
+        return trajectory_stream(
+            stream,
+            data,
+            earth_orbit,
+            orbit,
+            start,
+            delta_v_vector=v_delta,
+            t_maneuver=t,
+        )
+
+    check_list_steps(data)
+    earth_pos, asteroid_pos = propagate_impulse(
+        earth_orbit,
+        orbit,
+        v_delta,
+        t,
+        data.steps,
+        spkid=data.id,
+        days=data.days,
+        start=start,
+    )
+    t = None
+    if data.decimated():
+        earth_pos, asteroid_pos, t = decimate(
+            data, earth_orbit, orbit, earth_pos, asteroid_pos
+        )
+
+    return trajectory_response(ImpulseResponse, accept, earth_pos, asteroid_pos, t)
+
+
+@app.post("/impulse/preview", response_model=DeflectionPreviewResponse)
+@scheduler.scheduled("deflection")
+def impulse_preview(
+    data: DeflectionPreviewRequest, accept: Optional[str] = Header(None)
+):
+    orbit, earth_orbit = get_orbit_earth_asteroid(data.id)
+    try:
+        model = deflection_model(earth_orbit, orbit, data.t * u.day, 730, data.id)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    nominal_t, nominal_distance = preview_deflection(model, np.zeros(3))
+    t, distance = preview_deflection(
+        model, np.array(data.v_deltas) * u.km / u.s, exact=data.exact
+    )
+    scalars = {
+        "t_maneuver": data.t,
+        "nominal_t": float(nominal_t[0]),
+        "nominal_distance": float(nominal_distance[0]),
+        "exact": data.exact,
+    }
+
+    binary = negotiate(accept)
+    if binary is not None:
+        media_type, dtype = binary
+        body, layout = encode_columns({"t": t, "distance": distance}, media_type, dtype)
+        return Response(
+            content=body,
+            media_type=media_type,
+            headers={LAYOUT_HEADER: layout_header(layout, **scalars)},
+        )
+
+    return DeflectionPreviewResponse(
+        **scalars, t=t.tolist(), distance=distance.tolist()
+    )
+
+
+@app.post("/impulse/optimize", response_model=DeflectionOptimizeResponse)
+@scheduler.scheduled("deflection")
+def impulse_optimize(data: DeflectionOptimizeRequest):
+    orbit, earth_orbit = get_orbit_earth_asteroid(data.id)
+    try:
+        (nominal_t, nominal_distance), plans = optimize_deflection(
+            earth_orbit,
+            orbit,
+            data.budget * u.km / u.s,
+            levels=data.levels,
+            epochs=data.epochs,
+            max_burns=data.max_burns,
+            directions=data.directions,
+            steps=730,
+            workers=OPT_WORKERS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return DeflectionOptimizeResponse(
+        nominal_t=nominal_t,
+        nominal_distance=nominal_distance,
+        plans=[
+            DeflectionPlan(
+                burns=[Burn(t=t, v_delta=dv.tolist()) for t, dv in plan["burns"]],
+                dv=plan["dv"],
+                lead_time=plan["lead_time"],
+                t=plan["t"],
+                miss=plan["miss"],
+            )
+            for plan in plans
+        ],
+    )
+
+
+@app.post("/close-approach", response_model=CloseApproachResponse)
+@scheduler.scheduled("orbit", key=request_key)
+def close_approach_endpoint(data: CloseApproachRequest):
+    orbit, earth_orbit = get_orbit_earth_asteroid(data.id)
+    moid, approaches = close_approach(earth_orbit, orbit, data.days, data.step)
+    dates = (earth_orbit.epoch + approaches["t"] * u.day).isot
+
+    return CloseApproachResponse(
+        moid=moid,
+        moid_au=(moid * u.km).to_value(u.AU),
+        approaches=[
+            CloseApproach(t=t, date=date, distance=distance, v_rel=v_rel)
+            for t, date, distance, v_rel in zip(
+                approaches["t"].tolist(),
+                np.atleast_1d(dates).tolist(),
+                approaches["distance"].tolist(),
+                approaches["v_rel"].tolist(),
+            )
+        ],
+    )
+
+
+@app.post("/screening")
+async def screening_start(data: ScreeningRequest):
+    started = screening_job.start(force=data.force)
+    return {"started": started, **screening_job.stats()}
+
+
+@app.get("/screening")
+async def screening_stats():
+    return screening_job.stats()
+
+
+@app.post("/hazards", response_model=HazardsResponse)
+@scheduler.scheduled("catalog")
+def hazards_endpoint(data: HazardsRequest):
+    rows = screened_hazards(
+        order=data.order,
+        limit=data.limit,
+        max_moid=data.max_moid,
+        max_distance=data.max_distance,
+        pha=data.pha,
+        upcoming=data.upcoming,
+    )
+    dates = []
+    if rows:
+        dates = Time([row["approach_time"] for row in rows], format="unix").isot
+
+    return HazardsResponse(
+        hazards=[
+            Hazard(
+                spkid=row["spkid"],
+                fullname=row["fullname"],
+                pha=None if row["pha"] is None else bool(row["pha"]),
+                moid=row["moid"],
+                synodic_period=row["synodic_period"],
+                approach_date=date,
+                approach_distance=row["approach_distance"],
+                approach_v_rel=row["approach_v_rel"],
+                screened=row["screened"],
+            )
+            for row, date in zip(rows, np.atleast_1d(dates).tolist())
+        ]
+    )
 
-    return ImpulseResponse(earth_pos=earth_pos, asteroid_pos=asteroid_pos)
+
+@app.post("/asteroids", response_model=AsteroidSearchResponse)
+@scheduler.scheduled("catalog")
+def search_asteroids(data: AsteroidSearchRequest):
+    try:
+        rows, next_cursor = search_catalog(
+            name=data.name,
+            match=data.match,
+            pha=data.pha,
+            ranges=data.ranges(),
+            sort=data.sort,
+            descending=data.descending,
+            cursor=data.cursor,
+            limit=data.limit,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return AsteroidSearchResponse(
+        asteroids=[AsteroidSummary(**row) for row in rows], next=next_cursor
+    )
+
+
+@app.get("/catalog")
+async def catalog_stats():
+    return catalog.stats()
+
+
+@app.post("/catalog/refresh")
+async def catalog_refresh():
+    started = catalog.refresh()
+    return {"started": started, **catalog.stats()}
+
+
+@app.get("/scheduler")
+async def scheduler_stats():
+    return scheduler.stats()
 
 
-@app.post("/impact", response_model=ImpactResponse)
-async def impact(data: ImpactRequest):
-    print(type(data), data)
+@app.get("/orbit/earth")
+async def earth_ephemeris_stats():
+    return earth_ephemeris.stats()
+
+
+@app.get("/orbit/cache")
+async def baseline_cache_stats():
+    return {**baseline_cache.stats(), "orbits": orbit_cache.stats()}
+
+
+@app.post("/impact", response_model=ImpactResponse, response_model_exclude_unset=True)
+@scheduler.scheduled("impact", key=impact_key)
+def impact(data: ImpactRequest, accept: Optional[str] = Header(None)):
+    binary = negotiate(accept)
+    effect_fields = data.effect_fields()
     (
         E0,
         E_ground,
@@ -122,8 +1115,16 @@ async def impact(data: ImpactRequest):
         z_breakup,
         zb,
         r_effects,
-    ) = impact_main(data.L0, data.Ui, data.v0, data.T, data.Uj)
-    return ImpactResponse(
+    ) = impact_cache.main(
+        data.L0,
+        data.Ui,
+        data.v0,
+        data.T,
+        data.Uj,
+        r=data.distance_axis(),
+        fields=effect_fields,
+    )
+    scalars = dict(
         E0=E0,
         E_ground=E_ground,
         E_air=E_air,
@@ -132,5 +1133,130 @@ async def impact(data: ImpactRequest):
         crater_depth=crater_depth,
         z_breakup=z_breakup,
         zb=zb,
-        r_effects=r_effects,
     )
+    if data.fields is not None:
+        scalars = {key: value for key, value in scalars.items() if key in data.fields}
+
+    # the MMI lookup table only goes with an effective_mmi column
+    mmi_scale = {}
+    if r_effects.get("effective_mmi") is not None:
+        mmi_scale["mmi_scale"] = MMI_SCALE.tolist()
+
+    if binary is not None:
+        media_type, dtype = binary
+        body, layout = encode_columns(r_effects, media_type, dtype)
+        return Response(
+            content=body,
+            media_type=media_type,
+            headers={LAYOUT_HEADER: layout_header(layout, **mmi_scale, **scalars)},
+        )
+
+    if effect_fields == ():
+        return ImpactResponse(**scalars)
+
+    if data.layout == "rows":
+        r_effects = r_effects_rows(r_effects)
+    else:
+        r_effects = {
+            key: None if col is None else col.tolist() for key, col in r_effects.items()
+        }
+        r_effects.update(mmi_scale)
+
+    return ImpactResponse(**scalars, r_effects=r_effects)
+
+
+@app.post("/impact/rings", response_model=RingsResponse)
+@scheduler.scheduled("impact", key=impact_key)
+def impact_rings_endpoint(data: RingsRequest):
+    thresholds = None
+    if data.thresholds is not None:
+        thresholds = [(t.effect, t.threshold, t.label) for t in data.thresholds]
+    sc, rings = impact_rings(
+        data.L0, data.Ui, data.v0, data.T, data.Uj, thresholds, data.r_max
+    )
+    return RingsResponse(
+        E0=sc["E0"],
+        E_ground=sc["E_ground"],
+        E_air=sc["E_air"],
+        crater_diamater=sc["crater_diamater"],
+        z_breakup=sc["z_star"],
+        zb=sc["zb"],
+        rings=rings,
+    )
+
+
+@app.post("/impact/batch", response_model=BatchImpactResponse)
+@scheduler.scheduled("impact_batch")
+def impact_batch(data: BatchImpactRequest, accept: Optional[str] = Header(None)):
+    if data.grid is not None:
+        g = data.grid
+        L0, Ui, v0, T, Uj = parameter_grid(g.L0, g.Ui, g.v0, g.T, g.Uj)
+    else:
+        L0, Ui, v0, T, Uj = (
+            np.array(
+                [(r.L0, r.Ui, r.v0, r.T, r.Uj) for r in data.rows], dtype=np.float64
+            )
+            .reshape(-1, 5)
+            .T
+        )
+
+    sc = scenario_batch(L0, Ui, v0, T, Uj)
+    columns = {
+        "L0": L0,
+        "Ui": Ui,
+        "v0": v0,
+        "T": T,
+        "Uj": Uj,
+        "E0": sc["E0"],
+        "E_ground": sc["E_ground"],
+        "E_air": sc["E_air"],
+        "v_ground": sc["v_ground"],
+        "crater_diamater": sc["crater_diamater"],
+        "crater_depth": sc["crater_depth"],
+        "z_breakup": sc["z_star"],
+        "zb": sc["zb"],
+        "fball_radius": sc["fball_radius"],
+        "M": sc["M"],
+    }
+
+    binary = negotiate(accept)
+    if binary is not None:
+        media_type, dtype = binary
+        body, layout = encode_columns(columns, media_type, dtype)
+        return Response(
+            content=body,
+            media_type=media_type,
+            headers={LAYOUT_HEADER: layout_header(layout, n=len(L0))},
+        )
+
+    return BatchImpactResponse(
+        n=len(L0), results={key: col.tolist() for key, col in columns.items()}
+    )
+
+
+@app.post("/impact/uncertainty", response_model=UncertaintyResponse)
+@scheduler.scheduled("impact_batch")
+def impact_uncertainty(data: UncertaintyRequest):
+    rings = None
+    if data.thresholds is not None:
+        rings = [
+            (t.effect, t.threshold, t.label or f"{t.effect} {t.threshold:g}")
+            for t in data.thresholds
+        ]
+    try:
+        result = monte_carlo(
+            data.priors(),
+            n=data.n,
+            seed=data.seed,
+            percentiles=data.percentiles,
+            rings=rings,
+            workers=MC_WORKERS,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return UncertaintyResponse(**result)
+
+
+@app.get("/impact/cache")
+async def impact_cache_stats():
+    return impact_cache.stats()
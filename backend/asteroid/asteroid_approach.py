@@ -0,0 +1,187 @@
+import numpy as np
+
+from asteroid.asteroid_kepler import kepler
+
+"""
+    CLOSE APPROACHES AND MOID
+
+    Close approaches are the local minima of the Earth-asteroid distance
+    on a coarse time grid, refined by golden section search. The MOID is
+    the smallest distance between the two orbits, found the same way on a
+    grid of true anomaly pairs.
+"""
+
+INVPHI = (np.sqrt(5) - 1) / 2  # 1/golden ratio
+MOID_GRID = 180  # anomalies per orbit in the MOID scan
+MOID_CANDIDATES = 8  # local minima of the scan that are refined
+MOID_XTOL = 1e-9  # rad
+APPROACH_XTOL = 1.0  # s
+
+
+def golden_section(f, a, b, xtol, maxiter=200):
+    """
+    Minimises f, which maps an array of points to an array of values,
+    in every bracket [a, b] at once. Returns (x, f(x)).
+    """
+
+    a = np.array(a, dtype=np.float64)
+    b = np.array(b, dtype=np.float64)
+    c = b - INVPHI * (b - a)
+    d = a + INVPHI * (b - a)
+    fc = f(c)
+    fd = f(d)
+
+    for _ in range(maxiter):
+        if np.all(np.abs(b - a) <= xtol):
+            break
+        left = fc < fd  # the minimum is in [a, d]
+        b = np.where(left, d, b)
+        a = np.where(left, a, c)
+        # the kept inner point becomes d (left) or c (right)
+        keep, f_keep = np.where(left, c, d), np.where(left, fc, fd)
+        new = np.where(left, b - INVPHI * (b - a), a + INVPHI * (b - a))
+        f_new = f(new)
+        c, fc = np.where(left, new, keep), np.where(left, f_new, f_keep)
+        d, fd = np.where(left, keep, new), np.where(left, f_keep, f_new)
+
+    left = fc < fd
+    return np.where(left, c, d), np.where(left, fc, fd)
+
+
+def conic(k, r, v):
+    """
+    Returns the shape of the orbit of a state as (p, ecc, P, Q): the
+    semi-latus rectum, the eccentricity and the unit vectors towards
+    periapsis and 90 degrees ahead of it in the orbital plane.
+    """
+
+    r = np.asarray(r, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+    h = np.cross(r, v)
+    e_vec = ((v @ v - k / np.linalg.norm(r)) * r - (r @ v) * v) / k
+    ecc = np.linalg.norm(e_vec)
+    W = h / np.linalg.norm(h)
+    # a circular orbit has no periapsis, any direction in the plane will do
+    P = e_vec / ecc if ecc > 1e-12 else r / np.linalg.norm(r)
+    Q = np.cross(W, P)
+    return (h @ h) / k, ecc, P, Q
+
+
+def conic_points(shape, nu):
+    """
+    Returns the positions (..., 3) at true anomalies nu of a conic.
+    """
+
+    p, ecc, P, Q = shape
+    nu = np.asarray(nu)[..., None]
+    return p / (1 + ecc * np.cos(nu)) * (np.cos(nu) * P + np.sin(nu) * Q)
+
+
+def anomaly_range(ecc, margin=1e-3):
+    """
+    Returns the (low, high) true anomalies of a conic's finite branch.
+    """
+
+    if ecc < 1:
+        return -np.pi, np.pi
+    nu_inf = np.arccos(-1 / ecc) * (1 - margin)
+    return -nu_inf, nu_inf
+
+
+def moid(k, r1, v1, r2, v2, grid=MOID_GRID, candidates=MOID_CANDIDATES):
+    """
+    Returns the MOID of the orbits of two states as (distance, point on
+    the first orbit, point on the second orbit).
+    """
+
+    shapes = conic(k, r1, v1), conic(k, r2, v2)
+    ranges = [anomaly_range(shape[1]) for shape in shapes]
+    closed = [shape[1] < 1 for shape in shapes]
+    axes = [
+        np.linspace(lo, hi, grid, endpoint=not is_closed)
+        for (lo, hi), is_closed in zip(ranges, closed)
+    ]
+    steps = [axis[1] - axis[0] for axis in axes]
+
+    x1 = conic_points(shapes[0], axes[0])[:, None, :]
+    x2 = conic_points(shapes[1], axes[1])[None, :, :]
+    d2 = np.sum((x1 - x2) ** 2, axis=-1)
+
+    # local minima over the 8 neighbours, wrapping around closed orbits
+    padded = d2
+    for axis, is_closed in enumerate(closed):
+        mode = "wrap" if is_closed else "constant"
+        pad = [(0, 0), (0, 0)]
+        pad[axis] = (1, 1)
+        kwargs = {} if is_closed else {"constant_values": np.inf}
+        padded = np.pad(padded, pad, mode=mode, **kwargs)
+    minimum = np.ones_like(d2, dtype=bool)
+    for di in (-1, 0, 1):
+        for dj in (-1, 0, 1):
+            if di or dj:
+                neighbour = padded[1 + di : 1 + di + grid, 1 + dj : 1 + dj + grid]
+                minimum &= d2 <= neighbour
+    i, j = np.nonzero(minimum)
+    best = np.argsort(d2[i, j])[:candidates]
+    nu1, nu2 = axes[0][i[best]], axes[1][j[best]]
+
+    def clip(nu, n):
+        lo, hi = ranges[n]
+        return nu if closed[n] else np.clip(nu, lo, hi)
+
+    def inner(nu1):
+        # smallest squared distance to the second orbit from each nu1
+        x1 = conic_points(shapes[0], nu1)
+        return golden_section(
+            lambda nu: np.sum((x1 - conic_points(shapes[1], nu)) ** 2, axis=-1),
+            clip(nu2 - 2 * steps[1], 1),
+            clip(nu2 + 2 * steps[1], 1),
+            MOID_XTOL,
+        )
+
+    nu1, d2 = golden_section(
+        lambda nu: inner(nu)[1],
+        clip(nu1 - steps[0], 0),
+        clip(nu1 + steps[0], 0),
+        MOID_XTOL,
+    )
+    nu2, d2 = inner(nu1)
+
+    n = np.argmin(d2)
+    return (
+        float(np.sqrt(d2[n])),
+        conic_points(shapes[0], nu1[n]),
+        conic_points(shapes[1], nu2[n]),
+    )
+
+
+def close_approaches(k, r_earth, v_earth, r_ast, v_ast, t_max, step):
+    """
+    Returns the local minima of the Earth-asteroid distance between 0 and
+    t_max seconds, scanned every step seconds, as a dict of arrays:
+    t (s), distance (km), v_rel (km/s, relative speed at t), position and
+    earth_position (km, (n, 3)), ordered by t.
+    """
+
+    n = max(int(np.ceil(t_max / step)), 2) + 1
+    times = np.linspace(0, t_max, n)
+
+    def d2(t):
+        return np.sum(
+            (kepler(k, r_ast, v_ast, t)[0] - kepler(k, r_earth, v_earth, t)[0]) ** 2,
+            axis=-1,
+        )
+
+    dist = d2(times)
+    i = np.flatnonzero((dist[1:-1] <= dist[:-2]) & (dist[1:-1] < dist[2:])) + 1
+    t, d2_min = golden_section(d2, times[i - 1], times[i + 1], APPROACH_XTOL)
+
+    ra, va = kepler(k, r_ast, v_ast, t)
+    re, ve = kepler(k, r_earth, v_earth, t)
+    return {
+        "t": t,
+        "distance": np.sqrt(d2_min),
+        "v_rel": np.linalg.norm(va - ve, axis=-1),
+        "position": ra,
+        "earth_position": re,
+    }
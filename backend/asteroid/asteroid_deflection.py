@@ -0,0 +1,134 @@
+import numpy as np
+
+from asteroid.asteroid_kepler import kepler
+
+"""
+    LINEARIZED DEFLECTION
+
+    The state after a small impulse dv is predicted with the two-body state
+    transition matrix, dx(t) = PHI(t) @ [0, 0, 0, dv], so a candidate
+    delta-v costs a matrix-vector product per time instead of a propagation.
+"""
+
+WINDOW = 12  # samples on each side of a nominal close approach
+REL_STEP = 1e-6  # finite difference step, relative to |r| and |v|
+
+
+def state_transition(k, r, v, tof, rel_step=REL_STEP):
+    """
+    Returns the state transition matrices (n, 6, 6) of the state (r, v)
+    over the times of flight tof (n,), and the nominal states (n, 6).
+    """
+
+    x = np.concatenate([r, v])
+    h = np.concatenate(
+        [
+            np.full(3, rel_step * np.linalg.norm(r)),
+            np.full(3, rel_step * np.linalg.norm(v)),
+        ]
+    )
+    # 12 perturbed states and the nominal one, propagated together
+    dx = np.concatenate([np.diag(h), -np.diag(h), np.zeros((1, 6))])
+    states = x + dx
+    rs, vs = kepler(k, states[:, None, :3], states[:, None, 3:], tof)
+    xs = np.concatenate([rs, vs], axis=-1)  # (13, n, 6)
+
+    phi = (xs[:6] - xs[6:12]) / (2 * h[:, None, None])  # (column, n, row)
+    return np.transpose(phi, (1, 2, 0)), xs[12]
+
+
+def closest(times, d2, cols=None):
+    """
+    Returns the time and distance of the smallest squared distance of
+    every row of d2 (m, len(cols)), sampled at times[cols], refined by a
+    parabola where the neighbours are consecutive samples.
+    """
+
+    cols = np.arange(d2.shape[1]) if cols is None else cols
+    rows = np.arange(d2.shape[0])
+    j = np.argmin(d2, axis=1)
+    jl = np.maximum(j - 1, 0)
+    jr = np.minimum(j + 1, d2.shape[1] - 1)
+    inner = (cols[jl] == cols[j] - 1) & (cols[jr] == cols[j] + 1)
+
+    d_l, d_0, d_r = d2[rows, jl], d2[rows, j], d2[rows, jr]
+    curve = d_l - 2 * d_0 + d_r
+    refine = inner & (curve > 0)
+    curve = np.where(refine, curve, 1.0)
+    offset = np.where(refine, 0.5 * (d_l - d_r) / curve, 0.0)
+    step = np.where(inner, times[cols[jr]] - times[cols[j]], 0.0)
+
+    t = times[cols[j]] + offset * step
+    d2_min = np.where(refine, d_0 - 0.125 * (d_l - d_r) ** 2 / curve, d_0)
+    return t, np.sqrt(np.maximum(d2_min, 0.0))
+
+
+def linearize(k, r0, v0, t_maneuver, times, earth_pos, window=WINDOW):
+    """
+    Precomputes the linear deflection model of an asteroid (state r0, v0
+    at t = 0) for impulses at t_maneuver, on the time grid times (n,)
+    with Earth at earth_pos (n, 3). Returns a dict used by preview and
+    exact_miss.
+    """
+
+    after = times > t_maneuver
+    if not after.any():
+        raise ValueError("the maneuver is after the end of the time grid")
+    r_m, v_m = kepler(k, r0, v0, t_maneuver)
+    phi, nominal = state_transition(k, r_m, v_m, times[after] - t_maneuver)
+
+    # samples around the nominal close approaches after the maneuver
+    d2 = np.sum((nominal[:, :3] - earth_pos[after]) ** 2, axis=-1)
+    n = len(d2)
+    minima = np.flatnonzero(
+        (d2 <= np.r_[np.inf, d2[:-1]]) & (d2 < np.r_[d2[1:], np.inf])
+    )
+    cols = np.unique(
+        np.clip(minima[:, None] + np.arange(-window, window + 1), 0, n - 1)
+    )
+
+    return {
+        "k": k,
+        "r_m": r_m,
+        "v_m": v_m,
+        "t_maneuver": t_maneuver,
+        "times": times[after],
+        "earth_pos": earth_pos[after],
+        "nominal": nominal,
+        "phi_rv": phi[:, :3, 3:],  # only the velocity columns are needed
+        "cols": cols,
+        # asteroid - Earth and PHI_rv rows (len(cols) * 3, 3) at cols
+        "window_offset": nominal[cols, :3] - earth_pos[after][cols],
+        "window_phi": phi[cols, :3, 3:].reshape(-1, 3),
+    }
+
+
+def preview(model, dv):
+    """
+    Returns the predicted time (s) and distance (km) of the closest
+    approach for every candidate impulse dv (m, 3) in km/s.
+    """
+
+    dv = np.atleast_2d(np.asarray(dv, dtype=np.float64))
+    cols = model["cols"]
+    # (m, len(cols), 3): nominal separation plus PHI_rv @ dv at every time
+    sep = (dv @ model["window_phi"].T).reshape(len(dv), len(cols), 3)
+    sep += model["window_offset"]
+    d2 = np.einsum("mti,mti->mt", sep, sep)
+    return closest(model["times"], d2, cols)
+
+
+def exact_miss(model, dv):
+    """
+    As preview, but propagating every candidate over the whole grid.
+    """
+
+    dv = np.atleast_2d(np.asarray(dv, dtype=np.float64))
+    pos, _ = kepler(
+        model["k"],
+        model["r_m"],
+        (model["v_m"] + dv)[:, None, :],
+        model["times"] - model["t_maneuver"],
+    )
+    d2 = np.sum((pos - model["earth_pos"]) ** 2, axis=-1)
+    return closest(model["times"], d2)
@@ -0,0 +1,203 @@
+import os
+import threading
+import time
+
+import numpy as np
+from astropy import units as u
+from astropy.coordinates import solar_system_ephemeris
+from astropy.time import Time
+from poliastro.bodies import Earth
+from poliastro.twobody import Orbit
+
+from asteroid.asteroid_kepler import kepler
+
+"""
+    EARTH EPHEMERIS CACHE
+
+    Earth's trajectory is the same for every asteroid, so its orbit is
+    taken once per epoch instead of once per request. Epochs are the
+    current time rounded down to `resolution` seconds (an hour by
+    default) and for each one the positions over the 365 day window are
+    precomputed for the usual step counts and kept, read-only, until the
+    next epoch starts.
+
+    When a new epoch starts the previous table keeps being served while
+    a background thread computes the new one; only the very first request
+    waits for it. start() runs a thread that does this ahead of time, just
+    before every epoch boundary.
+
+    The orbit comes from astropy's built-in ephemeris unless `ephemeris`
+    names another one (e.g. "jpl", which needs a download), so the cache
+    also works offline.
+"""
+
+DAY = 86400.0  # s
+HORIZON = 365  # days covered by a track
+PRECOMPUTE = (730,)  # step counts computed with every epoch
+
+
+class EarthEphemeris:
+    """
+    Caches Earth's orbit and trajectory per epoch; see module notes.
+    """
+
+    def __init__(self, resolution=3600.0, ephemeris="builtin", steps=PRECOMPUTE):
+        self.resolution = resolution
+        self.ephemeris = ephemeris
+        self.steps = tuple(steps)
+
+        self._entry = None  # {"epoch", "orbit", "tracks": {steps: positions}}
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._thread = None
+        self.refreshes = 0
+        self.stale = 0
+
+    def epoch(self, now=None):
+        """
+        Returns the epoch (unix seconds) that contains now.
+        """
+
+        now = time.time() if now is None else now
+        return np.floor(now / self.resolution) * self.resolution
+
+    def _compute(self, epoch):
+        with solar_system_ephemeris.set(self.ephemeris):
+            orbit = Orbit.from_body_ephem(Earth, Time(epoch, format="unix"))
+        entry = {"epoch": epoch, "orbit": orbit, "tracks": {}}
+        for steps in self.steps:
+            entry["tracks"][steps] = self._track(orbit, steps)
+        return entry
+
+    @staticmethod
+    def _track(orbit, steps, days=HORIZON, start=0.0):
+        times = start + np.linspace(0, days, steps) * DAY
+        positions, _ = kepler(
+            orbit.attractor.k.to_value(u.km**3 / u.s**2),
+            orbit.r.to_value(u.km),
+            orbit.v.to_value(u.km / u.s),
+            times,
+        )
+        positions.flags.writeable = False
+        return positions
+
+    def refresh(self, epoch=None):
+        """
+        Computes and installs the table of an epoch (the current one by
+        default), unless it is already there.
+        """
+
+        epoch = self.epoch() if epoch is None else epoch
+        entry = self._entry
+        if entry is not None and entry["epoch"] >= epoch:
+            return entry
+        return self._install(self._compute(epoch))
+
+    def _install(self, entry):
+        with self._lock:
+            if self._entry is None or self._entry["epoch"] < entry["epoch"]:
+                self._entry = entry
+                self.refreshes += 1
+            return self._entry
+
+    def _refresh_in_background(self, epoch):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def run():
+            try:
+                self.refresh(epoch)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def current(self):
+        """
+        Returns the entry of the current epoch, or the previous one while
+        the current one is computed in the background.
+        """
+
+        epoch = self.epoch()
+        entry = self._entry
+        if entry is None:
+            return self.refresh(epoch)
+        if entry["epoch"] < epoch:
+            with self._lock:
+                self.stale += 1
+            self._refresh_in_background(epoch)
+        return entry
+
+    def orbit(self):
+        """
+        Returns Earth's orbit at the current epoch.
+        """
+
+        return self.current()["orbit"]
+
+    def positions(self, orbit, steps, days=HORIZON, start=0.0):
+        """
+        Returns Earth's positions in km at `steps` times over `days` days
+        from `start` seconds after the epoch of orbit, the 365 day window
+        by default, as a read-only (steps, 3) array. The table of the cache
+        is used for the default window when orbit is one of its orbits,
+        otherwise they are computed.
+        """
+
+        entry = self._entry
+        if days != HORIZON or start != 0.0:
+            return self._track(orbit, steps, days, start)
+        if entry is None or entry["orbit"] is not orbit:
+            return self._track(orbit, steps)
+        track = entry["tracks"].get(steps)
+        if track is None:
+            track = self._track(orbit, steps)
+            entry["tracks"][steps] = track
+        return track
+
+    def start(self, lead=60.0):
+        """
+        Starts a daemon thread that computes every epoch `lead` seconds
+        before it starts.
+        """
+
+        if self._thread is not None:
+            return
+
+        def run():
+            while True:
+                try:
+                    self.refresh()
+                    next_epoch = self.epoch() + self.resolution
+                    time.sleep(max(next_epoch - lead - time.time(), 0))
+                    entry = self._compute(next_epoch)
+                    time.sleep(max(next_epoch - time.time(), 0))
+                    self._install(entry)
+                except Exception as e:
+                    print(f"Earth ephemeris refresh failed: {e}")
+                    time.sleep(self.resolution / 10)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def stats(self):
+        entry = self._entry
+        return {
+            "epoch": (
+                None if entry is None else Time(entry["epoch"], format="unix").isot
+            ),
+            "resolution": self.resolution,
+            "ephemeris": self.ephemeris,
+            "tracks": [] if entry is None else sorted(entry["tracks"]),
+            "refreshes": self.refreshes,
+            "stale": self.stale,
+        }
+
+
+earth_ephemeris = EarthEphemeris(
+    resolution=float(os.getenv("DEJA_EARTH_RESOLUTION", 3600)),
+    ephemeris=os.getenv("DEJA_EPHEMERIS", "builtin"),
+)
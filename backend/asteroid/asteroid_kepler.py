@@ -0,0 +1,230 @@
+import numpy as np
+
+"""
+    VECTORIZED KEPLER PROPAGATION
+
+    Unit-free two-body propagation for whole time arrays: k in km^3/s^2,
+    positions in km, velocities in km/s and times in s.
+
+    kepler follows the universal variable algorithm of Vallado that
+    poliastro's Orbit.propagate uses (same first guesses, Newton
+    iterations and tolerances), so it covers elliptic, parabolic and
+    hyperbolic orbits alike. Instead of one call per time step every
+    element is iterated at once and leaves the iteration when it has
+    converged.
+
+    Where plain Newton iterations do not converge within NUMITER (highly
+    eccentric orbits, where poliastro gives up), the remaining elements
+    continue with Newton steps safeguarded by a bracket: time grows
+    monotonically with the universal variable xi, at least as fast as
+    periapsis distance / sqrt(k), so xi lies between 0 and
+    sqrt(k) * tof / r_periapsis.
+"""
+
+RTOL = 1e-10
+NUMITER = 35
+SAFE_NUMITER = 200  # safeguarded iterations after NUMITER
+
+# 1/(2k+2)! and 1/(2k+3)!, k = 0.., the series of c2 and c3 for |psi| <= 1
+_N_SERIES = 12
+_C2_SERIES = 1 / np.array(
+    [float(np.prod(np.arange(1, 2 * k + 3))) for k in range(_N_SERIES)]
+)
+_C3_SERIES = 1 / np.array(
+    [float(np.prod(np.arange(1, 2 * k + 4))) for k in range(_N_SERIES)]
+)
+
+
+def stumpff(psi):
+    """
+    Returns the Stumpff functions c2(psi) and c3(psi) of an array.
+    """
+
+    psi = np.asarray(psi, dtype=np.float64)
+    c2 = np.empty_like(psi)
+    c3 = np.empty_like(psi)
+
+    pos = psi > 1.0
+    neg = psi < -1.0
+    mid = ~(pos | neg)
+
+    s = np.sqrt(psi[pos])
+    c2[pos] = (1 - np.cos(s)) / psi[pos]
+    c3[pos] = (s - np.sin(s)) / (psi[pos] * s)
+
+    s = np.sqrt(-psi[neg])
+    c2[neg] = (np.cosh(s) - 1) / -psi[neg]
+    c3[neg] = (np.sinh(s) - s) / (-psi[neg] * s)
+
+    # Horner on the alternating series sum_k (-psi)^k / (2k+2)!
+    x = -psi[mid]
+    s2 = np.zeros_like(x)
+    s3 = np.zeros_like(x)
+    for k in range(_N_SERIES - 1, -1, -1):
+        s2 = s2 * x + _C2_SERIES[k]
+        s3 = s3 * x + _C3_SERIES[k]
+    c2[mid] = s2
+    c3[mid] = s3
+
+    return c2, c3
+
+
+def kepler(k, r0, v0, tof, rtol=RTOL, numiter=NUMITER):
+    """
+    Returns the positions and velocities after tof seconds of the states
+    (r0, v0), as two arrays of shape (..., 3).
+
+    r0 and v0 have shape (..., 3) and the leading dimensions broadcast
+    against tof, e.g. one state (3,) and n times (n,) give (n, 3), and
+    m states (m, 1, 3) and n times (n,) give (m, n, 3).
+    """
+
+    r0 = np.asarray(r0, dtype=np.float64)
+    v0 = np.asarray(v0, dtype=np.float64)
+    tof = np.asarray(tof, dtype=np.float64)
+    shape = np.broadcast_shapes(r0.shape[:-1], v0.shape[:-1], tof.shape)
+
+    r0 = np.broadcast_to(r0, shape + (3,)).reshape(-1, 3)
+    v0 = np.broadcast_to(v0, shape + (3,)).reshape(-1, 3)
+    tof = np.broadcast_to(tof, shape).ravel()
+
+    dot_r0v0 = np.einsum("ij,ij->i", r0, v0)
+    norm_r0 = np.sqrt(np.einsum("ij,ij->i", r0, r0))
+    sqrt_mu = np.sqrt(k)
+    alpha = -np.einsum("ij,ij->i", v0, v0) / k + 2 / norm_r0
+
+    # first guesses
+    with np.errstate(all="ignore"):
+        sign = np.sign(tof)
+        hyperbolic = (
+            sign
+            * np.sqrt(-1 / alpha)
+            * np.log(
+                (-2 * k * alpha * tof)
+                / (dot_r0v0 + sign * np.sqrt(-k / alpha) * (1 - norm_r0 * alpha))
+            )
+        )
+    xi_new = np.where(
+        alpha > 0,
+        sqrt_mu * tof * alpha,
+        np.where(alpha < 0, hyperbolic, sqrt_mu * tof / norm_r0),
+    )
+    xi_new[tof == 0] = 0.0
+
+    # Newton iterations; every element keeps the values of the iteration
+    # in which it converged
+    xi = np.empty_like(tof)
+    psi = np.empty_like(tof)
+    c2 = np.empty_like(tof)
+    c3 = np.empty_like(tof)
+    norm_r = np.empty_like(tof)
+    active = np.arange(len(tof))
+
+    def step(active, x):
+        # residual time (scaled by sqrt_mu), r and the Newton step at x
+        a_psi = x * x * alpha[active]
+        a_c2, a_c3 = stumpff(a_psi)
+        a_dot = dot_r0v0[active] / sqrt_mu
+        a_r0 = norm_r0[active]
+        a_r = x * x * a_c2 + a_dot * x * (1 - a_psi * a_c3) + a_r0 * (1 - a_psi * a_c2)
+        residual = (
+            sqrt_mu * tof[active]
+            - x * x * x * a_c3
+            - a_dot * x * x * a_c2
+            - a_r0 * x * (1 - a_psi * a_c3)
+        )
+        return residual, a_r, a_psi, a_c2, a_c3
+
+    def converge(active, x, x_new, a_r, a_psi, a_c2, a_c3):
+        with np.errstate(divide="ignore", invalid="ignore"):
+            done = (np.abs((x_new - x) / x_new) < rtol) | (np.abs(x_new - x) < rtol)
+        idx = active[done]
+        xi[idx] = x[done]
+        psi[idx] = a_psi[done]
+        c2[idx] = a_c2[done]
+        c3[idx] = a_c3[done]
+        norm_r[idx] = a_r[done]
+        return done
+
+    for _ in range(numiter):
+        x = xi_new[active]
+        residual, a_r, a_psi, a_c2, a_c3 = step(active, x)
+        x_new = x + residual / a_r
+        done = converge(active, x, x_new, a_r, a_psi, a_c2, a_c3)
+        xi_new[active] = x_new
+        active = active[~done]
+        if len(active) == 0:
+            break
+    else:
+        # bracket [lo, hi] of xi from the periapsis distance
+        a_r0, a_v0 = r0[active], v0[active]
+        h = np.cross(a_r0, a_v0)
+        h2 = np.einsum("ij,ij->i", h, h)
+        v2 = np.einsum("ij,ij->i", a_v0, a_v0)
+        e_vec = (
+            (v2 - k / norm_r0[active])[:, None] * a_r0
+            - dot_r0v0[active][:, None] * a_v0
+        ) / k
+        r_p = h2 / k / (1 + np.linalg.norm(e_vec, axis=1))
+        bound = sqrt_mu * tof[active] / r_p
+        lo, hi = np.minimum(0.0, bound), np.maximum(0.0, bound)
+        x = xi_new[active]
+        x = np.where(np.isfinite(x), np.clip(x, lo, hi), 0.5 * (lo + hi))
+
+        for _ in range(SAFE_NUMITER):
+            residual, a_r, a_psi, a_c2, a_c3 = step(active, x)
+            # time still short of tof: xi is too small
+            lo = np.where(residual > 0, x, lo)
+            hi = np.where(residual > 0, hi, x)
+            x_new = x + residual / a_r
+            bad = ~((x_new > lo) & (x_new < hi))
+            x_new = np.where(bad, 0.5 * (lo + hi), x_new)
+            done = converge(active, x, x_new, a_r, a_psi, a_c2, a_c3)
+            # a collapsed bracket has converged at x
+            closed = ~done & (hi - lo <= rtol * np.abs(hi))
+            converge(active, x, np.where(closed, x, np.nan), a_r, a_psi, a_c2, a_c3)
+            done |= closed
+            active, x, lo, hi = active[~done], x_new[~done], lo[~done], hi[~done]
+            if len(active) == 0:
+                break
+        else:
+            raise RuntimeError("Maximum number of iterations reached")
+
+    # Lagrange coefficients
+    f = 1 - xi**2 / norm_r0 * c2
+    g = tof - xi**3 / sqrt_mu * c3
+    gdot = 1 - xi**2 / norm_r * c2
+    fdot = sqrt_mu / (norm_r * norm_r0) * xi * (psi * c3 - 1)
+
+    r = f[:, None] * r0 + g[:, None] * v0
+    v = fdot[:, None] * r0 + gdot[:, None] * v0
+    return r.reshape(shape + (3,)), v.reshape(shape + (3,))
+
+
+def coe2rv(k, a, ecc, inc, raan, argp, nu):
+    """
+    Returns the positions and velocities (..., 3) of arrays of classical
+    elements: semi-major axis a (km), eccentricity and the angles in rad,
+    as poliastro's Orbit.from_classical does.
+    """
+
+    a, ecc, inc, raan, argp, nu = np.broadcast_arrays(
+        *(np.asarray(x, dtype=np.float64) for x in (a, ecc, inc, raan, argp, nu))
+    )
+    p = a * (1 - ecc**2)
+
+    # perifocal frame
+    r_pqw = p / (1 + ecc * np.cos(nu))
+    r_p, r_q = r_pqw * np.cos(nu), r_pqw * np.sin(nu)
+    v_p, v_q = -np.sqrt(k / p) * np.sin(nu), np.sqrt(k / p) * (ecc + np.cos(nu))
+
+    # rotation Rz(raan) Rx(inc) Rz(argp), first two columns
+    cO, sO = np.cos(raan), np.sin(raan)
+    ci, si = np.cos(inc), np.sin(inc)
+    cw, sw = np.cos(argp), np.sin(argp)
+    P = np.stack([cO * cw - sO * sw * ci, sO * cw + cO * sw * ci, sw * si], axis=-1)
+    Q = np.stack([-cO * sw - sO * cw * ci, -sO * sw + cO * cw * ci, cw * si], axis=-1)
+
+    r = r_p[..., None] * P + r_q[..., None] * Q
+    v = v_p[..., None] * P + v_q[..., None] * Q
+    return r, v
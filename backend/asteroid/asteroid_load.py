@@ -1,90 +1,659 @@
+import datetime
+import json
+import os
+import queue
 import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
 import requests
-import datetime
 from tqdm import tqdm
 
+"""
+    CATALOG SYNC
 
-def update_db():
-    print("Updating database...")
+    update_db keeps the asteroids table in line with the SBDB NEO catalog.
 
-    with sqlite3.connect("asteroid.db") as conn:
-        c = conn.cursor()
+    The response is parsed as it streams in: only the rows of its "data"
+    array are decoded, one at a time, so the ~35k rows never sit in
+    memory as one JSON document. Rows are compared with the stored ones
+    and only new rows and rows whose name, PHA flag or elements changed
+    are written (last_updated is the time they last changed). All writes
+    are batched executemany upserts in a single transaction, with the
+    database in WAL mode, so readers never see a half synced catalog.
 
-        c.execute("""
-           CREATE TABLE IF NOT EXISTS asteroids (
-               spkid INTEGER PRIMARY KEY,
-               fullname TEXT,
-               pha BOOLEAN,
-               a REAL,
-               e REAL,
-               i REAL,
-               om REAL,
-               w REAL,
-               ma REAL,
-               last_updated TEXT
-           )
-       """)
+    Rows that left the catalog are deleted only when pruning, by default
+    for the full SBDB query alone and once its whole "data" array was
+    read: a local or partial source never removes rows, and a truncated
+    download raises before anything is written.
 
-        print("Fetching data...")
+    The source is the SBDB query API unless `source` (or the
+    DEJA_SBDB_SOURCE variable) names a local file in the same JSON
+    format, which lets the sync run offline, e.g. from a fixture.
 
-        url = "https://ssd-api.jpl.nasa.gov/sbdb_query.api?fields=full_name,spkid,neo,pha,e,a,ma,i,om,w&sb-kind=a&sb-group=neo"
-        data = requests.get(url).json()["data"]
+    Every write bumps the catalog version (SQLite's user_version), which
+    caches of data read from the catalog are keyed by.
 
-        print("Data fetched. Now loading...")
+    The table is indexed for asteroid_search: fullname (NOCASE, for
+    prefixes), pha, a, e and i, and a trigram full-text index of fullname
+    (asteroids_fts) for substrings. prepare_db creates them on existing
+    databases at startup.
 
-        for item in tqdm(data, desc="Loading data"):
-            fullname, spkid, _, pha, e, a, ma, i, om, w = item
-            spkid = int(spkid)
-            fullname = fullname.strip()
+    Lookups read through read_pool, a pool of long-lived read-only
+    connections that keeps its prepared lookups between requests.
 
-            def safe_float(x):
-                try:
-                    return float(x)
-                except (ValueError, TypeError):
-                    return None
+    Lookups of unknown SPKIDs go through the Catalog: a miss is kept in a
+    short-lived negative cache, so repeated misses cost a dictionary
+    lookup, and starts at most one background update_db at a time, no
+    more often than every min_interval seconds. Optionally, a miss first
+    asks the SBDB for that single object. A refresh that changed rows
+    calls on_change (the API rescreens the catalog, see asteroid_screen);
+    running update_db by hand does not.
+"""
+
+# backend/asteroid.db, next to api.py
+DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "asteroid.db"
+)
+SBDB_URL = (
+    "https://ssd-api.jpl.nasa.gov/sbdb_query.api"
+    "?fields=full_name,spkid,neo,pha,e,a,ma,i,om,w&sb-kind=a&sb-group=neo"
+)
+SBDB_OBJECT_URL = "https://ssd-api.jpl.nasa.gov/sbdb.api"
+CHUNK_SIZE = 1 << 16  # bytes read at a time
+BATCH = 5000  # rows per executemany
+
+COLUMNS = ("fullname", "pha", "a", "e", "i", "om", "w", "ma")
+LOOKUP = "SELECT spkid, fullname, a, e, i, om, w, ma FROM asteroids WHERE spkid = ?"
+
+
+def init_db(conn):
+    """
+    Creates the asteroids table, its indexes and its full-text index
+    asteroids_fts (trigrams of fullname, kept in sync by triggers).
+    """
+
+    conn.execute("""
+       CREATE TABLE IF NOT EXISTS asteroids (
+           spkid INTEGER PRIMARY KEY,
+           fullname TEXT,
+           pha BOOLEAN,
+           a REAL,
+           e REAL,
+           i REAL,
+           om REAL,
+           w REAL,
+           ma REAL,
+           last_updated TEXT
+       )
+   """)
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS asteroids_fullname "
+        "ON asteroids (fullname COLLATE NOCASE)"
+    )
+    for column in ("pha", "a", "e", "i"):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS asteroids_{column} ON asteroids ({column})"
+        )
+
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'asteroids_fts'"
+    ).fetchone()
+    if exists:
+        return
+    conn.execute("""
+        CREATE VIRTUAL TABLE asteroids_fts USING fts5(
+            fullname, content='asteroids', content_rowid='spkid', tokenize='trigram'
+        )
+    """)
+    triggers = {
+        "insert": "AFTER INSERT ON asteroids BEGIN {new} END",
+        "delete": "AFTER DELETE ON asteroids BEGIN {old} END",
+        "update": "AFTER UPDATE OF fullname ON asteroids BEGIN {old} {new} END",
+    }
+    statements = {
+        "old": "INSERT INTO asteroids_fts (asteroids_fts, rowid, fullname) "
+        "VALUES ('delete', old.spkid, old.fullname);",
+        "new": "INSERT INTO asteroids_fts (rowid, fullname) "
+        "VALUES (new.spkid, new.fullname);",
+    }
+    for name, trigger in triggers.items():
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS asteroids_fts_{name} "
+            + trigger.format(**statements)
+        )
+    conn.execute("INSERT INTO asteroids_fts (asteroids_fts) VALUES ('rebuild')")
+
+
+def prepare_db(db_path=DB_PATH, schemas=()):
+    """
+    Creates the catalog schema (see init_db) and the tables of schemas,
+    functions like init_db for tables kept next to the catalog, and
+    switches the database to WAL mode, before read-only connections use
+    it.
+    """
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            init_db(conn)
+            for schema in schemas:
+                schema(conn)
+    finally:
+        conn.close()
+
+
+def iter_rows(chunks, key="data"):
+    """
+    Yields the elements of the top-level `key` array of a JSON document
+    given as an iterator of byte chunks, decoding one element at a time.
+    """
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pending = b""
+    chunks = iter(chunks)
+
+    def more():
+        # appends the next chunk to buffer, False at the end of the input
+        nonlocal buffer, pending
+        chunk = next(chunks, None)
+        if chunk is None:
+            return False
+        pending += chunk
+        # keep a multi-byte character that was split between chunks
+        for cut in range(len(pending), max(len(pending) - 4, -1), -1):
+            try:
+                buffer += pending[:cut].decode("utf-8")
+                pending = pending[cut:]
+                return True
+            except UnicodeDecodeError:
+                continue
+        raise ValueError("invalid UTF-8 in the catalog")
+
+    # find the start of the array
+    marker = f'"{key}"'
+    while True:
+        found = buffer.find(marker)
+        if found >= 0:
+            start = buffer.find("[", found + len(marker))
+            if start >= 0:
+                buffer = buffer[start + 1 :]
+                break
+        if not more():
+            raise ValueError(f"no {key} array in the catalog")
+
+    pos = 0
+    while True:
+        # skip whitespace and separators up to the next element or the end
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos < len(buffer):
+                break
+            buffer, pos = "", 0
+            if not more():
+                raise ValueError(f"unterminated {key} array in the catalog")
+        if buffer[pos] == "]":
+            return
+        try:
+            row, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            buffer, pos = buffer[pos:], 0
+            if not more():
+                raise ValueError(f"truncated {key} array in the catalog")
+            continue
+        yield row
+        pos = end
+        if pos > CHUNK_SIZE:
+            buffer, pos = buffer[pos:], 0
 
-        for item in tqdm(data, desc="Loading data"):
-            fullname, spkid, _, pha, e, a, ma, i, om, w = item
 
-            spkid = int(spkid)
+def _chunks(source):
+    # byte chunks of the catalog, from the API or a local file
+    if source.startswith(("http://", "https://")):
+        response = requests.get(source, stream=True, timeout=60)
+        response.raise_for_status()
+        try:
+            yield from response.iter_content(CHUNK_SIZE)
+        finally:
+            response.close()
+        return
+    with open(source, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
 
-            fullname = fullname.strip().title()
 
-            # Convert numbers safely
-            a = safe_float(a)
-            e = safe_float(e)
-            i = safe_float(i)
-            om = safe_float(om)
-            w = safe_float(w)
-            ma = safe_float(ma)
+def safe_float(x):
+    try:
+        return float(x)
+    except (ValueError, TypeError):
+        return None
 
-            if a is None or a <= 0:
+
+def parse_row(item):
+    """
+    Returns (spkid, (fullname, pha, a, e, i, om, w, ma)) of a catalog row,
+    or None for rows without usable elements.
+    """
+
+    fullname, spkid, _, pha, e, a, ma, i, om, w = item
+
+    spkid = int(spkid)
+    fullname = fullname.strip().title()
+
+    # Convert numbers safely
+    a = safe_float(a)
+    e = safe_float(e)
+    i = safe_float(i)
+    om = safe_float(om)
+    w = safe_float(w)
+    ma = safe_float(ma)
+
+    if a is None or a <= 0:
+        return None
+    if e is None or not (0 <= e < 2):
+        return None
+    if i is None or not (0 <= i <= 180):
+        return None
+
+    return spkid, (fullname, pha == "Y", a, e, i, om, w, ma)
+
+
+def upsert(conn, rows):
+    """
+    Inserts or updates rows (spkid, fullname, pha, a, e, i, om, w, ma),
+    BATCH at a time, stamping them with the current time.
+    """
+
+    now = datetime.datetime.now().isoformat()
+    for start in range(0, len(rows), BATCH):
+        conn.executemany(
+            f"""
+            INSERT INTO asteroids (spkid, {", ".join(COLUMNS)}, last_updated)
+            VALUES ({", ".join("?" * (len(COLUMNS) + 2))})
+            ON CONFLICT (spkid) DO UPDATE SET
+                {", ".join(f"{c} = excluded.{c}" for c in COLUMNS)},
+                last_updated = excluded.last_updated
+            """,
+            [tuple(row) + (now,) for row in rows[start : start + BATCH]],
+        )
+
+
+def bump_version(conn):
+    """
+    Increments the catalog version, within the current transaction.
+    """
+
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    conn.execute(f"PRAGMA user_version = {int(version) + 1}")
+
+
+def update_db(source=None, db_path=DB_PATH, prune=None):
+    """
+    Syncs the asteroids table with the catalog; see module notes. prune
+    deletes the stored rows the source does not list; by default only
+    the full SBDB catalog prunes.
+
+    Returns {"inserted", "updated", "unchanged", "deleted", "skipped"}.
+    """
+
+    source = source or os.getenv("DEJA_SBDB_SOURCE") or SBDB_URL
+    if prune is None:
+        prune = source == SBDB_URL
+    print(f"Updating database from {source}...")
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        with conn:
+            init_db(conn)
+        stored = {
+            row[0]: (row[1], bool(row[2]) if row[2] is not None else None, *row[3:])
+            for row in conn.execute(
+                f"SELECT spkid, {', '.join(COLUMNS)} FROM asteroids"
+            )
+        }
+
+        # parse the whole catalog before writing, so a failed download
+        # leaves the table as it was
+        changed = []
+        seen = set()
+        counts = {"inserted": 0, "updated": 0, "unchanged": 0, "skipped": 0}
+        for item in tqdm(iter_rows(_chunks(source)), desc="Loading data"):
+            parsed = parse_row(item)
+            if parsed is None:
+                counts["skipped"] += 1
                 continue
-            if e is None or not (0 <= e < 2):
+            spkid, values = parsed
+            if spkid in seen:
                 continue
-            if i is None or not (0 <= i <= 180):
+            seen.add(spkid)
+            old = stored.get(spkid)
+            if old == values:
+                counts["unchanged"] += 1
                 continue
+            counts["inserted" if old is None else "updated"] += 1
+            changed.append((spkid, *values))
+
+        # reached only once the whole data array was read
+        gone = [(spkid,) for spkid in stored if spkid not in seen] if prune else []
+        with conn:
+            upsert(conn, changed)
+            conn.executemany("DELETE FROM asteroids WHERE spkid = ?", gone)
+            if changed or gone:
+                bump_version(conn)
+        if changed or gone:
+            read_pool.bump()
+        counts["deleted"] = len(gone)
+    finally:
+        conn.close()
+
+    print(f"Database updated: {counts}")
+    return counts
 
-                pha = pha == "Y"
-
-                c.execute(
-                    """
-                   INSERT OR IGNORE INTO asteroids (spkid, fullname, pha, a, e, i, om, w, ma, last_updated)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-               """,
-                    (
-                        spkid,
-                        fullname,
-                        pha,
-                        a,
-                        e,
-                        i,
-                        om,
-                        w,
-                        ma,
-                        datetime.datetime.now().isoformat(),
-                    ),
+
+def fetch_object(spkid, timeout=10):
+    """
+    Returns (spkid, (fullname, pha, a, e, i, om, w, ma)) of one NEO from
+    the SBDB object API, or None if it is unknown or not a NEO.
+    """
+
+    response = requests.get(
+        SBDB_OBJECT_URL, params={"sstr": str(spkid)}, timeout=timeout
+    )
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    data = response.json()
+    if "object" not in data or "orbit" not in data or not data["object"].get("neo"):
+        return None
+
+    obj = data["object"]
+    elements = {el["name"]: el["value"] for el in data["orbit"]["elements"]}
+    return parse_row(
+        [
+            obj["fullname"],
+            obj["spkid"],
+            "Y",
+            "Y" if obj.get("pha") else "N",
+            *(elements.get(name) for name in ("e", "a", "ma", "i", "om", "w")),
+        ]
+    )
+
+
+class ReadPool:
+    """
+    Pool of read-only connections to the catalog; see module notes.
+    """
+
+    def __init__(
+        self, db_path=DB_PATH, size=8, mmap_size=256 * 2**20, version_ttl=5.0
+    ):
+        self.db_path = db_path
+        self.size = size
+        self.mmap_size = mmap_size
+        self.version_ttl = version_ttl
+
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._lock = threading.Lock()
+        self._version = None  # (version, monotonic time it was read)
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            Path(self.db_path).resolve().as_uri() + "?mode=ro",
+            uri=True,
+            timeout=30,
+            check_same_thread=False,
+            cached_statements=64,
+        )
+        conn.execute("PRAGMA query_only = ON")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """
+        Lends a connection, waiting for one if all size are in use.
+        """
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                grow = self._open < self.size
+                if grow:
+                    self._open += 1
+            if grow:
+                try:
+                    conn = self._connect()
+                except BaseException:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            else:
+                conn = self._idle.get()
+        try:
+            yield conn
+        finally:
+            self._idle.put(conn)
+
+    def lookup(self, spkid):
+        """
+        Returns the row (spkid, fullname, a, e, i, om, w, ma) of an SPKID,
+        or None.
+        """
+
+        with self.connection() as conn:
+            return conn.execute(LOOKUP, (spkid,)).fetchone()
+
+    def version(self):
+        """
+        Returns the catalog version, read at most every version_ttl
+        seconds (at once after bump).
+        """
+
+        now = time.monotonic()
+        cached = self._version
+        if cached is not None and now - cached[1] < self.version_ttl:
+            return cached[0]
+        with self.connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+        self._version = (version, now)
+        return version
+
+    def bump(self):
+        """
+        Makes the next version() read the version again.
+        """
+
+        self._version = None
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._open -= 1
+
+
+class AsteroidNotFound(LookupError):
+    """
+    Raised for an SPKID that is not in the catalog.
+    """
+
+    def __init__(self, spkid):
+        super().__init__(f"Asteroid {spkid} not found")
+        self.spkid = spkid
+
+
+class Catalog:
+    """
+    Handles lookup misses of the asteroids table; see module notes.
+    """
+
+    def __init__(
+        self,
+        db_path=DB_PATH,
+        negative_ttl=300.0,
+        min_interval=3600.0,
+        fetch_single=False,
+        max_negative=100000,
+        on_change=None,
+    ):
+        self.db_path = db_path
+        self.negative_ttl = negative_ttl
+        self.min_interval = min_interval
+        self.fetch_single = fetch_single
+        self.max_negative = max_negative
+        self.on_change = on_change  # called after a refresh changed rows
+
+        self._negative = {}  # spkid: expires
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._last_refresh = None
+        self.negative_hits = 0
+        self.misses = 0
+        self.fetched = 0
+        self.refreshes = 0
+        self.last_result = None
+        self.last_error = None
+
+    def missing(self, spkid):
+        """
+        Returns whether spkid is in the negative cache.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            expires = self._negative.get(spkid)
+            if expires is None:
+                return False
+            if expires <= now:
+                del self._negative[spkid]
+                return False
+            self.negative_hits += 1
+            return True
+
+    def _remember_missing(self, spkid):
+        now = time.monotonic()
+        with self._lock:
+            if len(self._negative) >= self.max_negative:
+                self._negative = {
+                    key: expires
+                    for key, expires in self._negative.items()
+                    if expires > now
+                }
+                if len(self._negative) >= self.max_negative:
+                    self._negative.clear()
+            self._negative[spkid] = now + self.negative_ttl
+
+    def miss(self, spkid):
+        """
+        Handles an SPKID that is not in the table. Returns its row
+        (spkid, fullname, a, e, i, om, w, ma) if it could be fetched,
+        otherwise raises AsteroidNotFound.
+        """
+
+        if self.missing(spkid):
+            raise AsteroidNotFound(spkid)
+        with self._lock:
+            self.misses += 1
+
+        if self.fetch_single:
+            try:
+                parsed = fetch_object(spkid)
+            except (requests.RequestException, ValueError, KeyError) as e:
+                print(f"Fetching asteroid {spkid} failed: {e}")
+                parsed = None
+            if parsed is not None:
+                found, values = parsed
+                conn = sqlite3.connect(self.db_path, timeout=30)
+                try:
+                    with conn:
+                        init_db(conn)
+                        upsert(conn, [(found, *values)])
+                        bump_version(conn)
+                finally:
+                    conn.close()
+                read_pool.bump()
+                with self._lock:
+                    self.fetched += 1
+                if found == spkid:
+                    fullname, _, a, e, i, om, w, ma = values
+                    return spkid, fullname, a, e, i, om, w, ma
+
+        self._remember_missing(spkid)
+        self.refresh()
+        raise AsteroidNotFound(spkid)
+
+    def refresh(self, force=False):
+        """
+        Starts a background update_db unless one is running or, unless
+        force, one started less than min_interval seconds ago. Returns
+        whether it started.
+        """
+
+        with self._lock:
+            now = time.monotonic()
+            recent = (
+                self._last_refresh is not None
+                and now - self._last_refresh < self.min_interval
+            )
+            if self._refreshing or (recent and not force):
+                return False
+            self._refreshing = True
+            self._last_refresh = now
+
+        def run():
+            try:
+                self.last_result = update_db(db_path=self.db_path)
+                self.last_error = None
+                with self._lock:
+                    self._negative.clear()
+                    self.refreshes += 1
+                changed = sum(
+                    self.last_result[key] for key in ("inserted", "updated", "deleted")
                 )
+                if changed and self.on_change is not None:
+                    self.on_change()
+            except Exception as e:
+                print(f"Catalog refresh failed: {e}")
+                self.last_error = str(e)
+            finally:
+                with self._lock:
+                    self._refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "negative": len(self._negative),
+                "negative_ttl": self.negative_ttl,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "fetched": self.fetched,
+                "refreshing": self._refreshing,
+                "refreshes": self.refreshes,
+                "last_result": self.last_result,
+                "last_error": self.last_error,
+            }
+
+
+read_pool = ReadPool(size=int(os.getenv("DEJA_DB_POOL_SIZE", 8)))
+catalog = Catalog(
+    negative_ttl=float(os.getenv("DEJA_NEGATIVE_TTL", 300)),
+    min_interval=float(os.getenv("DEJA_CATALOG_REFRESH_INTERVAL", 3600)),
+    fetch_single=os.getenv("DEJA_SBDB_FETCH_SINGLE") == "1",
+)
 
 
 if __name__ == "__main__":
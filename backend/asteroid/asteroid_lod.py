@@ -0,0 +1,101 @@
+import heapq
+
+import numpy as np
+
+"""
+    LEVEL OF DETAIL
+
+    Trajectories are sampled uniformly in time, which spends points on
+    the slow arc around aphelion and too few on a fast perihelion passage.
+    Decimation keeps the samples that shape the track: starting from the
+    first and the last sample, the sample furthest from the chord of its
+    segment is kept, splitting that segment, until every dropped sample
+    is within a tolerance (km) of its chord or the maximum number of
+    points is reached (Ramer-Douglas-Peucker, largest error first).
+
+    Tracks that share their times (Earth and the asteroid) share the kept
+    samples, so they stay in step in animations; the error of a sample is
+    the largest over the tracks.
+
+    The order in which samples are kept does not depend on the tolerance,
+    so refinement_order runs once per trajectory and every level of
+    detail is a prefix of it.
+"""
+
+# km, the chord error of each level of detail; level 0 keeps every sample
+LOD_TOLERANCES = (0.0, 1e4, 1e5, 1e6)
+
+
+def chord_errors(positions, a, b):
+    """
+    Returns the distances of the samples a+1 .. b-1 of positions (n, m, 3)
+    to the chords between samples a and b, the largest over the m tracks.
+    """
+
+    start, end = positions[a], positions[b]
+    chord = end - start
+    length2 = np.sum(chord * chord, axis=-1)
+    points = positions[a + 1 : b] - start
+    with np.errstate(divide="ignore", invalid="ignore"):
+        s = np.where(length2 > 0, np.sum(points * chord, axis=-1) / length2, 0.0)
+    s = np.clip(s, 0.0, 1.0)
+    offset = points - s[..., None] * chord
+    return np.sqrt(np.max(np.sum(offset * offset, axis=-1), axis=-1))
+
+
+def refinement_order(positions):
+    """
+    Returns (order, errors) for positions (n, 3) or (n, m, 3): the sample
+    indices in the order they are kept, the first and the last sample
+    first, and for each the largest error of the samples that are still
+    dropped just before it is kept (non-increasing, inf for the first two).
+    """
+
+    positions = np.asarray(positions, dtype=np.float64)
+    if positions.ndim == 2:
+        positions = positions[:, None, :]
+    n = len(positions)
+    if n <= 2:
+        return np.arange(n), np.full(n, np.inf)
+
+    order = [0, n - 1]
+    errors = [np.inf, np.inf]
+
+    def split(a, b):
+        # the segment's worst sample as a heap entry, None if it has none
+        if b - a < 2:
+            return None
+        e = chord_errors(positions, a, b)
+        i = int(np.argmax(e))
+        return (-e[i], a + 1 + i, a, b)
+
+    heap = [split(0, n - 1)]
+    while heap:
+        neg_error, i, a, b = heapq.heappop(heap)
+        order.append(i)
+        errors.append(-neg_error)
+        for segment in (split(a, i), split(i, b)):
+            if segment is not None:
+                heapq.heappush(heap, segment)
+
+    errors = np.minimum.accumulate(np.array(errors))
+    return np.array(order), errors
+
+
+def select(order, errors, tolerance=None, max_points=None):
+    """
+    Returns the sorted indices of the samples kept for a tolerance in km
+    and at most max_points samples (at least the first and the last).
+    A tolerance of 0 or None keeps every sample, even the collinear ones.
+    """
+
+    if not tolerance and max_points is None:
+        return np.arange(len(order))
+    count = len(order)
+    if tolerance:
+        # errors[k] is the error left when only order[:k] is kept
+        within = np.flatnonzero(errors <= tolerance)
+        count = int(within[0]) if len(within) else count
+    if max_points is not None:
+        count = min(count, max(max_points, 2))
+    return np.sort(order[:count])
@@ -0,0 +1,180 @@
+import numpy as np
+
+from asteroid.asteroid_deflection import closest, exact_miss, linearize, preview
+from asteroid.asteroid_kepler import kepler
+from scheduler import process_map
+
+"""
+    DEFLECTION OPTIMIZER
+
+    Searches the burns (t, dv) that push an asteroid furthest from Earth at
+    its closest approach for a delta-v budget, and returns the Pareto set of
+    (delta-v, lead time, miss distance).
+"""
+
+DIRECTIONS = 256  # screened directions per maneuver time
+TOP = 4  # directions per budget level propagated exactly
+
+
+def sphere_directions(n):
+    """
+    Returns n unit vectors (n, 3) spread evenly over the sphere
+    (Fibonacci lattice).
+    """
+
+    i = np.arange(n) + 0.5
+    z = 1 - 2 * i / n
+    phi = np.pi * (1 + np.sqrt(5)) * i
+    rho = np.sqrt(1 - z**2)
+    return np.stack([rho * np.cos(phi), rho * np.sin(phi), z], axis=-1)
+
+
+def _best_directions(k, r0, v0, t_maneuver, times, earth_pos, levels, directions):
+    # best direction and exact miss of every budget level at one time
+    model = linearize(k, r0, v0, t_maneuver, times, earth_pos)
+    best = []
+    for level in levels:
+        dv = level * directions
+        _, distance = preview(model, dv)
+        top = np.argsort(distance)[::-1][:TOP]
+        t, miss = exact_miss(model, dv[top])
+        n = np.argmax(miss)
+        best.append((directions[top[n]], float(t[n]), float(miss[n])))
+    return best
+
+
+def plan_miss(k, r0, v0, burns, times, earth_pos):
+    """
+    Returns the time (s) and distance (km) of the closest approach at
+    times after the first burn of a plan [(t, dv), ...] (sorted by t),
+    propagated burn by burn.
+    """
+
+    t_prev, r, v = 0.0, r0, v0
+    segments = []
+    for n, (t_burn, dv) in enumerate(burns):
+        r, v = kepler(k, r, v, t_burn - t_prev)
+        v = v + dv
+        t_next = burns[n + 1][0] if n + 1 < len(burns) else np.inf
+        seg = (times > t_burn) & (times <= t_next)
+        segments.append(kepler(k, r, v, times[seg] - t_burn)[0])
+        t_prev = t_burn
+    after = times > burns[0][0]
+    pos = np.concatenate(segments)
+    d2 = np.sum((pos - earth_pos[after]) ** 2, axis=-1)
+    t, distance = closest(times[after], d2[None, :])
+    return float(t[0]), float(distance[0])
+
+
+def _plan_chunk(k, r0, v0, plans, times, earth_pos):
+    return [plan_miss(k, r0, v0, burns, times, earth_pos) for burns in plans]
+
+
+def pareto(points):
+    """
+    Returns the indices of the (dv, lead_time, miss) points that no other
+    point dominates (smaller or equal dv and lead time, larger or equal
+    miss, one of them strictly).
+    """
+
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    dv, lead, miss = points.T
+    better = (
+        (dv[None, :] <= dv[:, None])
+        & (lead[None, :] <= lead[:, None])
+        & (miss[None, :] >= miss[:, None])
+    )
+    strictly = (
+        (dv[None, :] < dv[:, None])
+        | (lead[None, :] < lead[:, None])
+        | (miss[None, :] > miss[:, None])
+    )
+    return np.flatnonzero(~(better & strictly).any(axis=1))
+
+
+def optimize(
+    k,
+    r0,
+    v0,
+    times,
+    earth_pos,
+    budget,
+    levels=5,
+    epochs=24,
+    max_burns=1,
+    directions=DIRECTIONS,
+    workers=1,
+):
+    """
+    Returns the nominal closest approach (t, distance) and the Pareto set
+    of deflection plans for budget levels budget * (1..levels) / levels
+    and `epochs` maneuver times before the nominal closest approach, as
+    dicts {burns: [(t, dv)], dv, lead_time, t, miss}, by delta-v.
+    """
+
+    d2 = np.sum((kepler(k, r0, v0, times)[0] - earth_pos) ** 2, axis=-1)
+    minima = np.flatnonzero((d2[1:-1] <= d2[:-2]) & (d2[1:-1] < d2[2:])) + 1
+    if len(minima) == 0:
+        raise ValueError("no close approach in the time window")
+    lo = hi = minima[np.argmin(d2[minima])]
+    while lo > 0 and d2[lo - 1] >= d2[lo]:
+        lo -= 1
+    while hi < len(d2) - 1 and d2[hi + 1] >= d2[hi]:
+        hi += 1
+    t_nominal, d_nominal = closest(times[lo : hi + 1], d2[None, lo : hi + 1])
+    t_nominal, d_nominal = float(t_nominal[0]), float(d_nominal[0])
+
+    step = times[1] - times[0]
+    maneuvers = np.linspace(times[0], t_nominal - step, epochs)
+    maneuvers = maneuvers[maneuvers >= times[0]]
+    if len(maneuvers) == 0:
+        raise ValueError("the closest approach is too close to the start")
+    level_dv = budget * np.arange(1, levels + 1) / levels
+    unit = sphere_directions(directions)
+    # only the basin of the approach counts for the miss distance
+    times, earth_pos = times[lo : hi + 1], earth_pos[lo : hi + 1]
+
+    # 1. single burns, and the best direction at every time and level
+    args = [(k, r0, v0, t_m, times, earth_pos, level_dv, unit) for t_m in maneuvers]
+    best = list(process_map(_best_directions, args, workers))
+    plans = []
+    for t_m, per_level in zip(maneuvers, best):
+        for level, (direction, t, miss) in zip(level_dv, per_level):
+            plans.append(([(t_m, level * direction)], level, t, miss))
+
+    # 2. a budget level split over consecutive maneuver times
+    split = []
+    for burns in range(2, max_burns + 1):
+        for first in range(len(maneuvers) - burns + 1):
+            for n, level in enumerate(level_dv):
+                idx = range(first, first + burns)
+                split.append(
+                    (
+                        [(maneuvers[i], level / burns * best[i][n][0]) for i in idx],
+                        level,
+                    )
+                )
+    if split:
+        chunks = max(1, min(workers, len(split)))
+        parts = [split[i::chunks] for i in range(chunks)]
+        results = process_map(
+            _plan_chunk,
+            [(k, r0, v0, [p[0] for p in part], times, earth_pos) for part in parts],
+            workers,
+        )
+        for part, result in zip(parts, results):
+            for (burns, level), (t, miss) in zip(part, result):
+                plans.append((burns, level, t, miss))
+
+    points = [(level, t_nominal - burns[0][0], miss) for burns, level, _, miss in plans]
+    front = sorted(pareto(points), key=lambda i: (points[i][0], points[i][1]))
+    return (t_nominal, d_nominal), [
+        {
+            "burns": plans[i][0],
+            "dv": points[i][0],
+            "lead_time": points[i][1],
+            "t": plans[i][2],
+            "miss": plans[i][3],
+        }
+        for i in front
+    ]
@@ -1,10 +1,21 @@
 from astropy import units as u
-from astropy.time import Time
-from poliastro.bodies import Sun, Earth
+from poliastro.bodies import Sun
+from poliastro.constants import J2000
 from poliastro.twobody import Orbit
-from asteroid.asteroid_load import update_db
+from asteroid.asteroid_load import catalog, read_pool
+from asteroid.asteroid_kepler import coe2rv, kepler
+from asteroid.asteroid_approach import close_approaches, moid
+from asteroid.asteroid_earth import earth_ephemeris
+from asteroid.asteroid_trajectory import (
+    baseline_cache,
+    deflection_cache,
+    lod_cache,
+    orbit_cache,
+)
+from asteroid.asteroid_lod import LOD_TOLERANCES, refinement_order, select
+from asteroid.asteroid_deflection import exact_miss, linearize, preview
+from asteroid.asteroid_optimize import optimize
 import random
-import sqlite3
 from dotenv import load_dotenv
 import datetime
 import requests
@@ -12,6 +23,12 @@ import os
 import numpy as np
 import plotly.graph_objects as go
 
+DAY = 86400.0  # s
+STREAM_CHUNK = 512  # steps per block of propagate_chunks
+MAX_CACHED_STEPS = 4096  # longer baselines are not kept in baseline_cache
+SUN_K = Sun.k.to_value(u.km**3 / u.s**2)
+ELEMENTS_EPOCH = J2000  # epoch the catalog elements are taken at
+
 
 def get_nearest_earth_orbit():
     load_dotenv()
@@ -40,92 +57,334 @@ def get_nearest_earth_orbit():
 
 
 def get_orbit_earth_asteroid(id):
-    DB_PATH = os.path.join(os.path.dirname(__file__), "asteroid.db")
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-
-    # Random asteroid
-    c.execute(
-        "SELECT spkid, fullname, a, e, i, om, w, ma FROM asteroids WHERE spkid = ?",
-        (id,),
-    )
-    row = c.fetchone()
+    key = (id, read_pool.version())
+    entry = orbit_cache.get(key)
 
-    if row is None:
-        update_db()
-        c.execute(
-            "SELECT spkid, fullname, a, e, i, om, w, ma FROM asteroids WHERE spkid = ?",
-            (id,),
-        )
-        row = c.fetchone()
+    if entry is None:
+        row = read_pool.lookup(id)
         if row is None:
-            print("Asteroid not found")
-            return
-
-    conn.close()
+            # negative cache and background refresh, raises AsteroidNotFound
+            row = catalog.miss(id)
+
+        spkid, name, a, e, i, om, w, ma = row
+
+        orbit = Orbit.from_classical(
+            Sun,
+            a * u.AU,
+            e * u.one,
+            i * u.deg,
+            om * u.deg,
+            w * u.deg,
+            ma * u.deg,
+            epoch=ELEMENTS_EPOCH,
+        )
+        entry = orbit_cache.put(key, (name, orbit, np.array([a, e, i, om, w, ma])))
 
-    spkid, name, a, e, i, om, w, ma = row
+    _, orbit, _ = entry
+    earth_orbit = earth_ephemeris.orbit()
 
-    print(f"Asteroid {name} ({spkid})")
+    return orbit, earth_orbit
 
-    earth_orbit = Orbit.from_body_ephem(Earth, Time.now())
 
-    orbit = Orbit.from_classical(
-        Sun, a * u.AU, e * u.one, i * u.deg, om * u.deg, w * u.deg, ma * u.deg
+def get_elements(ids):
+    """
+    Returns {spkid: (fullname, a, e, i, om, w, ma)} for the ids found in
+    the database, loaded with a single query.
+    """
+
+    ids = list(dict.fromkeys(int(id) for id in ids))
+    if not ids:
+        return {}
+    with read_pool.connection() as conn:
+        rows = conn.execute(
+            "SELECT spkid, fullname, a, e, i, om, w, ma FROM asteroids "
+            f"WHERE spkid IN ({', '.join('?' * len(ids))})",
+            ids,
+        ).fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+def elements_states(a, e, i, om, w, ma, epoch=None):
+    """
+    Returns the heliocentric states (r in km, v in km/s, each (n, 3)) of
+    arrays of catalog elements (a in AU, angles in degrees), the same as
+    Orbit.from_classical in get_orbit_earth_asteroid, at ELEMENTS_EPOCH or
+    propagated to epoch (a Time) if given.
+    """
+
+    r, v = coe2rv(
+        SUN_K,
+        u.Quantity(a, u.AU).to_value(u.km),
+        e,
+        *np.deg2rad([i, om, w, ma]),
     )
-    print(orbit)
+    if epoch is None:
+        return r, v
+    return kepler(SUN_K, r, v, (epoch - ELEMENTS_EPOCH).to_value(u.s))
 
-    return orbit, earth_orbit
 
+def _state(orbit, epoch=None):
+    # unit-free (k, r, v) of an orbit in km^3/s^2, km and km/s, at the
+    # orbit's epoch or propagated to epoch (a Time) if given
+    k = orbit.attractor.k.to_value(u.km**3 / u.s**2)
+    r, v = orbit.r.to_value(u.km), orbit.v.to_value(u.km / u.s)
+    if epoch is None:
+        return k, r, v
+    return (k, *kepler(k, r, v, (epoch - orbit.epoch).to_value(u.s)))
 
-def propagate(earth_orbit, asteroid_orbit, steps=1000):
-    times = np.linspace(0, 365, steps) * u.day
 
-    earth_pos = []
-    asteroid_pos = []
+def _times(steps, days=365, start=0.0):
+    # `steps` times in s over `days` days from start (s after the epoch)
+    return start + np.linspace(0, days, steps) * DAY
 
-    for t in times:
-        dt = t - 0 * u.day
-        earth_future = earth_orbit.propagate(dt)
-        asteroid_future = asteroid_orbit.propagate(dt)
 
-        earth_pos.append(earth_future.r)
-        asteroid_pos.append(asteroid_future.r)
+def _baseline(earth_orbit, asteroid_orbit, steps, spkid=None, days=365, start=0.0):
+    # unperturbed asteroid positions, from baseline_cache if spkid is given;
+    # they only depend on the asteroid's state and the absolute window
+    k, r0, v0 = _state(asteroid_orbit, earth_orbit.epoch)
+    times = _times(steps, days, start)
+    if spkid is None or steps > MAX_CACHED_STEPS:
+        return kepler(k, r0, v0, times)[0]
 
-    earth_pos = np.array(earth_pos)
-    asteroid_pos = np.array(asteroid_pos)
+    key = (spkid, float(earth_orbit.epoch.unix) + start, float(days), steps)
+    positions = baseline_cache.get(key, r0, v0)
+    if positions is None:
+        positions = baseline_cache.put(key, r0, v0, kepler(k, r0, v0, times)[0])
+    return positions
+
+
+def propagate(earth_orbit, asteroid_orbit, steps=1000, spkid=None, days=365, start=0.0):
+    """
+    Returns the positions (steps, 3) of Earth and the asteroid at `steps`
+    times over `days` days, from `start` seconds after the epoch of
+    earth_orbit.
+    """
+
+    earth_pos = earth_ephemeris.positions(earth_orbit, steps, days, start)
+    asteroid_pos = _baseline(earth_orbit, asteroid_orbit, steps, spkid, days, start)
+
+    return earth_pos, asteroid_pos
+
+
+def level_of_detail(
+    earth_orbit,
+    asteroid_orbit,
+    earth_pos,
+    asteroid_pos,
+    tolerance=None,
+    max_points=None,
+    lod=None,
+    spkid=None,
+):
+    """
+    Returns the indices of the samples of a trajectory of propagate kept
+    for a tolerance in km, at most max_points samples and/or a level of
+    detail of LOD_TOLERANCES (see asteroid_lod). The refinement order is
+    kept in lod_cache if spkid is given.
+    """
+
+    if lod is not None:
+        tolerance = max(tolerance or 0.0, LOD_TOLERANCES[lod])
+
+    def build():
+        order, errors = refinement_order(np.stack([earth_pos, asteroid_pos], axis=1))
+        return {"order": order, "errors": errors}
+
+    if spkid is None:
+        refinement = build()
+    else:
+        _, r0, v0 = _state(asteroid_orbit, earth_orbit.epoch)
+        key = (spkid, float(earth_orbit.epoch.unix), len(earth_pos))
+        refinement = lod_cache.get(key, r0, v0)
+        if refinement is None:
+            refinement = lod_cache.put(key, r0, v0, build())
+    return select(refinement["order"], refinement["errors"], tolerance, max_points)
+
+
+def propagate_batch(earth_orbit, r0, v0, steps=1000, days=365, start=0.0):
+    """
+    Returns Earth's positions (steps, 3) and the positions of every
+    asteroid state r0, v0 (n, 3) at the epoch of earth_orbit (see
+    elements_states) over the same times, (n, steps, 3), for the window
+    of propagate.
+    """
+
+    times = _times(steps, days, start)
+
+    earth_pos = earth_ephemeris.positions(earth_orbit, steps, days, start)
+    asteroid_pos, _ = kepler(SUN_K, r0[:, None, :], v0[:, None, :], times)
 
     return earth_pos, asteroid_pos
 
 
 def propagate_impulse(
-    earth_orbit, asteroid_orbit, delta_v_vector, t_maneuver, steps=1000
+    earth_orbit,
+    asteroid_orbit,
+    delta_v_vector,
+    t_maneuver,
+    steps=1000,
+    spkid=None,
+    days=365,
+    start=0.0,
 ):
-    times = np.linspace(0, 365, steps) * u.day
+    """
+    Returns the positions (steps, 3) of Earth and the asteroid as
+    propagate does, with an impulse t_maneuver after the start of the
+    window.
+    """
 
-    earth_pos = []
-    asteroid_pos = []
+    times = _times(steps, days, start)
+    t_maneuver = start + t_maneuver.to_value(u.s)
+    delta_v_vector = u.Quantity(delta_v_vector, u.km / u.s).value
 
-    new_orbit = apply_delta_v(asteroid_orbit, delta_v_vector, t_maneuver)
-    for t in times:
-        dt = t - 0 * u.day
+    earth_pos = earth_ephemeris.positions(earth_orbit, steps, days, start)
 
-        dt_days = dt.to(u.day)
+    # baseline up to the maneuver, only the changed orbit after it is new
+    asteroid_pos = np.array(
+        _baseline(earth_orbit, asteroid_orbit, steps, spkid, days, start)
+    )
+    after = times > t_maneuver
+    if after.any():
+        k, r0, v0 = _state(asteroid_orbit, earth_orbit.epoch)
+        r_m, v_m = kepler(k, r0, v0, t_maneuver)
+        asteroid_pos[after], _ = kepler(
+            k, r_m, v_m + delta_v_vector, times[after] - t_maneuver
+        )
 
-        if dt_days <= t_maneuver:
-            asteroid_future = asteroid_orbit.propagate(dt_days)
-        else:
-            asteroid_future = new_orbit.propagate(dt_days - t_maneuver)
+    return earth_pos, asteroid_pos
 
-        earth_future = earth_orbit.propagate(dt)
 
-        earth_pos.append(earth_future.r)
-        asteroid_pos.append(asteroid_future.r)
+def propagate_chunks(
+    earth_orbit,
+    asteroid_orbit,
+    steps=1000,
+    days=365,
+    start=0.0,
+    delta_v_vector=None,
+    t_maneuver=None,
+    chunk=STREAM_CHUNK,
+):
+    """
+    Yields the trajectories of propagate (or of propagate_impulse with a
+    delta_v_vector and t_maneuver) as (first step, earth_pos,
+    asteroid_pos) blocks of at most chunk steps. Each block is propagated
+    when it is asked for, so memory does not grow with steps.
+    """
+
+    k, r0, v0 = _state(asteroid_orbit, earth_orbit.epoch)
+    _, r_earth, v_earth = _state(earth_orbit)
+    step = days / (steps - 1) * DAY if steps > 1 else 0.0
+    if delta_v_vector is not None:
+        t_maneuver = start + t_maneuver.to_value(u.s)
+        r_m, v_m = kepler(k, r0, v0, t_maneuver)
+        v_m = v_m + u.Quantity(delta_v_vector, u.km / u.s).value
+
+    for first in range(0, steps, chunk):
+        times = start + np.arange(first, min(first + chunk, steps)) * step
+        earth_pos, _ = kepler(k, r_earth, v_earth, times)
+        asteroid_pos, _ = kepler(k, r0, v0, times)
+        if delta_v_vector is not None:
+            after = times > t_maneuver
+            if after.any():
+                asteroid_pos[after], _ = kepler(k, r_m, v_m, times[after] - t_maneuver)
+        yield first, earth_pos, asteroid_pos
+
+
+def deflection_model(earth_orbit, asteroid_orbit, t_maneuver, steps=1000, spkid=None):
+    """
+    Returns the linear deflection model (see asteroid_deflection) for
+    impulses at t_maneuver on the propagate time grid, from
+    deflection_cache if spkid is given.
+    """
+
+    t_maneuver = u.Quantity(t_maneuver, u.day).to_value(u.s)
+    k, r0, v0 = _state(asteroid_orbit, earth_orbit.epoch)
+
+    def build():
+        times = np.linspace(0, 365, steps) * DAY
+        earth_pos = earth_ephemeris.positions(earth_orbit, steps)
+        return linearize(k, r0, v0, t_maneuver, times, earth_pos)
+
+    if spkid is None:
+        return build()
+    key = (spkid, float(earth_orbit.epoch.unix), steps, t_maneuver)
+    model = deflection_cache.get(key, r0, v0)
+    if model is None:
+        model = deflection_cache.put(key, r0, v0, build())
+    return model
+
+
+def preview_deflection(model, delta_v_vectors, exact=False):
+    """
+    Returns the time (days) and distance (km) of the closest approach
+    after the maneuver for every delta-v (m, 3) in km/s, predicted by the
+    linear model, or propagated if exact.
+    """
+
+    miss = exact_miss if exact else preview
+    t, distance = miss(model, u.Quantity(delta_v_vectors, u.km / u.s).value)
+    return t / DAY, distance
+
+
+def optimize_deflection(
+    earth_orbit,
+    asteroid_orbit,
+    budget,
+    levels=5,
+    epochs=24,
+    max_burns=1,
+    directions=256,
+    steps=1000,
+    workers=1,
+):
+    """
+    Returns the nominal closest approach (t, distance) and the Pareto set
+    of deflection plans (see asteroid_optimize.optimize) for a delta-v
+    budget in km/s, with times in days.
+    """
+
+    k, r0, v0 = _state(asteroid_orbit, earth_orbit.epoch)
+    times = np.linspace(0, 365, steps) * DAY
+    earth_pos = earth_ephemeris.positions(earth_orbit, steps)
+
+    (t_nominal, d_nominal), plans = optimize(
+        k,
+        r0,
+        v0,
+        times,
+        earth_pos,
+        u.Quantity(budget, u.km / u.s).value,
+        levels=levels,
+        epochs=epochs,
+        max_burns=max_burns,
+        directions=directions,
+        workers=workers,
+    )
+    for plan in plans:
+        plan["burns"] = [(t / DAY, dv) for t, dv in plan["burns"]]
+        plan["lead_time"] /= DAY
+        plan["t"] /= DAY
 
-    earth_pos = np.array(earth_pos)
-    asteroid_pos = np.array(asteroid_pos)
+    return (t_nominal / DAY, d_nominal), plans
 
-    return earth_pos, asteroid_pos
+
+def close_approach(earth_orbit, asteroid_orbit, days=365, step=0.5):
+    """
+    Returns the MOID of the two orbits in km and the close approaches
+    (see asteroid_approach.close_approaches) in the next `days` days,
+    scanned every `step` days, with t in days.
+    """
+
+    k, r_earth, v_earth = _state(earth_orbit)
+    _, r_ast, v_ast = _state(asteroid_orbit, earth_orbit.epoch)
+
+    distance, _, _ = moid(k, r_earth, v_earth, r_ast, v_ast)
+    approaches = close_approaches(
+        k, r_earth, v_earth, r_ast, v_ast, days * DAY, step * DAY
+    )
+    approaches["t"] = approaches["t"] / DAY
+
+    return distance, approaches
 
 
 def apply_delta_v(asteroid_orbit, delta_v_vector, t_maneuver):
@@ -0,0 +1,376 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from astropy import units as u
+
+from asteroid.asteroid_approach import golden_section, moid
+from asteroid.asteroid_earth import earth_ephemeris
+from asteroid.asteroid_kepler import kepler
+from asteroid.asteroid_load import DB_PATH, read_pool
+from asteroid.asteroid_orbit import DAY, SUN_K, elements_states
+from scheduler import process_map
+
+"""
+    CATALOG SCREENING
+
+    Stores the MOID, synodic period and next close approach of every
+    asteroid in the screening table, rescreening only the asteroids whose
+    elements changed or whose approach has passed. The API rescreens after
+    every catalog refresh that changed rows; after update_db by hand, POST
+    /screening.
+"""
+
+SCREEN_DAYS = 365  # window searched for the closest approach
+SCREEN_STEP = 1.0  # approach scan step in days
+CHUNK = 256  # asteroids per task
+APPROACH_XTOL = 1.0  # s
+
+ORDERS = {
+    "moid": "s.moid",
+    "approach": "s.approach_distance",
+}
+
+
+def init_db(conn):
+    """
+    Creates the screening table and its indexes.
+    """
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS screening (
+            spkid INTEGER PRIMARY KEY,
+            elements TEXT,
+            epoch REAL,
+            moid REAL,
+            synodic_period REAL,
+            approach_time REAL,
+            approach_distance REAL,
+            approach_v_rel REAL,
+            screened TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS screening_moid ON screening (moid)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS screening_approach "
+        "ON screening (approach_distance)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS screening_approach_time "
+        "ON screening (approach_time)"
+    )
+
+
+def elements_key(a, e, i, om, w, ma):
+    """
+    Returns the text a screening row keeps of the elements it used.
+    """
+
+    return ",".join(repr(float(x)) for x in (a, e, i, om, w, ma))
+
+
+def synodic_period(k, r_earth, v_earth, r_ast, v_ast):
+    """
+    Returns the synodic periods (n,) in s of asteroid states (n, 3)
+    with respect to Earth, nan for unbound orbits.
+    """
+
+    def period(r, v):
+        alpha = 2 / np.linalg.norm(r, axis=-1) - np.sum(v * v, axis=-1) / k
+        with np.errstate(invalid="ignore"):
+            return np.where(alpha > 0, 2 * np.pi / np.sqrt(k * alpha**3), np.nan)
+
+    p_earth = period(r_earth, v_earth)
+    p_ast = period(r_ast, v_ast)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        synodic = 1 / np.abs(1 / p_ast - 1 / p_earth)
+    return np.where(np.isfinite(synodic), synodic, np.nan)
+
+
+def closest_approach(k, r_earth, v_earth, r_ast, v_ast, t_max, step):
+    """
+    Returns the time (s), distance (km) and relative speed (km/s) of the
+    closest approach of every asteroid state (n, 3) to Earth between 0
+    and t_max seconds, scanned every step seconds, as arrays (n,).
+    """
+
+    n = max(int(np.ceil(t_max / step)), 2) + 1
+    times = np.linspace(0, t_max, n)
+
+    earth_pos = kepler(k, r_earth, v_earth, times)[0]
+    ast_pos = kepler(k, r_ast[:, None, :], v_ast[:, None, :], times)[0]
+    j = np.argmin(np.sum((ast_pos - earth_pos) ** 2, axis=-1), axis=1)
+
+    def d2(t):
+        return np.sum(
+            (kepler(k, r_ast, v_ast, t)[0] - kepler(k, r_earth, v_earth, t)[0]) ** 2,
+            axis=-1,
+        )
+
+    t, d2_min = golden_section(
+        d2, times[np.maximum(j - 1, 0)], times[np.minimum(j + 1, n - 1)], APPROACH_XTOL
+    )
+    v_rel = np.linalg.norm(
+        kepler(k, r_ast, v_ast, t)[1] - kepler(k, r_earth, v_earth, t)[1], axis=-1
+    )
+    return t, np.sqrt(d2_min), v_rel
+
+
+def _screen_chunk(columns, epoch, r_earth, v_earth, days, step):
+    # (moid, synodic period, approach time, distance, v_rel) per asteroid
+    r_ast, v_ast = elements_states(*columns.T, epoch=epoch)
+    distance = np.array(
+        [moid(SUN_K, r_earth, v_earth, r, v)[0] for r, v in zip(r_ast, v_ast)]
+    )
+    synodic = synodic_period(SUN_K, r_earth, v_earth, r_ast, v_ast) / DAY
+    t, d, v_rel = closest_approach(
+        SUN_K, r_earth, v_earth, r_ast, v_ast, days * DAY, step * DAY
+    )
+    return np.stack([distance, synodic, t, d, v_rel], axis=-1)
+
+
+def _null(x):
+    return None if not np.isfinite(x) else float(x)
+
+
+def screen_catalog(
+    db_path=DB_PATH,
+    earth_orbit=None,
+    force=False,
+    days=SCREEN_DAYS,
+    step=SCREEN_STEP,
+    chunk=CHUNK,
+    workers=1,
+    progress=None,
+):
+    """
+    Screens the asteroids of the catalog that need it (all of them if
+    force) against earth_orbit (the current one by default); see module
+    notes. progress(done, total) is called after every chunk.
+
+    Returns {"screened", "skipped", "removed"} counts.
+    """
+
+    earth_orbit = earth_ephemeris.orbit() if earth_orbit is None else earth_orbit
+    r_earth = earth_orbit.r.to_value(u.km)
+    v_earth = earth_orbit.v.to_value(u.km / u.s)
+    epoch = float(earth_orbit.epoch.unix)
+
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            init_db(conn)
+            removed = conn.execute(
+                "DELETE FROM screening WHERE spkid NOT IN (SELECT spkid FROM asteroids)"
+            ).rowcount
+        rows = conn.execute("""
+            SELECT a.spkid, a.a, a.e, a.i, a.om, a.w, a.ma,
+                   s.elements, s.approach_time
+            FROM asteroids a LEFT JOIN screening s ON s.spkid = a.spkid
+            WHERE a.a IS NOT NULL AND a.e IS NOT NULL AND a.i IS NOT NULL
+              AND a.om IS NOT NULL AND a.w IS NOT NULL AND a.ma IS NOT NULL
+        """).fetchall()
+
+        now = time.time()
+        todo = []
+        for spkid, *elements, old_key, approach_time in rows:
+            key = elements_key(*elements)
+            stale = approach_time is None or approach_time < now
+            if force or stale or key != old_key:
+                todo.append((spkid, elements, key))
+        chunks = [todo[i : i + chunk] for i in range(0, len(todo), chunk)]
+        args = [
+            (
+                np.array([elements for _, elements, _ in part], dtype=np.float64),
+                earth_orbit.epoch,
+                r_earth,
+                v_earth,
+                days,
+                step,
+            )
+            for part in chunks
+        ]
+        results = process_map(_screen_chunk, args, workers)
+
+        done = 0
+        for part, result in zip(chunks, results):
+            screened = datetime.datetime.now().isoformat()
+            with conn:
+                conn.executemany(
+                    f"INSERT OR REPLACE INTO screening VALUES ({', '.join('?' * 9)})",
+                    [
+                        (
+                            spkid,
+                            key,
+                            epoch,
+                            _null(distance),
+                            _null(synodic),
+                            _null(epoch + t),
+                            _null(d),
+                            _null(v_rel),
+                            screened,
+                        )
+                        for (spkid, _, key), (distance, synodic, t, d, v_rel) in zip(
+                            part, result
+                        )
+                    ],
+                )
+            done += len(part)
+            if progress is not None:
+                progress(done, len(todo))
+    finally:
+        conn.close()
+
+    return {"screened": len(todo), "skipped": len(rows) - len(todo), "removed": removed}
+
+
+def hazards(
+    order="moid",
+    limit=50,
+    max_moid=None,
+    max_distance=None,
+    pha=None,
+    upcoming=True,
+):
+    """
+    Returns the screened asteroids with the smallest MOID (order "moid")
+    or closest approach ("approach"), as dicts, optionally limited to a
+    MOID or approach distance in km, to potentially hazardous asteroids
+    and, if upcoming, to approaches that have not passed. Reads through
+    read_pool; the screening table must exist (prepare_db).
+    """
+
+    where, params = [], []
+    if max_moid is not None:
+        where.append("s.moid <= ?")
+        params.append(max_moid)
+    if max_distance is not None:
+        where.append("s.approach_distance <= ?")
+        params.append(max_distance)
+    if pha is not None:
+        where.append("a.pha = ?")
+        params.append(bool(pha))
+    if upcoming:
+        where.append("s.approach_time >= ?")
+        params.append(time.time())
+    column = ORDERS[order]
+    where.append(f"{column} IS NOT NULL")
+
+    with read_pool.connection() as conn:
+        cursor = conn.execute(
+            f"""
+            SELECT s.spkid, a.fullname, a.pha, s.moid, s.synodic_period,
+                   s.approach_time, s.approach_distance, s.approach_v_rel,
+                   s.screened
+            FROM screening s JOIN asteroids a ON a.spkid = s.spkid
+            WHERE {" AND ".join(where)}
+            ORDER BY {column}
+            LIMIT ?
+            """,
+            (*params, limit),
+        )
+        names = [d[0] for d in cursor.description]
+        return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+class ScreeningJob:
+    """
+    Runs screen_catalog in a background thread, one run at a time.
+    """
+
+    def __init__(self, db_path=DB_PATH, workers=1):
+        self.db_path = db_path
+        self.workers = workers
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._again = False  # rescreen once the running screening ends
+        self.state = "idle"  # idle, running, done or failed
+        self.done = 0
+        self.total = 0
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+
+    def _running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def _launch(self, force):
+        # starts a run, with self._lock held
+        self.state = "running"
+        self.done = self.total = 0
+        self.started = time.time()
+        self.finished = self.result = self.error = None
+
+        def progress(done, total):
+            self.done, self.total = done, total
+
+        def run():
+            try:
+                self.result = screen_catalog(
+                    self.db_path,
+                    force=force,
+                    workers=self.workers,
+                    progress=progress,
+                )
+                self.state = "done"
+            except Exception as e:
+                print(f"Screening failed: {e}")
+                self.error = str(e)
+                self.state = "failed"
+            finally:
+                self.finished = time.time()
+                with self._lock:
+                    if self._again:
+                        self._again = False
+                        self._launch(False)
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+
+    def start(self, force=False):
+        """
+        Starts a run unless one is running. Returns whether it started.
+        """
+
+        with self._lock:
+            if self._running():
+                return False
+            self._launch(force)
+            return True
+
+    def rescreen(self):
+        """
+        Screens the catalog after it changed: now, or once the running
+        screening ends, as it may have read the old rows.
+        """
+
+        with self._lock:
+            if self._running():
+                self._again = True
+            else:
+                self._launch(False)
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "done": self.done,
+            "total": self.total,
+            "started": self.started,
+            "finished": self.finished,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+if __name__ == "__main__":
+    print(
+        screen_catalog(
+            workers=os.cpu_count() or 1,
+            progress=lambda done, total: print(f"Screened {done}/{total}"),
+        )
+    )
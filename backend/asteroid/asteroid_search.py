@@ -0,0 +1,143 @@
+import base64
+import json
+
+from asteroid.asteroid_load import read_pool
+
+"""
+    CATALOG SEARCH
+
+    Searches the asteroids table through the indexes of
+    asteroid_load.init_db:
+
+    name        "substring" matches go through the trigram full-text index
+                asteroids_fts (names of 3 characters or more), "prefix"
+                matches through the NOCASE index on fullname
+    pha, a, e, i
+                equality and ranges through the index of each column
+    sort        spkid, fullname, a, e or i, ties broken by spkid
+
+    Pages use keyset pagination: the cursor of a page holds the sort value
+    and SPKID of its last row and the next page starts right after it, so
+    every page costs the same however deep it is.
+"""
+
+SORTS = {
+    "spkid": "a.spkid",
+    "fullname": "a.fullname COLLATE NOCASE",
+    "a": "a.a",
+    "e": "a.e",
+    "i": "a.i",
+}
+RANGES = ("a", "e", "i")
+FIELDS = ("spkid", "fullname", "pha", "a", "e", "i", "om", "w", "ma")
+
+
+def encode_cursor(sort, descending, value, spkid):
+    """
+    Returns the opaque cursor of the row after which the next page starts.
+    """
+
+    raw = json.dumps([sort, descending, value, spkid], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort, descending):
+    """
+    Returns (value, spkid) of a cursor. Raises ValueError if it is invalid
+    or was made for another sort.
+    """
+
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, cursor_descending, value, spkid = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    # only values SQLite can bind, and an integer SPKID
+    if not isinstance(value, (str, int, float, type(None))) or not isinstance(
+        spkid, int
+    ):
+        raise ValueError("invalid cursor")
+    if cursor_sort != sort or cursor_descending != descending:
+        raise ValueError("the cursor belongs to another sort")
+    return value, spkid
+
+
+def _like(text):
+    # text with the LIKE wildcards escaped by a backslash
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search(
+    name=None,
+    match="substring",
+    pha=None,
+    ranges=None,
+    sort="spkid",
+    descending=False,
+    cursor=None,
+    limit=50,
+):
+    """
+    Returns (rows, next cursor) of the asteroids matching a name, a PHA
+    flag and {column: (min, max)} ranges of RANGES (either bound may be
+    None), as dicts of FIELDS sorted by sort. The next cursor is None on
+    the last page.
+    """
+
+    where, params = [], []
+    source = "asteroids a"
+
+    if name:
+        if match == "substring" and len(name) >= 3:
+            source = "asteroids_fts f JOIN asteroids a ON a.spkid = f.rowid"
+            where.append("asteroids_fts MATCH ?")
+            params.append('"' + name.replace('"', '""') + '"')
+        elif match == "substring":
+            where.append("a.fullname LIKE ? ESCAPE '\\'")
+            params.append(f"%{_like(name)}%")
+        else:
+            where.append("a.fullname LIKE ? ESCAPE '\\'")
+            params.append(f"{_like(name)}%")
+
+    if pha is not None:
+        where.append("a.pha = ?")
+        params.append(bool(pha))
+
+    for column, (low, high) in (ranges or {}).items():
+        if column not in RANGES:
+            raise ValueError(f"cannot filter on {column}")
+        if low is not None:
+            where.append(f"a.{column} >= ?")
+            params.append(low)
+        if high is not None:
+            where.append(f"a.{column} <= ?")
+            params.append(high)
+
+    key = SORTS[sort]
+    direction = "DESC" if descending else "ASC"
+    if cursor is not None:
+        value, spkid = decode_cursor(cursor, sort, descending)
+        where.append(f"({key}, a.spkid) {'<' if descending else '>'} (?, ?)")
+        params.extend([value, spkid])
+    where.append(f"{key.split()[0]} IS NOT NULL")
+
+    query = f"""
+        SELECT {", ".join(f"a.{field}" for field in FIELDS)}
+        FROM {source}
+        WHERE {" AND ".join(where)}
+        ORDER BY {key} {direction}, a.spkid {direction}
+        LIMIT ?
+    """
+    with read_pool.connection() as conn:
+        rows = conn.execute(query, (*params, limit + 1)).fetchall()
+
+    rows = [dict(zip(FIELDS, row)) for row in rows]
+    for row in rows:
+        row["pha"] = None if row["pha"] is None else bool(row["pha"])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort, descending, last[sort], last["spkid"])
+    return rows, next_cursor
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+
+from lru import LRUCache
+
+"""
+    BASELINE TRAJECTORY CACHE
+
+    The unperturbed trajectory of an asteroid is the same for /orbit and
+    for every /impulse on it, so it is kept in an LRU cache keyed by
+    (SPKID, start, days, steps) of its window, start being the absolute
+    time (Unix seconds) the window begins at. An entry also remembers
+    the state it was propagated from and is only used for an orbit with
+    that same state, so new elements in the catalog never return an old
+    trajectory. Earth's track is cached per epoch by asteroid_earth.
+
+    Cached trajectories are read-only and shared between callers.
+
+    deflection_cache holds the linear deflection models of
+    asteroid_deflection the same way, keyed by (SPKID, epoch, steps,
+    maneuver time).
+
+    lod_cache holds the refinement order of asteroid_lod for the default
+    window, which depends on both tracks, keyed by (SPKID, epoch, steps).
+
+    orbit_cache holds what get_orbit_earth_asteroid builds from a catalog
+    row (the poliastro Orbit, the name and the elements), keyed by
+    (SPKID, catalog version), so a hot asteroid skips both the database
+    and the Orbit construction until its catalog changes.
+"""
+
+
+class TrajectoryCache(LRUCache):
+    """
+    LRU cache of values computed from an asteroid state; see module notes.
+    """
+
+    def get(self, key, r0, v0):
+        def same_state(entry):
+            return np.array_equal(entry[0], r0) and np.array_equal(entry[1], v0)
+
+        entry = super().get(key, check=same_state)
+        return None if entry is None else entry[2]
+
+    def put(self, key, r0, v0, value):
+        arrays = value.values() if isinstance(value, dict) else [value]
+        for array in arrays:
+            if isinstance(array, np.ndarray):
+                array.flags.writeable = False
+        super().put(key, (np.copy(r0), np.copy(v0), value))
+        return value
+
+
+baseline_cache = TrajectoryCache(
+    maxsize=int(os.getenv("DEJA_TRAJECTORY_CACHE_SIZE", 256))
+)
+deflection_cache = TrajectoryCache(
+    maxsize=int(os.getenv("DEJA_DEFLECTION_CACHE_SIZE", 64))
+)
+lod_cache = TrajectoryCache(maxsize=int(os.getenv("DEJA_LOD_CACHE_SIZE", 256)))
+orbit_cache = LRUCache(maxsize=int(os.getenv("DEJA_ORBIT_CACHE_SIZE", 1024)))
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from astropy import units as u
+from poliastro.bodies import Sun
+from poliastro.twobody import Orbit
+
+from asteroid.asteroid_kepler import coe2rv, kepler
+
+K = Sun.k.to_value(u.km**3 / u.s**2)
+DAY = 86400.0
+
+# (a in AU, e, i, raan, argp, nu in degrees)
+ORBITS = [
+    (1.0, 0.0167, 0.0, 0.0, 102.9, 10.0),
+    (1.458, 0.2227, 10.83, 304.3, 178.9, 310.5),
+    (2.5, 0.9, 30.0, 80.0, 60.0, 200.0),
+    (-1.2, 1.5, 45.0, 10.0, 20.0, 30.0),
+]
+# poliastro 0.7 does not return for tof = 0 on hyperbolic orbits
+TOF = np.array([0.25, 1.0, 17.5, 100.0, 365.25, 800.0, -200.0]) * DAY
+
+
+def classical(a, e, i, raan, argp, nu):
+    return Orbit.from_classical(
+        Sun, a * u.AU, e * u.one, i * u.deg, raan * u.deg, argp * u.deg, nu * u.deg
+    )
+
+
+@pytest.mark.parametrize("elements", ORBITS)
+def test_coe2rv_matches_from_classical(elements):
+    orbit = classical(*elements)
+    a, e, *angles = elements
+    r, v = coe2rv(K, a * u.AU.to(u.km), e, *np.deg2rad(angles))
+
+    np.testing.assert_allclose(r, orbit.r.to_value(u.km), rtol=1e-12, atol=1e-3)
+    np.testing.assert_allclose(v, orbit.v.to_value(u.km / u.s), rtol=1e-12, atol=1e-9)
+
+
+@pytest.mark.parametrize("elements", ORBITS)
+def test_kepler_matches_poliastro(elements):
+    orbit = classical(*elements)
+    r0, v0 = orbit.r.to_value(u.km), orbit.v.to_value(u.km / u.s)
+    r, v = kepler(K, r0, v0, TOF)
+
+    for t, r_t, v_t in zip(TOF, r, v):
+        expected = orbit.propagate(t * u.s)
+        r_ref = expected.r.to_value(u.km)
+        v_ref = expected.v.to_value(u.km / u.s)
+        np.testing.assert_allclose(r_t, r_ref, rtol=0, atol=1e-8 * np.linalg.norm(r_ref))
+        np.testing.assert_allclose(v_t, v_ref, rtol=0, atol=1e-8 * np.linalg.norm(v_ref))
+
+    r, v = kepler(K, r0, v0, 0.0)
+    np.testing.assert_allclose(r, r0, rtol=1e-12)
+    np.testing.assert_allclose(v, v0, rtol=1e-12)
+
+
+def test_kepler_broadcasts_states_against_times():
+    states = [classical(*elements) for elements in ORBITS[:3]]
+    r0 = np.array([orbit.r.to_value(u.km) for orbit in states])
+    v0 = np.array([orbit.v.to_value(u.km / u.s) for orbit in states])
+    r, v = kepler(K, r0[:, None], v0[:, None], TOF)
+
+    assert r.shape == v.shape == (3, len(TOF), 3)
+    for m in range(3):
+        r_m, v_m = kepler(K, r0[m], v0[m], TOF)
+        np.testing.assert_array_equal(r[m], r_m)
+        np.testing.assert_array_equal(v[m], v_m)
@@ -0,0 +1,97 @@
+import json
+import sqlite3
+
+import pytest
+
+from asteroid.asteroid_load import iter_rows, update_db
+
+FIELDS = ["full_name", "spkid", "neo", "pha", "e", "a", "ma", "i", "om", "w"]
+ROWS = [
+    ["   433 Eros (A898 PA)", "2000433", "Y", "N", "0.2227", "1.458", "310.5", "10.83", "304.3", "178.9"],
+    ["  1036 Ganymed (A924 UB)", "2001036", "Y", "N", "0.533", "2.666", "60.2", "26.68", "215.5", "132.4"],
+    ["  99942 Apophis (2004 MN4)", "2099942", "Y", "Y", "0.1914", "0.9224", "142.9", "3.34", "203.9", "126.6"],
+    ["  (2021 ÅÖ) ☃", "54000001", "Y", "N", "0.5", "1.5", "10", "5", "20", "30"],
+]  # fmt: skip
+
+
+def catalog(rows):
+    return {"signature": {"version": "1.0"}, "fields": FIELDS, "data": rows}
+
+
+def chunked(data, size):
+    return [data[i : i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 1 << 16])
+def test_iter_rows_across_chunk_boundaries(size):
+    data = json.dumps(catalog(ROWS), ensure_ascii=False, indent=1).encode()
+    assert list(iter_rows(chunked(data, size))) == ROWS
+
+
+def test_iter_rows_rejects_truncated_catalogs():
+    data = json.dumps(catalog(ROWS)).encode()
+    with pytest.raises(ValueError):
+        list(iter_rows(chunked(data[:-40], 16)))
+    with pytest.raises(ValueError):
+        list(iter_rows([b'{"fields": []}']))
+
+
+def sync(tmp_path, rows, **kwargs):
+    source = tmp_path / "catalog.json"
+    source.write_text(json.dumps(catalog(rows)))
+    return update_db(str(source), str(tmp_path / "asteroid.db"), **kwargs)
+
+
+def stored(tmp_path):
+    with sqlite3.connect(tmp_path / "asteroid.db") as conn:
+        return dict(conn.execute("SELECT spkid, a FROM asteroids").fetchall())
+
+
+def version(tmp_path):
+    with sqlite3.connect(tmp_path / "asteroid.db") as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def test_update_db_writes_only_changes(tmp_path):
+    counts = sync(tmp_path, ROWS)
+    assert counts == {
+        "inserted": 4,
+        "updated": 0,
+        "unchanged": 0,
+        "skipped": 0,
+        "deleted": 0,
+    }
+    assert stored(tmp_path)[2000433] == 1.458
+    assert version(tmp_path) == 1
+
+    assert sync(tmp_path, ROWS)["unchanged"] == 4
+    assert version(tmp_path) == 1
+
+    changed = [row[:] for row in ROWS]
+    changed[0][5] = "1.5"
+    changed[1][5] = "not a number"
+    counts = sync(tmp_path, changed)
+    assert (counts["updated"], counts["unchanged"], counts["skipped"]) == (1, 2, 1)
+    assert stored(tmp_path)[2000433] == 1.5
+    assert version(tmp_path) == 2
+
+
+def test_update_db_deletes_only_when_pruning(tmp_path):
+    sync(tmp_path, ROWS)
+
+    # a local or partial source does not remove rows by default
+    assert sync(tmp_path, ROWS[:2])["deleted"] == 0
+    assert len(stored(tmp_path)) == 4
+
+    assert sync(tmp_path, ROWS[:2], prune=True)["deleted"] == 2
+    assert sorted(stored(tmp_path)) == [2000433, 2001036]
+
+
+def test_update_db_leaves_the_table_on_a_truncated_source(tmp_path):
+    sync(tmp_path, ROWS)
+    source = tmp_path / "catalog.json"
+    source.write_text(json.dumps(catalog(ROWS[:1]))[:-30])
+
+    with pytest.raises(ValueError):
+        update_db(str(source), str(tmp_path / "asteroid.db"), prune=True)
+    assert len(stored(tmp_path)) == 4
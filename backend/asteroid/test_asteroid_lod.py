@@ -0,0 +1,39 @@
+import numpy as np
+
+from asteroid.asteroid_lod import chord_errors, refinement_order, select
+
+
+def track(n=200):
+    t = np.linspace(0, 2 * np.pi, n)
+    return np.stack([np.cos(t), 2 * np.sin(t), 0 * t], axis=1) * 1e6
+
+
+def dropped_error(positions, kept):
+    # largest distance of a dropped sample to the chord of its kept neighbours
+    errors = [0.0]
+    for a, b in zip(kept[:-1], kept[1:]):
+        if b - a > 1:
+            errors.append(chord_errors(positions[:, None, :], a, b).max())
+    return max(errors)
+
+
+def test_select_keeps_every_sample_without_tolerance():
+    line = np.stack([np.arange(10.0), np.zeros(10), np.zeros(10)], axis=1)
+    order, errors = refinement_order(line)
+
+    np.testing.assert_array_equal(select(order, errors, 0), np.arange(10))
+    np.testing.assert_array_equal(select(order, errors), np.arange(10))
+    np.testing.assert_array_equal(select(order, errors, 1.0), [0, 9])
+
+
+def test_select_meets_tolerance_and_max_points():
+    positions = track()
+    order, errors = refinement_order(positions)
+
+    assert order[0] == 0 and order[1] == len(positions) - 1
+    assert sorted(order) == list(range(len(positions)))
+    for tolerance in (1e3, 1e4, 1e5):
+        kept = select(order, errors, tolerance)
+        assert dropped_error(positions, kept) <= tolerance
+    assert len(select(order, errors, 1e3, max_points=20)) == 20
+    assert len(select(order, errors, max_points=1)) == 2
@@ -0,0 +1,94 @@
+import numpy as np
+from astropy import units as u
+from astropy.time import Time
+from poliastro.bodies import Earth, Sun
+from poliastro.twobody import Orbit
+
+from asteroid.asteroid_orbit import (
+    DAY,
+    ELEMENTS_EPOCH,
+    elements_states,
+    propagate,
+    propagate_batch,
+    propagate_chunks,
+    propagate_impulse,
+)
+from asteroid.asteroid_trajectory import baseline_cache
+
+EROS = (1.458, 0.2227, 10.83, 304.3, 178.9, 310.5)
+EARTH = Orbit.from_body_ephem(Earth, Time("2026-10-17T10:00:00", scale="utc"))
+
+
+def eros():
+    a, e, i, om, w, ma = EROS
+    return Orbit.from_classical(
+        Sun,
+        a * u.AU,
+        e * u.one,
+        i * u.deg,
+        om * u.deg,
+        w * u.deg,
+        ma * u.deg,
+        epoch=ELEMENTS_EPOCH,
+    )
+
+
+def test_tracks_are_simultaneous():
+    asteroid = eros()
+    start = 40 * DAY
+    earth_pos, asteroid_pos = propagate(EARTH, asteroid, 50, days=100, start=start)
+
+    for step in (0, 49):
+        epoch = EARTH.epoch + (start + step * 100 / 49 * DAY) * u.s
+        expected = asteroid.propagate(epoch - asteroid.epoch).r.to_value(u.km)
+        np.testing.assert_allclose(asteroid_pos[step], expected, rtol=1e-9)
+        expected = EARTH.propagate(epoch - EARTH.epoch).r.to_value(u.km)
+        np.testing.assert_allclose(earth_pos[step], expected, rtol=1e-9)
+
+
+def test_baseline_cache_is_keyed_on_the_absolute_window():
+    asteroid = eros()
+    baseline_cache.clear()
+    first = propagate(EARTH, asteroid, 20, spkid=-1, days=19)[1]
+    again = propagate(EARTH, asteroid, 20, spkid=-1, days=19)[1]
+    later = Orbit.from_body_ephem(Earth, EARTH.epoch + 1 * u.day)
+    moved = propagate(later, asteroid, 20, spkid=-1, days=19)[1]
+
+    assert again is first
+    assert moved is not first
+    # one step is one day
+    np.testing.assert_allclose(moved[:-1], first[1:], rtol=1e-9)
+    baseline_cache.clear()
+
+
+def test_impulse_and_chunks_match_propagate():
+    asteroid = eros()
+    start = 5 * DAY
+    _, baseline = propagate(EARTH, asteroid, 100, days=100, start=start)
+    _, coasting = propagate_impulse(
+        EARTH, asteroid, [0, 0, 0], 30 * u.day, 100, days=100, start=start
+    )
+    blocks = list(propagate_chunks(EARTH, asteroid, 100, 100, start, chunk=30))
+
+    # coasting through the maneuver is propagated in two legs
+    np.testing.assert_allclose(coasting, baseline, rtol=1e-9)
+    assert [first for first, _, _ in blocks] == [0, 30, 60, 90]
+    np.testing.assert_allclose(
+        np.concatenate([block for _, _, block in blocks]), baseline, rtol=1e-12
+    )
+
+
+def test_batch_matches_single_orbits():
+    r0, v0 = elements_states(*np.array([EROS]).T, epoch=EARTH.epoch)
+    earth_pos, asteroid_pos = propagate_batch(EARTH, r0, v0, 50)
+    earth_single, asteroid_single = propagate(EARTH, eros(), 50)
+
+    np.testing.assert_allclose(earth_pos, earth_single, rtol=1e-12)
+    np.testing.assert_allclose(asteroid_pos[0], asteroid_single, rtol=1e-9)
+
+    window = dict(days=30.0, start=86400.0 * 10)
+    earth_pos, asteroid_pos = propagate_batch(EARTH, r0, v0, 20, **window)
+    earth_single, asteroid_single = propagate(EARTH, eros(), 20, **window)
+
+    np.testing.assert_allclose(earth_pos, earth_single, rtol=1e-12)
+    np.testing.assert_allclose(asteroid_pos[0], asteroid_single, rtol=1e-9)
@@ -0,0 +1,112 @@
+import base64
+import json
+import random
+import sqlite3
+
+import pytest
+
+from asteroid.asteroid_load import init_db, read_pool, upsert
+from asteroid.asteroid_search import SORTS, decode_cursor, encode_cursor, search
+
+NAMES = ["Eros", "Ganymed", "Apophis", "Bennu", "Ryugu", "Didymos", "Itokawa"]
+
+
+@pytest.fixture
+def rows(tmp_path, monkeypatch):
+    rng = random.Random(7)
+    rows = []
+    for n in range(300):
+        name = f"{1000 + n} {rng.choice(NAMES)} ({2000 + n % 30} AB)"
+        # few distinct values, so sorts have many ties
+        a, e, i = rng.choice([1.1, 1.5, 2.2]), rng.random(), rng.choice([5.0, 10.0])
+        rows.append((3000000 + n, name, n % 4 == 0, a, e, i, 10.0, 20.0, 30.0))
+    db_path = tmp_path / "asteroid.db"
+    with sqlite3.connect(db_path) as conn:
+        init_db(conn)
+        upsert(conn, rows)
+
+    read_pool.close()
+    monkeypatch.setattr(read_pool, "db_path", str(db_path))
+    yield rows
+    read_pool.close()
+
+
+def pages(limit, **kwargs):
+    cursor, found = None, []
+    while True:
+        page, cursor = search(cursor=cursor, limit=limit, **kwargs)
+        assert len(page) <= limit
+        found.extend(page)
+        if cursor is None:
+            return found
+
+
+@pytest.mark.parametrize("sort", SORTS)
+@pytest.mark.parametrize("descending", [False, True])
+def test_pages_cover_the_sort_once(rows, sort, descending):
+    column = {"spkid": 0, "fullname": 1, "a": 3, "e": 4, "i": 5}[sort]
+
+    def key(row):
+        value = row[column].lower() if sort == "fullname" else row[column]
+        return value, row[0]
+
+    expected = [row[0] for row in sorted(rows, key=key, reverse=descending)]
+    found = pages(17, sort=sort, descending=descending)
+    assert [row["spkid"] for row in found] == expected
+
+
+def test_filters_and_names(rows):
+    found = pages(10, name="eros", pha=True, ranges={"a": (1.2, None)})
+    expected = {
+        row[0] for row in rows if "Eros" in row[1] and row[2] and row[3] >= 1.2
+    }
+    assert {row["spkid"] for row in found} == expected
+    assert all(row["pha"] is True for row in found)
+
+    prefix = pages(50, name="101", match="prefix")
+    assert {row["spkid"] for row in prefix} == {
+        row[0] for row in rows if row[1].startswith("101")
+    }
+    # names shorter than a trigram fall back to LIKE
+    short = pages(50, name="yu")
+    assert {row["spkid"] for row in short} == {
+        row[0] for row in rows if "yu" in row[1].lower()
+    }
+
+
+def crafted(*fields):
+    raw = json.dumps(fields).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+@pytest.mark.parametrize(
+    "cursor",
+    [
+        crafted("a", False, 1.5, None),
+        crafted("a", False, 1.5, "x"),
+        crafted("a", False, 1.5, 2.5),
+        crafted("a", False, [1.5], 3000001),
+        crafted("a", False, {"a": 1.5}, 3000001),
+        crafted("a", False, 1.5),
+        crafted(["a"]),
+    ],
+)
+def test_crafted_cursors_are_invalid(rows, cursor):
+    with pytest.raises(ValueError, match="invalid cursor"):
+        decode_cursor(cursor, "a", False)
+    with pytest.raises(ValueError):
+        search(sort="a", cursor=cursor)
+
+
+def test_cursors(rows):
+    page, cursor = search(sort="a", limit=5)
+    value, spkid = decode_cursor(cursor, "a", False)
+    assert (value, spkid) == (page[-1]["a"], page[-1]["spkid"])
+    assert cursor == encode_cursor("a", False, value, spkid)
+
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, "e", False)
+    with pytest.raises(ValueError):
+        decode_cursor("not a cursor", "a", False)
+    with pytest.raises(ValueError):
+        search(ranges={"om": (0, 1)})
@@ -0,0 +1,240 @@
+import io
+import json
+
+import numpy as np
+
+"""
+    Binary encodings for array heavy responses.
+
+    Clients opt in through the Accept header:
+        application/octet-stream   raw little-endian buffers, one per array,
+                                   each starting on an 8 byte boundary
+        application/x-npy          a single .npy file holding a structured
+                                   array with one field per column
+    A dtype parameter (float32 or float64, default float64) picks the float
+    width, e.g. "Accept: application/octet-stream; dtype=float32".
+
+    Endpoints that return positions also take dtype=int32: positions are
+    then quantized to integer multiples of a scale (the scale parameter in
+    km, 1 by default, raised if a value would not fit), and with delta=1
+    each value but the first is stored as the difference to the previous
+    one. The layout gives the scale and delta of every quantized column;
+    x = scale * q, or scale * cumsum(q) for delta columns.
+
+    The layout of the body and any scalar values are sent as JSON in the
+    X-Deja-Layout header. Metadata that can grow with the request (e.g.
+    the ids of a batch) goes into the body instead, as a JSON preamble
+    padded with spaces to 8 bytes; the header gives its length as
+    "preamble" and the offsets of the columns count from the start of
+    the body, for npy the offset of the .npy file.
+
+    Long trajectories can instead be streamed as they are computed:
+        application/x-ndjson       one JSON object per line
+        text/event-stream          one server-sent event per object,
+                                   followed by an "end" event
+"""
+
+OCTET_STREAM = "application/octet-stream"
+NPY = "application/x-npy"
+LAYOUT_HEADER = "X-Deja-Layout"
+NDJSON = "application/x-ndjson"
+EVENT_STREAM = "text/event-stream"
+
+FLOAT_DTYPES = {"float32": "<f4", "float64": "<f8"}
+QUANTIZED_DTYPE = "<i4"
+QUANTIZED_MAX = 2**30 - 1  # largest quantized value, so deltas fit as well
+
+
+def negotiate(accept):
+    """
+    Returns (media_type, float dtype) for a binary Accept header,
+    or None if the client did not ask for a binary encoding.
+    """
+
+    if not accept:
+        return None
+
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        if media_type not in (OCTET_STREAM, NPY):
+            continue
+        dtype = FLOAT_DTYPES["float64"]
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "dtype" and value.strip() in FLOAT_DTYPES:
+                dtype = FLOAT_DTYPES[value.strip()]
+        return media_type, dtype
+    return None
+
+
+def _params(accept, media_types):
+    # {param: value} of the first item of an Accept header in media_types
+    for item in accept.split(","):
+        media_type, *params = [part.strip() for part in item.split(";")]
+        if media_type in media_types:
+            pairs = [param.partition("=") for param in params]
+            return {key.strip(): value.strip() for key, _, value in pairs}
+    return None
+
+
+def quantization(accept):
+    """
+    Returns {"scale", "delta"} if a binary Accept header asks for int32
+    positions, otherwise None.
+    """
+
+    if not accept:
+        return None
+
+    params = _params(accept, (OCTET_STREAM, NPY))
+    if params is None or params.get("dtype") != "int32":
+        return None
+    try:
+        scale = float(params.get("scale", 1.0))
+    except ValueError:
+        scale = 1.0
+    if not np.isfinite(scale) or scale <= 0:
+        scale = 1.0
+    return {"scale": scale, "delta": params.get("delta") == "1"}
+
+
+def quantize(col, scale=1.0, delta=False):
+    """
+    Returns (q, scale) with col ~ scale * q (or scale * cumsum(q) if
+    delta) as int32, the scale raised where needed to fit.
+    """
+
+    col = np.asarray(col, dtype=np.float64)
+    largest = float(np.max(np.abs(col))) if len(col) else 0.0
+    scale = max(scale, largest / QUANTIZED_MAX)
+    q = np.round(col / scale).astype(np.int64)
+    if delta and len(q):
+        q = np.diff(q, prepend=0)
+    limits = np.iinfo(QUANTIZED_DTYPE)
+    if len(q) and (q.min() < limits.min or q.max() > limits.max):
+        raise OverflowError("quantized values do not fit in int32")
+    return q.astype(QUANTIZED_DTYPE), scale
+
+
+def _column_dtype(col, float_dtype):
+    if np.issubdtype(col.dtype, np.integer):
+        return col.dtype.newbyteorder("<")
+    return np.dtype(float_dtype)
+
+
+def encode_preamble(meta):
+    """
+    Returns the JSON preamble of a body holding meta, padded with spaces
+    to a multiple of 8 bytes.
+    """
+
+    data = json.dumps(meta, separators=(",", ":")).encode()
+    return data + b" " * (-len(data) % 8)
+
+
+def encode_columns(columns, media_type, float_dtype="<f8", quantized=None, offset=0):
+    """
+    Encodes a dict of equal length 1-D arrays (None columns are skipped).
+    quantized is a quantization() result and a list of the columns it
+    applies to, as (quantization, names). offset is the length of the
+    preamble that will precede body, if any.
+
+    Returns (body, layout) where layout lists every column as
+    {name, dtype, offset, length}, plus scale and delta for quantized
+    columns; offsets are in bytes into the preamble and body together,
+    and for npy, where the columns are fields of one structured array,
+    all give the start of the .npy file.
+    """
+
+    columns = {
+        name: np.asarray(col) for name, col in columns.items() if col is not None
+    }
+    scales = {}
+    if quantized is not None:
+        params, names = quantized
+        for name in names:
+            if name in columns:
+                columns[name], scales[name] = quantize(
+                    columns[name], params["scale"], params["delta"]
+                )
+    dtypes = {name: _column_dtype(col, float_dtype) for name, col in columns.items()}
+
+    def describe(name, offset, length):
+        entry = {
+            "name": name,
+            "dtype": dtypes[name].str,
+            "offset": offset,
+            "length": length,
+        }
+        if name in scales:
+            entry.update(scale=scales[name], delta=quantized[0]["delta"])
+        return entry
+
+    if media_type == NPY:
+        n = len(next(iter(columns.values()))) if columns else 0
+        table = np.empty(n, dtype=[(name, dtypes[name]) for name in columns])
+        for name, col in columns.items():
+            table[name] = col
+        buffer = io.BytesIO()
+        np.save(buffer, table, allow_pickle=False)
+        layout = [describe(name, offset, n) for name in columns]
+        return buffer.getvalue(), layout
+
+    chunks = []
+    layout = []
+    for name, col in columns.items():
+        data = col.astype(dtypes[name], copy=False).tobytes()
+        layout.append(describe(name, offset, len(col)))
+        padding = -len(data) % 8
+        chunks.append(data + b"\0" * padding)
+        offset += len(data) + padding
+    return b"".join(chunks), layout
+
+
+def layout_header(layout, **scalars):
+    """
+    Returns the X-Deja-Layout header value for a binary response.
+    Non finite scalars are sent as null, as in the JSON responses.
+    """
+
+    def finite(x):
+        if isinstance(x, float) and not np.isfinite(x):
+            return None
+        return x
+
+    return json.dumps(
+        {"columns": layout, **{key: finite(value) for key, value in scalars.items()}},
+        separators=(",", ":"),
+    )
+
+
+def negotiate_stream(accept):
+    """
+    Returns the streaming media type of an Accept header, or None if the
+    client did not ask for a stream.
+    """
+
+    if not accept:
+        return None
+
+    for item in accept.split(","):
+        media_type = item.split(";")[0].strip()
+        if media_type in (NDJSON, EVENT_STREAM):
+            return media_type
+    return None
+
+
+def stream_records(records, media_type):
+    """
+    Encodes an iterator of JSON serializable dicts as NDJSON lines or
+    server-sent events, one at a time.
+    """
+
+    for record in records:
+        data = json.dumps(record, separators=(",", ":"))
+        if media_type == EVENT_STREAM:
+            yield f"data: {data}\n\n"
+        else:
+            yield data + "\n"
+    if media_type == EVENT_STREAM:
+        yield "event: end\ndata: {}\n\n"
@@ -1,5 +1,7 @@
 import math
 
+import numpy as np
+
 R_earth = 6371000.0  # Earth's radius in m
 G = 9.81  # Gravity of Earth in m/s^2
 RHO_W = 1025.0  # Seawater density in kg/m^3
@@ -367,14 +369,234 @@ def peak_vel(p, P0=101325, c0=343):
 # ----------------- 8. TSUNAMI (TBC) ---------------------
 
 
+# ------------- 9. EFFECTS OVER A DISTANCE AXIS -----------------
+"""
+    Array versions of the distance dependent effects above.
+    r is a numpy array of distances in km; every function evaluates
+    the whole axis at once and returns the same values as its scalar
+    counterpart (inf at r = 0 where the scalar version returns inf).
+"""
+
+MMI_SCALE = np.array(
+    ["-", "I", "I-II", "III-IV", "IV-V", "VI-VII", "VII-VIII", "IX-X", "X-XI", "XII"]
+)
+
+
+DEFAULT_DISTANCES = np.arange(0, 20000, 1)
+
+
+def distance_axis(r_min, r_max, n, spacing="linear"):
+    """
+    Returns n distances in km from r_min to r_max (both included),
+    spaced evenly ("linear") or evenly in log10 ("log", needs r_min > 0).
+    """
+
+    if spacing == "log":
+        return np.geomspace(r_min, r_max, n)
+    return np.linspace(r_min, r_max, n)
+
+
+def thermal_exposure_array(E, r, K=3e-3):
+    """
+    Array version of thermal_exposure (Eq 10).
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        theta = (K * E) / (2 * math.pi * (r * 1000) ** 2)
+    return np.where(r == 0, np.inf, theta)
+
+
+def effective_magnitude_array(M, r):
+    """
+    Array version of effective_magnitude (Eq 12a-c).
+    """
+
+    with np.errstate(divide="ignore"):
+        far = M - 1.66 * np.log10(r * 1000 / R_earth) - 6.399
+    return np.where(
+        r < 60, M - 0.0238 * r, np.where(r < 700, M - (0.0048 * r - 1.1644), far)
+    )
+
+
+def effective_mmi_array(M_eff):
+    """
+    Returns the MMI index (0-9, see MMI_SCALE) for an array of effective magnitudes.
+    """
+
+    return np.minimum(9, np.floor(np.maximum(0.0, M_eff))).astype(np.int8)
+
+
+def ejecta_thickness_array(D_tc, r):
+    """
+    Array version of ejecta_thickness (Eq 13).
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_e = D_tc**4 / (112 * (r * 1000) ** 3)
+    return np.where(r == 0, np.inf, t_e)
+
+
+def mean_ejecta_size_array(D_fr, r, alpha=2.65):
+    """
+    Array version of mean_ejecta_size (Eq 14a-b).
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        D_e = 2400 * (D_fr / 1000) ** -1.62 * ((D_fr / 1000) / (2 * r)) ** alpha
+    return np.where(r == 0, np.inf, D_e)
+
+
+def scaled_dist_array(r, E):
+    """
+    Array version of scaled_dist (Eq 15).
+    """
+
+    E_kT = joules2ktons(E)
+    return r * 1000 / E_kT ** (1 / 3)
+
+
+def surface_blast_array(r1, px=75000, rx=290):
+    """
+    Array version of surface_blast (Eq 16).
+    """
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = ((px * rx) / (4 * r1)) * (1 + 3 * ((rx / r1) ** 1.3))
+    return np.where(r1 == 0, np.inf, p)
+
+
+def airblast_array(r1, zb):
+    """
+    Array version of airblast (Eq 17a-c).
+    """
+
+    p0 = 3.14e11 * zb**-2.6
+    beta = 34.87 * zb**-1.73
+    return p0 * np.exp(-beta * r1)
+
+
+def peak_vel_array(p, P0=101325, c0=343):
+    """
+    Array version of peak_vel (Eq 18).
+    """
+
+    factor = (5.0 * p) / (7.0 * P0)
+    denom_sqrt = np.sqrt(1.0 + (6.0 * p) / (7.0 * P0))
+    with np.errstate(invalid="ignore"):
+        return factor * c0 / denom_sqrt
+
+
+def blast_array(r, E, zb, E_ground, E_air):
+    """
+    Returns the peak overpressure in Pa at every distance in r (km),
+    from surface_blast for crater impacts and the Mach reflection region
+    and from airblast otherwise.
+    """
+
+    dist = scaled_dist_array(r, E)
+    if zb == 0:
+        return surface_blast_array(dist)
+    if E_ground > E_air:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rm1 = (550 * dist) / (1.2 * (550 - dist))
+        return np.where(dist < rm1, surface_blast_array(dist), airblast_array(dist, zb))
+    return airblast_array(dist, zb)
+
+
+EFFECT_FIELDS = (
+    "thermal_exposure",
+    "effective_magnitude",
+    "effective_mmi",
+    "ejecta_thickness",
+    "mean_ejecta_size",
+    "surface_blast",
+    "peak_wind_vel",
+)
+
+
+def r_effects_table(r, E, M, zb, D_tc, D_fr, E_ground, E_air, fields=None):
+    """
+    Returns the effects at every distance in r (km) as a dict of arrays.
+
+    Columns are the same as the per distance dicts of main, except
+    effective_mmi which is the MMI_SCALE index. Columns that do not
+    apply to the scenario (no seismic magnitude, no crater) are None.
+    fields limits the table to those EFFECT_FIELDS (plus distance);
+    effects that are not asked for are not computed.
+    """
+
+    r = np.asarray(r, dtype=np.float64)
+    if fields is None:
+        fields = EFFECT_FIELDS
+    table = {"distance": r}
+
+    for key in EFFECT_FIELDS:
+        if key in fields:
+            table[key] = None
+
+    if "thermal_exposure" in fields:
+        table["thermal_exposure"] = thermal_exposure_array(E, r)
+
+    if M is not None and ("effective_magnitude" in fields or "effective_mmi" in fields):
+        effective_M = effective_magnitude_array(M, r)
+        if "effective_magnitude" in fields:
+            table["effective_magnitude"] = effective_M
+        if "effective_mmi" in fields:
+            table["effective_mmi"] = effective_mmi_array(effective_M)
+
+    if zb == 0:
+        if "ejecta_thickness" in fields:
+            table["ejecta_thickness"] = ejecta_thickness_array(D_tc, r)
+        if "mean_ejecta_size" in fields:
+            table["mean_ejecta_size"] = mean_ejecta_size_array(D_fr, r)
+
+    if "surface_blast" in fields or "peak_wind_vel" in fields:
+        blast = blast_array(r, E, zb, E_ground, E_air)
+        if "surface_blast" in fields:
+            table["surface_blast"] = blast
+        if "peak_wind_vel" in fields:
+            table["peak_wind_vel"] = peak_vel_array(blast)
+
+    return table
+
+
+def r_effects_rows(table):
+    """
+    Returns the r_effects_table columns as one dict per distance,
+    keyed by distance, with effective_mmi as its MMI_SCALE string.
+    """
+
+    n = len(table["distance"])
+    rows = {
+        key: [None] * n if col is None else col.tolist()
+        for key, col in table.items()
+        if key != "distance"
+    }
+    if table.get("effective_mmi") is not None:
+        rows["effective_mmi"] = MMI_SCALE[table["effective_mmi"]].tolist()
+    keys = tuple(rows)
+    distances = [int(r) if r.is_integer() else r for r in table["distance"].tolist()]
+    return {r: dict(zip(keys, row)) for r, row in zip(distances, zip(*rows.values()))}
+
+
 # ------------------- MAIN -----------------------------
-def main(L0, Ui, v0, T, Uj):
+def scenario(L0, Ui, v0, T, Uj):
+    """
+    Returns the entry, breakup and crater results of an impact as a dict.
+
+    Besides the values returned by main it holds what the distance
+    dependent effects need: E (energy driving the effects in J),
+    M (seismic magnitude, None for airbursts) and D_tc (transient
+    crater diameter in m, None for airbursts).
+    """
+
     E0 = k_energy(L0, Ui, v0)
     zb = 0.0
     v_ground = None
     crater_diamater = None
     crater_depth = None
     fball_radius = 0.0
+    D_tc = None
     M = None
     E = 0.0
     E_ground = None
@@ -421,64 +643,51 @@ def main(L0, Ui, v0, T, Uj):
         fball_radius = fireball_radius(E)
         M = seismic_magnitude(E)
 
-    r_effects = dict()
-
-    ricter_to_mmi = {
-        0: "-",
-        1: "I",
-        2: "I-II",
-        3: "III-IV",
-        4: "IV-V",
-        5: "VI-VII",
-        6: "VII-VIII",
-        7: "IX-X",
-        8: "X-XI",
-        9: "XII",
+    return {
+        "E0": E0,
+        "E_ground": E_ground,
+        "E_air": E_air,
+        "v_ground": v_ground,
+        "crater_diamater": crater_diamater,
+        "crater_depth": crater_depth,
+        "fball_radius": fball_radius,
+        "z_star": z_star,
+        "zb": zb,
+        "E": E,
+        "M": M,
+        "D_tc": D_tc,
     }
 
-    for r in range(0, 20000, 1):
-        thermal = thermal_exposure(E, r)
-        thickness = None
-        mean_size = None
-        effective_M = None
-        mmi = None
-        if M is not None:
-            effective_M = effective_magnitude(M, r)
-            mmi = ricter_to_mmi[min(9, math.floor(max(float(0), effective_M)))]
-
-        if zb == 0:
-            thickness = ejecta_thickness(D_tc, r)
-            mean_size = mean_ejecta_size(crater_diamater, r)
-        dist = scaled_dist(r, E)
-        rm1 = (550 * scaled_dist(r, E)) / (1.2 * (550 - scaled_dist(r, E)))
-        blast = 0.0
-        if (E_ground > E_air and dist < rm1) or zb == 0:
-            blast = surface_blast(dist)
-        else:
-            blast = airblast(dist, zb)
 
-        peak_wind_vel = peak_vel(blast)
+def main(L0, Ui, v0, T, Uj, columns=False, r=None, fields=None):
+    sc = scenario(L0, Ui, v0, T, Uj)
+
+    if r is None:
+        r = DEFAULT_DISTANCES
+    table = r_effects_table(
+        r,
+        sc["E"],
+        sc["M"],
+        sc["zb"],
+        sc["D_tc"],
+        sc["crater_diamater"],
+        sc["E_ground"],
+        sc["E_air"],
+        fields,
+    )
 
-        r_effects[r] = {
-            "thermal_exposure": thermal,
-            "effective_magnitude": effective_M,
-            "effective_mmi": mmi,
-            "ejecta_thickness": thickness,
-            "mean_ejecta_size": mean_size,
-            "surface_blast": blast,
-            "peak_wind_vel": peak_wind_vel,
-        }
+    r_effects = table if columns else r_effects_rows(table)
 
     return (
-        E0,
-        E_ground,
-        E_air,
-        v_ground,
-        crater_diamater,
-        crater_depth,
-        fball_radius,
-        z_star,
-        zb,
+        sc["E0"],
+        sc["E_ground"],
+        sc["E_air"],
+        sc["v_ground"],
+        sc["crater_diamater"],
+        sc["crater_depth"],
+        sc["fball_radius"],
+        sc["z_star"],
+        sc["zb"],
         r_effects,
     )
 
@@ -0,0 +1,197 @@
+import numpy as np
+
+from impact.impact import G, breakup_strength, deg2rad, fireball_radius, k_energy
+
+"""
+    BATCH SCENARIOS
+
+    Array versions of the entry, breakup and crater pipeline of
+    impact.scenario. Every input is a 1-D array (or a scalar, broadcast
+    against the others) with one element per impactor, and every branch
+    of scenario is evaluated for all rows and then picked with masks:
+
+        airburst:     z* != 0 and zb != 0
+        pancake:      z* != 0 and zb == 0 (ground impact after breakup)
+        intact:       z* == 0
+    Values that scenario leaves as None (no crater for an airburst, ...)
+    are nan here.
+"""
+
+
+def altitude_of_breakup_batch(L0, v0, Ui, T, C_D=1.0, H=8000, p0=1.2250):
+    """
+    Array version of altitude_of_breakup (Eq 4a-b), 0 where If is outside (0, 1).
+    """
+
+    Yi = breakup_strength(Ui)
+    If = 4.07 * (C_D * H * Yi) / (Ui * L0 * v0**2 * np.sin(deg2rad(T)))
+    breaks = (If < 1) & (If > 0)
+    z_star = -H * (
+        np.log(Yi / (p0 * v0**2))
+        + 1.308
+        + 0.314 * If
+        - 1.303 * np.sqrt(np.where(breaks, 1 - If, 0.0))
+    )
+    return np.where(breaks, z_star, 0.0)
+
+
+def _l_disp(L0, z_star, Ui, T, H=8000, C_D=1.0):
+    # Eq 5b/6b/7*c: l = L0*sinT*sqrt(Ui/(C_D*exp(-z*/H))
+    return L0 * np.sin(deg2rad(T)) * np.sqrt(Ui / (C_D * np.exp(-z_star / H)))
+
+
+def complete_breakup_height_batch(L0, z_star, Ui, T, H=8000, C_D=1.0, ratio=3):
+    """
+    Array version of complete_breakup_height (Eq 5a), 0 where z <= 0.
+    """
+
+    l_disp = _l_disp(L0, z_star, Ui, T, H, C_D)
+    z = z_star - 2 * H * np.log(1 + (l_disp / (2 * H)) * np.sqrt(ratio**2 - 1))
+    return np.where(z <= 0, 0.0, z)
+
+
+def length_at_alt_batch(L0, z_star, Ui, T, z, H=8000, C_D=1.0):
+    """
+    Array version of length_at_alt (Eq 6a).
+    """
+
+    l_disp = _l_disp(L0, z_star, Ui, T, H, C_D)
+    return L0 * np.sqrt(
+        1 + (2 * H / l_disp) ** 2 * (np.exp((z_star - z) / (2 * H)) - 1) ** 2
+    )
+
+
+def v_at_altitude_batch(v0, L0, Ui, T, z, C_D=1.0, p0=1.2250, H=8000):
+    """
+    Array version of v_at_altitude (Eq 2), v0 where sin(T) == 0.
+    """
+
+    sin_T = np.sin(deg2rad(T))
+    v = v0 * np.exp(-(3 * C_D * H * p0) / (4 * Ui * L0 * sin_T) * np.exp(-z / H))
+    return np.where(sin_T == 0, v0, v)
+
+
+def swarm_velocity_at_alt_batch(v0, L0, z_star, Ui, T, z, H=8000, C_D=1.0, ratio=3):
+    """
+    Array version of swarm_velocity_at_alt (Eq 7*a-d).
+    """
+
+    vel_at_z_star = v_at_altitude_batch(v0, L0, Ui, T, z_star)
+    l_disp = _l_disp(L0, z_star, Ui, T, H, C_D)
+    alpha = np.sqrt(ratio**2 - 1)
+    factor = (
+        ((l_disp * L0**2) / 24)
+        * alpha
+        * (8 * (3 + alpha**2) + 3 * alpha * (l_disp / H) * (2 + alpha**2))
+    )
+    return vel_at_z_star * np.exp(
+        -3
+        / 4
+        * ((C_D * np.exp(-z_star / H)) / (Ui * L0**3 * np.sin(deg2rad(T))))
+        * factor
+    )
+
+
+def transient_crater_diameter_batch(L0, Ui, Uj, v, T, target_is_water=False):
+    """
+    Array version of transient_crater_diameter (Eq 5a).
+    """
+
+    C = 1.365 if target_is_water else 1.161
+    return (
+        C
+        * (Ui / Uj) ** (1 / 3.0)
+        * L0**0.78
+        * v**0.44
+        * G**-0.22
+        * np.sin(deg2rad(T)) ** (1 / 3.0)
+    )
+
+
+def final_crater_diameter_batch(D_tc):
+    """
+    Array version of final_crater_diameter (Eq 6ab).
+    """
+
+    return np.where(D_tc < 2560, 1.2 * D_tc, 1.17 * D_tc**1.13 * 3200**-0.13)
+
+
+def crater_depth_batch(D_tc, D_fr):
+    """
+    Returns simple_crater_depth (Eq 8) for D_tc < 2560 m and
+    complex_crater_depth (Eq 7) otherwise.
+    """
+
+    return np.where(D_tc < 2560, 0.20 * D_fr, 294 * (D_fr / 1000) ** 0.301)
+
+
+def scenario_batch(L0, Ui, v0, T, Uj):
+    """
+    Returns impact.scenario for every row of the inputs as a dict of arrays.
+    """
+
+    L0, Ui, v0, T, Uj = np.broadcast_arrays(
+        *(np.asarray(x, dtype=np.float64) for x in (L0, Ui, v0, T, Uj))
+    )
+
+    with np.errstate(all="ignore"):
+        E0 = k_energy(L0, Ui, v0)
+
+        z_star = altitude_of_breakup_batch(L0, v0, Ui, T)
+        broke = z_star != 0
+        zb = np.where(broke, complete_breakup_height_batch(L0, z_star, Ui, T), 0.0)
+        airburst = broke & (zb != 0)
+        pancake = broke & (zb == 0)
+
+        # energy at zb for airbursts, velocity at the ground otherwise
+        v_end = np.where(
+            airburst,
+            swarm_velocity_at_alt_batch(v0, L0, z_star, Ui, T, zb),
+            np.where(
+                pancake,
+                swarm_velocity_at_alt_batch(v0, L0, z_star, Ui, T, 0.0),
+                v_at_altitude_batch(v0, L0, Ui, T, 0.0),
+            ),
+        )
+        E_end = E0 * (v_end / v0) ** 2
+
+        E_ground = np.where(airburst, 0.0, E_end)
+        E_air = np.where(airburst, E_end, E0 - E_end)
+        E = np.where(pancake, np.maximum(E_air, E_ground), E_end)
+        v_ground = np.where(airburst, np.nan, v_end)
+
+        L = np.where(pancake, length_at_alt_batch(L0, z_star, Ui, T, 0.0), L0)
+        D_tc = transient_crater_diameter_batch(L, Ui, Uj, v_end, T)
+        D_tc = np.where(airburst, np.nan, D_tc)
+        crater_diamater = final_crater_diameter_batch(D_tc)
+        crater_depth = crater_depth_batch(D_tc, crater_diamater)
+
+        fball_radius = np.where(airburst, 0.0, fireball_radius(E_ground))
+        # Eq 11, seismic_magnitude
+        M = np.where(E_ground == 0, -999.0, 0.67 * np.log10(E_ground) - 5.87)
+        M = np.where(airburst, np.nan, M)
+
+    return {
+        "E0": E0,
+        "E_ground": E_ground,
+        "E_air": E_air,
+        "v_ground": v_ground,
+        "crater_diamater": crater_diamater,
+        "crater_depth": crater_depth,
+        "fball_radius": fball_radius,
+        "z_star": z_star,
+        "zb": zb,
+        "E": E,
+        "M": M,
+        "D_tc": D_tc,
+    }
+
+
+def parameter_grid(L0, Ui, v0, T, Uj):
+    """
+    Returns every combination of the given value lists as five equal
+    length arrays, L0 varying slowest and Uj fastest.
+    """
+
+    mesh = np.meshgrid(L0, Ui, v0, T, Uj, indexing="ij")
+    return tuple(m.ravel() for m in mesh)
@@ -0,0 +1,195 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from impact.impact import main
+from lru import LRUCache
+
+"""
+    RESULT CACHE
+
+    An LRU cache (lru.LRUCache) in front of impact.main, bounded by entry
+    count, bytes and age (TTL). Inputs are normalized to SIG_DIGITS
+    significant digits before they are used as the key *and* fed to main,
+    so every key maps to exactly one result no matter which request
+    computed it first.
+
+    With a db_path the entries are also written to a SQLite file, so
+    warm results survive restarts; a memory miss then checks the file.
+"""
+
+SIG_DIGITS = 6
+CACHE_DB_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "impact_cache.db"
+)
+
+
+def normalize(x, digits=SIG_DIGITS):
+    """
+    Returns x rounded to digits significant digits.
+    """
+
+    return float(f"{x:.{digits}g}")
+
+
+def distances_key(r):
+    """
+    Returns a short key for a distance axis, "default" for None.
+    """
+
+    if r is None:
+        return "default"
+    r = np.ascontiguousarray(r, dtype=np.float64)
+    return hashlib.sha1(r.tobytes()).hexdigest()
+
+
+def _nbytes(result):
+    return sum(col.nbytes for col in result[9].values() if col is not None)
+
+
+def _dump(result):
+    # the column names keep the order and the None columns of the table
+    scalars = json.dumps([result[:9], list(result[9])])
+    buffer = io.BytesIO()
+    np.savez(buffer, **{key: col for key, col in result[9].items() if col is not None})
+    return scalars, buffer.getvalue()
+
+
+def _load(scalars, blob):
+    scalars, keys = json.loads(scalars)
+    with np.load(io.BytesIO(blob), allow_pickle=False) as columns:
+        table = {key: columns[key] if key in columns else None for key in keys}
+    return (*scalars, table)
+
+
+def _freeze(result):
+    for col in result[9].values():
+        if col is not None:
+            col.flags.writeable = False
+    return result
+
+
+class ImpactCache:
+    """
+    Caches impact.main(..., columns=True) results; see module notes.
+    """
+
+    def __init__(
+        self,
+        maxsize=256,
+        max_bytes=256 * 2**20,
+        ttl=3600.0,
+        db_path=None,
+        db_rows=10000,
+    ):
+        self.ttl = ttl
+        self.db_path = db_path
+        self.db_rows = db_rows
+
+        self._memory = LRUCache(maxsize, max_bytes, ttl)
+        self._lock = threading.Lock()
+        self.disk_hits = 0
+
+        if db_path is not None:
+            with self._db() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS impact_cache (
+                        key TEXT PRIMARY KEY,
+                        created REAL,
+                        scalars TEXT,
+                        columns BLOB
+                    )
+                """)
+                conn.execute(
+                    "DELETE FROM impact_cache WHERE created < ?", (time.time() - ttl,)
+                )
+
+    @contextmanager
+    def _db(self):
+        conn = sqlite3.connect(self.db_path, timeout=5)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def key(self, L0, Ui, v0, T, Uj, r=None, fields=None):
+        inputs = tuple(normalize(x) for x in (L0, Ui, v0, T, Uj))
+        if fields is not None:
+            fields = tuple(sorted(set(fields)))
+        return inputs, f"{inputs}|{distances_key(r)}|{fields}"
+
+    def get(self, key):
+        result = self._memory.get(key)
+        if result is not None:
+            return result
+
+        if self.db_path is not None:
+            with self._db() as conn:
+                row = conn.execute(
+                    "SELECT created, scalars, columns FROM impact_cache WHERE key = ?",
+                    (key,),
+                ).fetchone()
+            if row is not None and row[0] > time.time() - self.ttl:
+                result = _freeze(_load(row[1], row[2]))
+                ttl = self.ttl - (time.time() - row[0])
+                self._memory.put(key, result, _nbytes(result), ttl)
+                with self._lock:
+                    self.disk_hits += 1
+                return result
+        return None
+
+    def put(self, key, result):
+        self._memory.put(key, result, _nbytes(result))
+        if self.db_path is not None:
+            scalars, blob = _dump(result)
+            with self._db() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO impact_cache VALUES (?, ?, ?, ?)",
+                    (key, time.time(), scalars, blob),
+                )
+                conn.execute(
+                    """
+                    DELETE FROM impact_cache WHERE key NOT IN (
+                        SELECT key FROM impact_cache ORDER BY created DESC LIMIT ?
+                    )
+                    """,
+                    (self.db_rows,),
+                )
+
+    def main(self, L0, Ui, v0, T, Uj, r=None, fields=None):
+        """
+        Returns impact.main(L0, Ui, v0, T, Uj, columns=True, r=r,
+        fields=fields) on the normalized inputs, from the cache if
+        possible. The result is shared between callers and must not be
+        modified.
+        """
+
+        inputs, key = self.key(L0, Ui, v0, T, Uj, r, fields)
+        result = self.get(key)
+        if result is None:
+            result = _freeze(main(*inputs, columns=True, r=r, fields=fields))
+            self.put(key, result)
+        return result
+
+    def stats(self):
+        stats = self._memory.stats()
+        with self._lock:
+            # memory misses that the file answered are not misses
+            return {
+                **stats,
+                "disk": self.db_path is not None,
+                "disk_hits": self.disk_hits,
+                "misses": stats["misses"] - self.disk_hits,
+            }
+
+    def clear(self):
+        self._memory.clear()
@@ -0,0 +1,172 @@
+import numpy as np
+
+from impact.impact import (
+    blast_array,
+    effective_magnitude_array,
+    peak_vel_array,
+    scenario,
+    thermal_exposure_array,
+)
+
+"""
+    DAMAGE RINGS
+
+    A ring is the largest distance (km) from ground zero at which an
+    effect still reaches a threshold, e.g. how far out the overpressure
+    is at least 5 psi.
+
+    The effects decrease with distance apart from the jumps of
+    effective_magnitude at 60 km and 700 km, so each ring is found by a
+    coarse log spaced scan that brackets the outermost crossing, followed
+    by Illinois (modified regula falsi) iterations on log(r) inside that
+    bracket. Positive effects are compared in log space, where the power
+    laws of thermal exposure and overpressure are close to straight lines,
+    so this converges in a few iterations. The bracket is always kept and
+    a step that does not halve it is followed by a bisection step, so a
+    jump in the effect is still found; the jumps themselves are added to
+    the scan. All thresholds of one effect are solved together, one array
+    evaluation per iteration.
+"""
+
+PSI = 6894.757  # 1 psi in Pa
+
+# (effect, threshold, label)
+DEFAULT_RINGS = [
+    ("surface_blast", 20 * PSI, "20 psi overpressure"),
+    ("surface_blast", 5 * PSI, "5 psi overpressure"),
+    ("surface_blast", 1 * PSI, "1 psi overpressure"),
+    ("thermal_exposure", 4.2e5, "3rd degree burns"),
+    ("thermal_exposure", 2.5e5, "2nd degree burns"),
+    ("effective_magnitude", 6.0, "MMI VII-VIII"),
+]
+
+R_MIN = 1e-3  # smallest distance searched in km
+R_MAX = 20000.0  # largest distance searched in km
+SCAN_POINTS = 64
+SOLVE_ITER = 80  # most solver iterations
+XTOL = 1e-10  # a ring is solved once its bracket is this narrow in log(r)
+FTOL = 1e-12  # or once the effect is this close to its threshold
+
+
+def _blast(r, sc):
+    return blast_array(r, sc["E"], sc["zb"], sc["E_ground"], sc["E_air"])
+
+
+def _thermal(r, sc):
+    return thermal_exposure_array(sc["E"], r)
+
+
+def _magnitude(r, sc):
+    if sc["M"] is None:
+        return np.full(np.shape(r), -np.inf)
+    return effective_magnitude_array(sc["M"], r)
+
+
+def _wind(r, sc):
+    return peak_vel_array(_blast(r, sc))
+
+
+# distances (km) where an effect jumps, always part of the scan
+SCAN_BREAKS = {"effective_magnitude": (60.0, 700.0)}
+
+# effect: (function of r in km, compare in log space)
+RING_EFFECTS = {
+    "surface_blast": (_blast, True),
+    "thermal_exposure": (_thermal, True),
+    "effective_magnitude": (_magnitude, False),
+    "peak_wind_vel": (_wind, True),
+}
+
+
+def _gap(values, thresholds, log_values):
+    # >= 0 where the effect reaches the threshold
+    if not log_values:
+        return values - thresholds
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.log(values) - np.log(thresholds)
+
+
+def ring_radii(effect, thresholds, sc, r_max=R_MAX):
+    """
+    Returns the outermost distance in km at which effect >= threshold,
+    for every threshold. The distance is nan if the threshold is never
+    reached and r_max if it is still reached at r_max.
+    """
+
+    f, log_values = RING_EFFECTS[effect]
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+
+    log_grid = np.linspace(np.log(R_MIN), np.log(r_max), SCAN_POINTS)
+    breaks = [np.log(b) for b in SCAN_BREAKS.get(effect, ()) if R_MIN < b < r_max]
+    if breaks:
+        log_grid = np.unique(np.concatenate([log_grid, breaks]))
+    n_grid = len(log_grid)
+    g_grid = _gap(f(np.exp(log_grid), sc)[None, :], thresholds[:, None], log_values)
+    above = g_grid >= 0
+
+    reached = above.any(axis=1)
+    last = n_grid - 1 - np.argmax(above[:, ::-1], axis=1)
+    bracketed = reached & (last < n_grid - 1)
+
+    rows = np.arange(len(thresholds))
+    i_lo = np.where(bracketed, last, 0)
+    i_hi = np.where(bracketed, last + 1, 0)
+    lo, g_lo = log_grid[i_lo], g_grid[rows, i_lo]  # g >= 0 at lo
+    hi, g_hi = log_grid[i_hi], g_grid[rows, i_hi]  # g < 0 at hi
+    side = np.zeros(len(thresholds), dtype=np.int8)
+    stalled = np.zeros(len(thresholds), dtype=bool)
+    solved = ~bracketed
+
+    for _ in range(SOLVE_ITER):
+        solved |= hi - lo <= XTOL
+        if solved.all():
+            break
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x = hi - g_hi * (hi - lo) / (g_hi - g_lo)
+        # bisect where the secant step is unusable or the last one stalled
+        usable = np.isfinite(x) & (x > lo) & (x < hi) & ~stalled
+        x = np.where(usable, x, 0.5 * (lo + hi))
+        width = hi - lo
+        gx = _gap(f(np.exp(x), sc), thresholds, log_values)
+        ok = gx >= 0
+        solved |= ok & (gx <= FTOL)
+        lo, g_lo = np.where(ok, x, lo), np.where(ok, gx, g_lo)
+        hi, g_hi = np.where(ok, hi, x), np.where(ok, g_hi, gx)
+        # Illinois step: halve the stale end point when one side repeats
+        g_hi = np.where(ok & (side == 1), 0.5 * g_hi, g_hi)
+        g_lo = np.where(~ok & (side == -1), 0.5 * g_lo, g_lo)
+        side = np.where(ok, 1, -1)
+        stalled = usable & (hi - lo > 0.5 * width)
+
+    lo = np.exp(lo)
+    radii = np.where(bracketed, lo, np.where(reached, r_max, np.nan))
+    return radii
+
+
+def rings(L0, Ui, v0, T, Uj, thresholds=None, r_max=R_MAX):
+    """
+    Returns the scenario of an impact (see impact.scenario) and a list of
+    rings {effect, threshold, label, radius} for the given
+    (effect, threshold, label) tuples, DEFAULT_RINGS if None.
+    A radius of None means the threshold is not reached at all.
+    """
+
+    if thresholds is None:
+        thresholds = DEFAULT_RINGS
+
+    sc = scenario(L0, Ui, v0, T, Uj)
+
+    radii = [None] * len(thresholds)
+    for effect in RING_EFFECTS:
+        idx = [k for k, (e, _, _) in enumerate(thresholds) if e == effect]
+        if not idx:
+            continue
+        values = ring_radii(effect, [thresholds[k][1] for k in idx], sc, r_max)
+        for k, radius in zip(idx, values.tolist()):
+            radii[k] = None if np.isnan(radius) else radius
+
+    result = [
+        {"effect": effect, "threshold": threshold, "label": label, "radius": radius}
+        for (effect, threshold, label), radius in zip(thresholds, radii)
+    ]
+    return sc, result
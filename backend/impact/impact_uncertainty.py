@@ -0,0 +1,227 @@
+import secrets
+
+import numpy as np
+
+from impact.impact import JpkT, R_earth, joules2ktons
+from impact.impact_batch import scenario_batch
+from impact.impact_rings import DEFAULT_RINGS, R_MAX, ring_radii
+from scheduler import process_map
+
+"""
+    MONTE CARLO UNCERTAINTY
+
+    Impactor parameters that are only partly known are given as priors
+    (dicts) instead of values:
+
+        {"dist": "fixed", "value": x}
+        {"dist": "uniform", "low": a, "high": b}
+        {"dist": "normal", "mean": m, "std": s}
+        {"dist": "lognormal", "median": m, "sigma": s}    (s of ln x)
+    normal and lognormal accept optional "low"/"high" bounds; samples
+    outside them are drawn again (truncated distribution).
+
+    Samples are drawn and evaluated in chunks with scenario_batch, each
+    chunk from its own child of one SeedSequence, so results only depend
+    on the seed and the chunk size, not on how many processes run them.
+    Only the summarised quantities of each sample are kept.
+"""
+
+PARAMS = ("L0", "Ui", "v0", "T", "Uj")
+CHUNK = 50000  # samples evaluated at once
+MAX_REDRAW = 100  # redraw rounds for truncated priors
+SEED_BITS = 53  # drawn seeds stay exact as JSON (JavaScript) numbers
+
+QUANTITIES = {
+    # name: scenario key
+    "E0": "E0",
+    "E": "E",
+    "E_ground": "E_ground",
+    "E_air": "E_air",
+    "crater_diamater": "crater_diamater",
+    "crater_depth": "crater_depth",
+    "z_breakup": "z_star",
+    "zb": "zb",
+}
+
+
+def draw(prior, n, rng):
+    """
+    Returns n samples of a prior (see module notes).
+    """
+
+    dist = prior["dist"]
+    if dist == "fixed":
+        return np.full(n, float(prior["value"]))
+    if dist == "uniform":
+        return rng.uniform(prior["low"], prior["high"], n)
+
+    def sample(k):
+        if dist == "normal":
+            return rng.normal(prior["mean"], prior["std"], k)
+        if dist == "lognormal":
+            return rng.lognormal(np.log(prior["median"]), prior["sigma"], k)
+        raise ValueError(f"unknown distribution {dist}")
+
+    low = prior.get("low")
+    high = prior.get("high")
+    x = sample(n)
+    for _ in range(MAX_REDRAW):
+        bad = np.zeros(n, dtype=bool)
+        if low is not None:
+            bad |= x < low
+        if high is not None:
+            bad |= x > high
+        if not bad.any():
+            return x
+        x[bad] = sample(int(bad.sum()))
+    raise ValueError(f"could not draw {dist} samples between {low} and {high}")
+
+
+def _surface_r1(thresholds):
+    # scaled distance (m) at which surface_blast drops to each threshold:
+    # with E = 1 kT, r in km is r1 / 1000
+    one_kt = {"E": JpkT, "zb": 0.0, "E_ground": JpkT, "E_air": 0.0, "M": None}
+    return 1000 * ring_radii("surface_blast", thresholds, one_kt, r_max=1e9)
+
+
+def _wind_to_pressure(u, P0=101325, c0=343):
+    # inverse of peak_vel (Eq 18): 25x^2 - 6kx - k = 0, x = p/7P0, k = (u/c0)^2
+    k = (u / c0) ** 2
+    return 7 * P0 * (6 * k + np.sqrt(36 * k**2 + 100 * k)) / 50
+
+
+def ring_radii_batch(effect, threshold, sc, surface_r1=None, r_max=R_MAX):
+    """
+    Returns the ring radius (km) of one threshold for every row of a
+    scenario_batch result, nan where the threshold is never reached.
+
+    Unlike ring_radii this inverts the effects per row in closed form:
+    surface blast through its scaled distance (surface_r1, from
+    _surface_r1), airblast, thermal exposure and the three branches of
+    effective magnitude analytically.
+    """
+
+    E = sc["E"]
+    with np.errstate(all="ignore"):
+        if effect == "thermal_exposure":
+            r = np.sqrt(3e-3 * E / (2 * np.pi * threshold)) / 1000
+        elif effect in ("surface_blast", "peak_wind_vel"):
+            p = threshold
+            if effect == "peak_wind_vel":
+                p = _wind_to_pressure(threshold)
+            if surface_r1 is None:
+                surface_r1 = _surface_r1([p])[0]
+            zb = sc["zb"]
+            # airblast (Eq 17a-c): p0 * exp(-beta * r1) >= p
+            p0 = 3.14e11 * zb**-2.6
+            beta = 34.87 * zb**-1.73
+            air_r1 = np.where(p0 >= p, np.log(p0 / p) / beta, np.nan)
+            r1 = np.where(zb == 0, surface_r1, air_r1)
+            r = r1 * joules2ktons(E) ** (1 / 3) / 1000
+        elif effect == "effective_magnitude":
+            M = sc["M"]
+            r_far = R_earth / 1000 * 10 ** ((M - 6.399 - threshold) / 1.66)
+            r_mid = (M - threshold + 1.1644) / 0.0048
+            r_near = (M - threshold) / 0.0238
+            r = np.where(
+                r_far >= 700,
+                r_far,
+                np.where(
+                    r_mid >= 60,
+                    np.minimum(r_mid, 700),
+                    np.where(r_near >= 0, np.minimum(r_near, 60), np.nan),
+                ),
+            )
+        else:
+            raise ValueError(f"unknown effect {effect}")
+    return np.minimum(r, r_max)
+
+
+def _run_chunk(priors, n, seed_seq, rings, surface_r1):
+    rng = np.random.default_rng(seed_seq)
+    inputs = [draw(priors[name], n, rng) for name in PARAMS]
+    sc = scenario_batch(*inputs)
+
+    out = {name: sc[key].astype(np.float32) for name, key in QUANTITIES.items()}
+    out["airburst"] = sc["zb"] != 0
+    for (effect, threshold, label), r1 in zip(rings, surface_r1):
+        out[f"radius:{label}"] = ring_radii_batch(
+            effect, threshold, sc, surface_r1=r1
+        ).astype(np.float32)
+    return out
+
+
+def summarize(values, percentiles):
+    """
+    Returns {"fraction", "mean", "p<q>"...} of the finite values, where
+    fraction is the share of samples for which the value applies.
+    """
+
+    finite = values[np.isfinite(values)]
+    band = {"fraction": len(finite) / len(values) if len(values) else 0.0}
+    if len(finite) == 0:
+        band["mean"] = None
+        band.update({f"p{q:g}": None for q in percentiles})
+        return band
+    band["mean"] = float(finite.astype(np.float64).mean())
+    for q, v in zip(percentiles, np.percentile(finite, percentiles)):
+        band[f"p{q:g}"] = float(v)
+    return band
+
+
+def monte_carlo(
+    priors,
+    n=100000,
+    seed=None,
+    percentiles=(5, 50, 95),
+    rings=None,
+    chunk=CHUNK,
+    workers=1,
+):
+    """
+    Draws n impactors from priors (a dict of PARAMS to prior dicts),
+    evaluates them and returns percentile bands of QUANTITIES and of the
+    ring radii (DEFAULT_RINGS if rings is None), with the seed (a drawn
+    one if seed is None) to repeat the run with.
+
+    workers > 1 spreads the chunks over the shared process pool.
+    """
+
+    if rings is None:
+        rings = DEFAULT_RINGS
+    missing = [name for name in PARAMS if name not in priors]
+    if missing:
+        raise ValueError(f"missing priors for {', '.join(missing)}")
+
+    # surface blast scaled distances are the same for every sample
+    surface_r1 = []
+    for effect, threshold, _ in rings:
+        if effect == "surface_blast":
+            surface_r1.append(_surface_r1([threshold])[0])
+        elif effect == "peak_wind_vel":
+            surface_r1.append(_surface_r1([_wind_to_pressure(threshold)])[0])
+        else:
+            surface_r1.append(None)
+
+    if seed is None:
+        seed = secrets.randbits(SEED_BITS)
+    seed_seq = np.random.SeedSequence(seed)
+    sizes = [min(chunk, n - start) for start in range(0, n, chunk)]
+    args = [
+        (priors, size, child, rings, surface_r1)
+        for size, child in zip(sizes, seed_seq.spawn(len(sizes)))
+    ]
+
+    results = list(process_map(_run_chunk, args, workers))
+
+    merged = {key: np.concatenate([r[key] for r in results]) for key in results[0]}
+    airburst = merged.pop("airburst")
+
+    return {
+        "n": n,
+        "seed": seed,
+        "airburst_fraction": float(airburst.mean()) if n else 0.0,
+        "bands": {
+            key: summarize(values, percentiles) for key, values in merged.items()
+        },
+    }
@@ -0,0 +1,103 @@
+import math
+
+import numpy as np
+import pytest
+
+from impact.impact import (
+    EFFECT_FIELDS,
+    MMI_SCALE,
+    airblast,
+    effective_magnitude,
+    ejecta_thickness,
+    main,
+    mean_ejecta_size,
+    peak_vel,
+    r_effects_rows,
+    scaled_dist,
+    scenario,
+    surface_blast,
+    thermal_exposure,
+)
+from impact.impact_batch import scenario_batch
+
+# (L0, Ui, v0, T, Uj): intact, pancake with E_air > E_ground, pancake with
+# E_ground > E_air, airburst
+SCENARIOS = [
+    (1, 8000, 11000, 90, 2700),
+    (701.52, 2000, 18000, 87.5, 2500),
+    (100, 8000, 15000, 60, 2500),
+    (50, 3000, 20000, 45, 2700),
+]
+DISTANCES = list(range(0, 20000, 37)) + [1, 59, 60, 699, 700, 19999]
+
+
+def scalar_effects(sc, r):
+    # the per distance loop that main ran before it was vectorized
+    E, M, zb = sc["E"], sc["M"], sc["zb"]
+    effective_M = mmi = thickness = mean_size = None
+    if M is not None:
+        effective_M = effective_magnitude(M, r)
+        mmi = MMI_SCALE[min(9, math.floor(max(0.0, effective_M)))]
+    if zb == 0:
+        thickness = ejecta_thickness(sc["D_tc"], r)
+        mean_size = mean_ejecta_size(sc["crater_diamater"], r)
+    dist = scaled_dist(r, E)
+    rm1 = (550 * dist) / (1.2 * (550 - dist))
+    if (sc["E_ground"] > sc["E_air"] and dist < rm1) or zb == 0:
+        blast = surface_blast(dist)
+    else:
+        blast = airblast(dist, zb)
+    return {
+        "thermal_exposure": thermal_exposure(E, r),
+        "effective_magnitude": effective_M,
+        "effective_mmi": mmi,
+        "ejecta_thickness": thickness,
+        "mean_ejecta_size": mean_size,
+        "surface_blast": blast,
+        "peak_wind_vel": peak_vel(blast),
+    }
+
+
+@pytest.mark.parametrize("params", SCENARIOS)
+def test_main_matches_scalar_effects(params):
+    sc = scenario(*params)
+    r = np.array(DISTANCES, dtype=np.float64)
+    table = main(*params, columns=True, r=r)[9]
+
+    for i, distance in enumerate(DISTANCES):
+        expected = scalar_effects(sc, distance)
+        for key in EFFECT_FIELDS:
+            col = table[key]
+            if expected[key] is None:
+                assert col is None
+            elif key == "effective_mmi":
+                assert MMI_SCALE[col[i]] == expected[key]
+            else:
+                assert col[i] == pytest.approx(
+                    expected[key], rel=1e-12, abs=0, nan_ok=True
+                )
+
+
+def test_main_rows_match_columns():
+    params = SCENARIOS[1]
+    r = np.array(DISTANCES, dtype=np.float64)
+    table = main(*params, columns=True, r=r)[9]
+    rows = main(*params, r=r)[9]
+
+    assert list(rows) == DISTANCES
+    # r = 0 holds nan, which never compares equal
+    assert {r: row for r, row in rows.items() if r} == {
+        r: row for r, row in r_effects_rows(table).items() if r
+    }
+    assert rows[700]["effective_mmi"] == MMI_SCALE[table["effective_mmi"][-2]]
+
+
+def test_scenario_batch_matches_scenario():
+    batch = scenario_batch(*np.array(SCENARIOS, dtype=np.float64).T)
+
+    for i, params in enumerate(SCENARIOS):
+        for key, value in scenario(*params).items():
+            if value is None:
+                assert np.isnan(batch[key][i])
+            else:
+                assert batch[key][i] == pytest.approx(value, rel=1e-12, abs=1e-12)
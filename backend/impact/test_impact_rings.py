@@ -0,0 +1,34 @@
+import numpy as np
+import pytest
+
+from impact.impact import scenario
+from impact.impact_rings import PSI, R_MAX, R_MIN, RING_EFFECTS, ring_radii
+from impact.test_impact import SCENARIOS
+
+THRESHOLDS = {
+    "surface_blast": [100 * PSI, 20 * PSI, 5 * PSI, 1 * PSI, 0.1 * PSI],
+    "thermal_exposure": [1e7, 4.2e5, 2.5e5, 1e3],
+    "effective_magnitude": [8.0, 6.0, 4.0, 2.0],
+    "peak_wind_vel": [500.0, 50.0, 10.0],
+}
+SCAN = np.geomspace(R_MIN, R_MAX, 200_001)
+
+
+@pytest.mark.parametrize("params", SCENARIOS)
+@pytest.mark.parametrize("effect", RING_EFFECTS)
+def test_ring_radii_match_dense_scan(params, effect):
+    sc = scenario(*params)
+    f, _ = RING_EFFECTS[effect]
+    values = f(SCAN, sc)
+    radii = ring_radii(effect, THRESHOLDS[effect], sc)
+
+    for threshold, radius in zip(THRESHOLDS[effect], radii):
+        above = np.flatnonzero(values >= threshold)
+        if not len(above):
+            assert np.isnan(radius)
+        elif above[-1] == len(SCAN) - 1:
+            assert radius == R_MAX
+        else:
+            # the outermost crossing lies between two samples of the scan
+            last = above[-1]
+            assert SCAN[last] * (1 - 1e-9) <= radius <= SCAN[last + 1] * (1 + 1e-9)
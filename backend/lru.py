@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+"""
+    LRU CACHE
+
+    The in-memory cache shared by the result caches of the API, bounded
+    by entry count and optionally by bytes and age (TTL).
+"""
+
+
+class LRUCache:
+    """
+    Thread-safe LRU cache. max_bytes and ttl (s) are optional bounds,
+    the size of an entry is given when it is put.
+    """
+
+    def __init__(self, maxsize=256, max_bytes=None, ttl=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self._entries = OrderedDict()  # key: (expires, nbytes, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, check=None):
+        """
+        Returns the value of key, or None if it is missing, expired or
+        check(value) is false.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None or (check is not None and not check(entry[2])):
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, value, nbytes=0, ttl=None):
+        """
+        Stores value under key for ttl seconds (the cache's by default)
+        and returns it. A value larger than max_bytes is not stored.
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        expires = float("inf") if ttl is None else time.monotonic() + ttl
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return value
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (expires, nbytes, value)
+            self._bytes += nbytes
+            while len(self._entries) > self.maxsize or (
+                self.max_bytes is not None and self._bytes > self.max_bytes
+            ):
+                _, (_, evicted_bytes, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_bytes
+                self.evictions += 1
+        return value
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[1]
+
+    def stats(self):
+        with self._lock:
+            stats = {"entries": len(self._entries), "maxsize": self.maxsize}
+            if self.max_bytes is not None:
+                stats.update(bytes=self._bytes, max_bytes=self.max_bytes)
+            if self.ttl is not None:
+                stats.update(ttl=self.ttl, expirations=self.expirations)
+            return {
+                **stats,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
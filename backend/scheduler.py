@@ -0,0 +1,333 @@
+import asyncio
+import functools
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+"""
+    REQUEST SCHEDULER
+
+    Keeps CPU-bound and blocking endpoint work (propagation, SQLite, the
+    impact model) off the event loop. Handlers run on a shared thread pool
+    of `workers` threads. Only NumPy's array kernels and SQLite release
+    the GIL; Python-level work (building response rows, scalar root
+    finding loops, JSON encoding) does not, so the pool bounds blocking
+    rather than adding CPU parallelism. The largest jobs (Monte Carlo
+    chunks, deflection plans, catalog screening) fan out over one shared
+    process pool instead, see process_map.
+
+    Every endpoint belongs to a lane with a concurrency limit (requests of
+    the lane running at once) and a queue limit (requests of the lane
+    waiting for a slot). A request that finds its lane's queue full is
+    rejected right away with Saturated, which the API turns into a 503
+    with a Retry-After estimated from the lane's recent run times, so
+    latency stays bounded instead of growing with the backlog. A slot is
+    held until the pool has finished the work, even if the request was
+    cancelled (e.g. the client disconnected), since a running thread
+    cannot be stopped. Streamed responses hold one slot of their lane from
+    their first item to their last, see Scheduler.stream.
+
+    Lane limits default to LANES and can be overridden with
+    DEJA_LANES="orbit=4:32,impact=8:64" (concurrency:queue).
+
+    Endpoints scheduled with a key function are also coalesced (single
+    flight): while a request with the same key is in flight, later ones
+    do not queue but await its result, which is then shared and must not
+    be modified. The computation runs as its own task, so it finishes for
+    the waiting requests even if the first client disconnects.
+"""
+
+LANES = {
+    "orbit": (4, 32),  # /orbit, /orbit/batch, /impulse, /close-approach
+    "deflection": (2, 8),  # /impulse/preview, /impulse/optimize
+    "impact": (4, 64),  # /impact, /impact/rings
+    "impact_batch": (2, 8),  # /impact/batch, /impact/uncertainty
+    "catalog": (4, 32),  # /hazards, /asteroids
+}
+DURATION_WEIGHT = 0.2  # weight of the latest run in the mean run time
+
+_END = object()  # end of a streamed iterator
+
+# processes of the shared pool; fixed, so concurrent callers never resize it
+PROCESS_WORKERS = int(os.getenv("DEJA_PROCESS_WORKERS", os.cpu_count() or 1))
+
+_process_pool = None
+_process_lock = threading.Lock()
+
+
+class Saturated(Exception):
+    """
+    Raised when a lane's queue is full.
+    """
+
+    def __init__(self, lane, retry_after):
+        super().__init__(f"{lane} is saturated, retry after {retry_after} s")
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class Lane:
+    """
+    Concurrency and queue limits and counters of one lane.
+    """
+
+    def __init__(self, concurrency, queue):
+        self.concurrency = concurrency
+        self.queue = queue
+
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.running = 0
+        self.waiting = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.coalesced = 0  # requests that awaited an identical one in flight
+        self.duration = None  # mean run time in s
+
+    def retry_after(self):
+        # seconds until the queue has room again, at the mean run time
+        duration = self.duration if self.duration is not None else 1.0
+        return max(1, math.ceil(duration * (self.waiting + 1) / self.concurrency))
+
+    def stats(self):
+        return {
+            "concurrency": self.concurrency,
+            "queue": self.queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "coalesced": self.coalesced,
+            "duration": self.duration,
+        }
+
+
+def parse_lanes(spec):
+    """
+    Returns {lane: (concurrency, queue)} of a "name=c:q,..." string.
+    """
+
+    lanes = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, limits = item.partition("=")
+        concurrency, _, queue = limits.partition(":")
+        lanes[name.strip()] = (max(1, int(concurrency)), max(0, int(queue or 0)))
+    return lanes
+
+
+class SingleFlight:
+    """
+    Shares the result of an in-flight call with later calls of the same
+    key.
+    """
+
+    def __init__(self):
+        self._flights = {}  # key: task
+
+    def __len__(self):
+        return len(self._flights)
+
+    async def do(self, key, call, on_coalesced=None):
+        """
+        Returns the result of await call(), or of the in-flight call with
+        the same key.
+        """
+
+        task = self._flights.get(key)
+        if task is not None:
+            if on_coalesced is not None:
+                on_coalesced()
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(call())
+        self._flights[key] = task
+
+        def done(task):
+            self._flights.pop(key, None)
+            if not task.cancelled():
+                task.exception()  # retrieved, even if every caller left
+
+        task.add_done_callback(done)
+        return await asyncio.shield(task)
+
+
+class Scheduler:
+    """
+    Runs blocking calls on a thread pool, by lane; see module notes.
+    """
+
+    def __init__(self, workers=8, lanes=LANES):
+        self.workers = workers
+        self.lanes = {name: Lane(*limits) for name, limits in lanes.items()}
+        self.flights = SingleFlight()
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="deja"
+        )
+
+    def _admit(self, name):
+        # the lane, unless its queue is full
+        lane = self.lanes[name]
+        if lane.semaphore.locked() and lane.waiting >= lane.queue:
+            lane.rejected += 1
+            raise Saturated(name, lane.retry_after())
+        return lane
+
+    async def _acquire(self, lane):
+        # waits for a slot of lane, returns the time it was taken
+        lane.waiting += 1
+        try:
+            await lane.semaphore.acquire()
+        finally:
+            lane.waiting -= 1
+        lane.running += 1
+        return time.perf_counter()
+
+    def _release(self, lane, start, outcome):
+        # frees a slot taken at start; outcome is "completed", "failed" or
+        # None for cancelled work, which does not count
+        if outcome is not None:
+            setattr(lane, outcome, getattr(lane, outcome) + 1)
+            duration = time.perf_counter() - start
+            lane.duration = (
+                duration
+                if lane.duration is None
+                else (1 - DURATION_WEIGHT) * lane.duration + DURATION_WEIGHT * duration
+            )
+        lane.running -= 1
+        lane.semaphore.release()
+
+    def _when_done(self, future, callback):
+        # calls callback(future) on the event loop once the pool future is done
+        loop = asyncio.get_running_loop()
+
+        def done(future):
+            try:
+                loop.call_soon_threadsafe(callback, future)
+            except RuntimeError:
+                pass  # the loop is closed
+
+        future.add_done_callback(done)
+
+    async def run(self, lane, func, *args, **kwargs):
+        """
+        Runs func(*args, **kwargs) on the pool once lane has a free slot.
+        Raises Saturated if the lane's queue is full.
+        """
+
+        lane = self._admit(lane)
+        start = await self._acquire(lane)
+        future = self._executor.submit(func, *args, **kwargs)
+
+        def release(future):
+            if future.cancelled():
+                outcome = None
+            else:
+                outcome = "failed" if future.exception() is not None else "completed"
+            self._release(lane, start, outcome)
+
+        # the slot is released by the future, not by this call, which may
+        # be cancelled while the work still runs
+        self._when_done(future, release)
+        return await asyncio.wrap_future(future)
+
+    def stream(self, lane, iterator):
+        """
+        Returns an async iterator over the items of a blocking iterator,
+        each computed on the pool, holding one slot of lane from the first
+        item to the last. Raises Saturated if the lane's queue is full,
+        judged when called so that the response can still be a 503.
+        """
+
+        return self._stream(self._admit(lane), iter(iterator))
+
+    async def _stream(self, lane, iterator):
+        start = await self._acquire(lane)
+        future = None
+        outcome = None
+        try:
+            while True:
+                future = self._executor.submit(next, iterator, _END)
+                item = await asyncio.wrap_future(future)
+                if item is _END:
+                    outcome = "completed"
+                    return
+                yield item
+        except Exception:
+            outcome = "failed"
+            raise
+        finally:
+            if future is None or future.done():
+                self._release(lane, start, outcome)
+            else:
+                # cancelled while an item is being computed
+                self._when_done(future, lambda _: self._release(lane, start, outcome))
+
+    def scheduled(self, lane, key=None):
+        """
+        Decorates a blocking endpoint function so it runs in lane. If key
+        is given, key(*args, **kwargs) is the coalescing key of a call, or
+        None for calls that must not be coalesced.
+        """
+
+        def decorator(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                flight = None if key is None else key(*args, **kwargs)
+                if flight is None:
+                    return await self.run(lane, func, *args, **kwargs)
+
+                def coalesced():
+                    self.lanes[lane].coalesced += 1
+
+                return await self.flights.do(
+                    (lane, func.__qualname__, flight),
+                    lambda: self.run(lane, func, *args, **kwargs),
+                    coalesced,
+                )
+
+            return wrapper
+
+        return decorator
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "in_flight": len(self.flights),
+            "lanes": {name: lane.stats() for name, lane in self.lanes.items()},
+        }
+
+
+def process_pool():
+    """
+    Returns the shared process pool of PROCESS_WORKERS processes, created
+    on first use. Its processes are started by a fork server (spawned
+    where there is none), as forking the multithreaded server is unsafe.
+    """
+
+    global _process_pool
+    with _process_lock:
+        if _process_pool is None:
+            methods = multiprocessing.get_all_start_methods()
+            context = multiprocessing.get_context(
+                "forkserver" if "forkserver" in methods else "spawn"
+            )
+            _process_pool = ProcessPoolExecutor(
+                max_workers=PROCESS_WORKERS, mp_context=context
+            )
+        return _process_pool
+
+
+def process_map(func, args, workers=1):
+    """
+    Returns an iterator over func(*a) for the argument tuples args, in
+    order, computed on the shared process pool if workers > 1 and there
+    is more than one, otherwise here. func must be a module-level function.
+    """
+
+    if workers > 1 and PROCESS_WORKERS > 1 and len(args) > 1:
+        return process_pool().map(func, *zip(*args))
+    return (func(*a) for a in args)
@@ -0,0 +1,79 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+from encoding import (
+    NDJSON,
+    NPY,
+    OCTET_STREAM,
+    QUANTIZED_MAX,
+    encode_columns,
+    encode_preamble,
+    negotiate,
+    quantization,
+    quantize,
+    stream_records,
+)
+
+
+def test_negotiate():
+    assert negotiate(None) is None
+    assert negotiate("application/json") is None
+    assert negotiate("text/html, application/octet-stream; dtype=float32") == (
+        OCTET_STREAM,
+        "<f4",
+    )
+    assert negotiate("application/x-npy; dtype=int8") == (NPY, "<f8")
+    assert quantization(f"{OCTET_STREAM}; dtype=int32; scale=-1; delta=1") == {
+        "scale": 1.0,
+        "delta": True,
+    }
+
+
+@pytest.mark.parametrize("delta", [False, True])
+def test_quantize_fits_int32_at_the_extremes(delta):
+    col = np.array([-1.0, 1.0, -1.0, 0.5, 1.0]) * 2e9
+    q, scale = quantize(col, 1.0, delta)
+
+    assert q.dtype == np.dtype("<i4")
+    assert scale == pytest.approx(2e9 / QUANTIZED_MAX)
+    restored = scale * (np.cumsum(q.astype(np.int64)) if delta else q)
+    np.testing.assert_allclose(restored, col, atol=scale)
+
+
+def test_octet_stream_columns_are_aligned():
+    columns = {"x": np.arange(3, dtype=np.float64), "n": np.arange(3, dtype=np.int8)}
+    body, layout = encode_columns(columns, OCTET_STREAM, "<f4")
+
+    assert [entry["offset"] % 8 for entry in layout] == [0, 0]
+    x = np.frombuffer(body, "<f4", count=3, offset=layout[0]["offset"])
+    n = np.frombuffer(body, "<i1", count=3, offset=layout[1]["offset"])
+    np.testing.assert_array_equal(x, [0, 1, 2])
+    np.testing.assert_array_equal(n, [0, 1, 2])
+
+    body, layout = encode_columns(columns, NPY)
+    table = np.load(io.BytesIO(body))
+    np.testing.assert_array_equal(table["x"], [0, 1, 2])
+
+
+def test_preamble_precedes_the_columns():
+    preamble = encode_preamble({"ids": [1, 2]})
+    columns = {"x": np.arange(3, dtype=np.float64)}
+    body, layout = encode_columns(columns, OCTET_STREAM, offset=len(preamble))
+    data = preamble + body
+
+    assert len(preamble) % 8 == 0 and layout[0]["offset"] % 8 == 0
+    assert json.loads(data[: len(preamble)]) == {"ids": [1, 2]}
+    x = np.frombuffer(data, "<f8", count=3, offset=layout[0]["offset"])
+    np.testing.assert_array_equal(x, [0, 1, 2])
+
+    body, layout = encode_columns(columns, NPY, offset=len(preamble))
+    assert layout[0]["offset"] == len(preamble)
+    np.testing.assert_array_equal(np.load(io.BytesIO(body))["x"], [0, 1, 2])
+
+
+def test_stream_records():
+    lines = list(stream_records(iter([{"a": 1}, {"a": 2}]), NDJSON))
+    assert [json.loads(line) for line in lines] == [{"a": 1}, {"a": 2}]
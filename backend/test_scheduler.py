@@ -0,0 +1,159 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from api import saturated_handler
+from scheduler import Saturated, Scheduler, SingleFlight, parse_lanes, process_map
+
+
+async def wait_for(condition):
+    while not condition():
+        await asyncio.sleep(0.001)
+
+
+def test_parse_lanes():
+    assert parse_lanes(" orbit=2:16, impact=1 ,") == {"orbit": (2, 16), "impact": (1, 0)}
+
+
+def test_full_queue_is_rejected():
+    async def main():
+        scheduler = Scheduler(workers=4, lanes={"slow": (1, 1)})
+        lane = scheduler.lanes["slow"]
+        gate = threading.Event()
+
+        first = asyncio.create_task(scheduler.run("slow", gate.wait))
+        await wait_for(lambda: lane.running == 1)
+        second = asyncio.create_task(scheduler.run("slow", gate.wait))
+        await wait_for(lambda: lane.waiting == 1)
+
+        with pytest.raises(Saturated) as rejected:
+            await scheduler.run("slow", gate.wait)
+        assert rejected.value.retry_after >= 1
+
+        gate.set()
+        assert await asyncio.gather(first, second) == [True, True]
+        return lane.stats()
+
+    stats = asyncio.run(main())
+    assert (stats["completed"], stats["rejected"], stats["running"]) == (2, 1, 0)
+
+
+def test_cancelled_request_keeps_its_slot_until_the_work_ends():
+    async def main():
+        scheduler = Scheduler(workers=2, lanes={"slow": (1, 0)})
+        lane = scheduler.lanes["slow"]
+        gate = threading.Event()
+
+        task = asyncio.create_task(scheduler.run("slow", gate.wait))
+        await wait_for(lambda: lane.running == 1)
+        task.cancel()
+        await asyncio.sleep(0.01)
+        assert lane.running == 1
+        with pytest.raises(Saturated):
+            await scheduler.run("slow", gate.wait)
+
+        gate.set()
+        await wait_for(lambda: lane.running == 0)
+        return await scheduler.run("slow", lambda: "free")
+
+    assert asyncio.run(main()) == "free"
+
+
+def test_stream_holds_one_slot_until_its_last_item():
+    async def main():
+        scheduler = Scheduler(workers=2, lanes={"stream": (1, 0)})
+        lane = scheduler.lanes["stream"]
+        items = []
+        async for item in scheduler.stream("stream", iter(range(3))):
+            assert lane.running == 1
+            items.append(item)
+        return items, lane.stats()
+
+    items, stats = asyncio.run(main())
+    assert items == [0, 1, 2]
+    assert (stats["running"], stats["completed"]) == (0, 1)
+
+
+def test_saturated_lane_answers_503_with_retry_after():
+    scheduler = Scheduler(workers=2, lanes={"slow": (1, 0)})
+    gate = threading.Event()
+    app = FastAPI()
+    app.add_exception_handler(Saturated, saturated_handler)
+
+    @app.get("/slow")
+    @scheduler.scheduled("slow")
+    def slow():
+        gate.wait()
+        return {"done": True}
+
+    async def main():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://x") as client:
+            first = asyncio.create_task(client.get("/slow"))
+            await wait_for(lambda: scheduler.lanes["slow"].running == 1)
+            rejected = await client.get("/slow")
+            gate.set()
+            return await first, rejected
+
+    first, rejected = asyncio.run(main())
+    assert first.status_code == 200
+    assert rejected.status_code == 503
+    assert int(rejected.headers["Retry-After"]) >= 1
+
+
+def test_identical_calls_are_coalesced():
+    calls = []
+    gate = threading.Event()
+
+    def compute(x):
+        calls.append(x)
+        gate.wait()
+        return {"x": x}
+
+    async def main():
+        scheduler = Scheduler(workers=4, lanes={"orbit": (4, 4)})
+        scheduled = scheduler.scheduled("orbit", key=lambda x: x)(compute)
+        tasks = [asyncio.create_task(scheduled(x)) for x in (1, 1, 1, 2)]
+        await wait_for(lambda: len(calls) == 2)
+        gate.set()
+        results = await asyncio.gather(*tasks)
+        return results, scheduler.stats()
+
+    results, stats = asyncio.run(main())
+    assert sorted(calls) == [1, 2]
+    assert results[0] is results[1] is results[2]
+    assert results[3] == {"x": 2}
+    assert stats["lanes"]["orbit"]["coalesced"] == 2
+    assert stats["in_flight"] == 0
+
+
+def test_single_flight_shares_errors_and_survives_cancellation():
+    async def main():
+        flights = SingleFlight()
+        started = asyncio.Event()
+        release = asyncio.Event()
+
+        async def fail():
+            started.set()
+            await release.wait()
+            raise ValueError("boom")
+
+        first = asyncio.create_task(flights.do("k", fail))
+        await started.wait()
+        second = asyncio.create_task(flights.do("k", fail))
+        await asyncio.sleep(0)
+        first.cancel()
+        release.set()
+        with pytest.raises(ValueError):
+            await second
+        return len(flights)
+
+    assert asyncio.run(main()) == 0
+
+
+def test_process_map_keeps_order():
+    args = [(x, 2) for x in range(5)]
+    assert list(process_map(pow, args)) == [0, 1, 4, 9, 16]